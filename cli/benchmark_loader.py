@@ -0,0 +1,26 @@
+import click
+from fontcap_model.dataset import get_dataloaders
+from fontcap_model.utils import benchmark_loader
+
+"""
+CLI tool to compare training data loader throughput. Usage:
+python -m cli.benchmark_loader -dr "data/fonts" -bs 32
+Runs the per-item loader and the batched loader, each with and without the decoded cache
+"""
+
+@click.command()
+@click.option('--data_root', '-dr', type=click.Path(exists=True), required=True, help='Path to data')
+@click.option('--batch_size', '-bs', type=int, default=32, help='Batch size')
+@click.option('--max_batches', '-n', type=int, default=200, help='Batches to time per loader')
+@click.option('--img_size', type=int, required=False, help='Resolution to load, if the dataset has several')
+def run(data_root, batch_size, max_batches, img_size):
+    for cache in (False, True):
+        for batched in (False, True):
+            train_loader, _ = get_dataloaders(data_root, batch_size=batch_size, img_size=img_size,
+                                              cache=cache, batched=batched)
+            stats = benchmark_loader(train_loader, max_batches=max_batches)
+            click.echo(f"cache={cache!s:<5} batched={batched!s:<5} "
+                       f"{stats['samples_per_sec']:10.0f} samples/s over {stats['batches']} batches")
+
+if __name__ == "__main__":
+    run()
@@ -1,58 +1,145 @@
+import csv
+import os
 import click
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from PIL import Image
 import numpy as np
+from fontcap_scraper.utils import PackedGlyphStore, DatasetManifest
 
 """
-CLI tool to interrogate scraped fonts
+CLI tool to interrogate scraped fonts. Usage:
+python -m cli.check_dataset "data/fonts" --workers 8
+Per-font metrics are saved to a report (check_report.csv in the dataset by default). Later runs
+only recompute fonts whose directory has changed since, or in a packed store, fonts not
+at the same place in it (records are never rewritten once appended)
 """
 
+REPORT_FIELDS = ["font", "version", "status", "glyphs", "density", "sparseness", "error"]
+
 @click.command()
-@click.argument("--dataset_dir", type=click.Path(exists=True, file_okay=False,
+@click.argument("dataset_dir", type=click.Path(exists=True, file_okay=False,
                                                  dir_okay=True, path_type=Path), required=True)
-def check_dataset(dataset_dir: Path):
+@click.option('--report', type=click.Path(dir_okay=False, path_type=Path), required=False,
+              help='Per-font report, updated incrementally. .csv, or .parquet (needs pandas and pyarrow)')
+@click.option('--workers', type=int, default=None, help='Processes computing metrics, defaults to one per core')
+@click.option('--recompute', is_flag=True, help='Ignore the cached report')
+def check_dataset(dataset_dir: Path, report: Path | None, workers: int | None, recompute: bool):
     """Check dataset structure and compute per-font metrics (density, sparseness)."""
     click.echo(f"Checking dataset in: {dataset_dir}")
-    font_dirs = [p for p in dataset_dir.iterdir() if p.is_dir()]
-
-    total_fonts = len(font_dirs)
-    metrics = []
-
-    for font_dir in font_dirs:
-        png_files = list(font_dir.glob("*.png"))
-        if not png_files:
-            click.echo(f"[EMPTY] {font_dir.name}")
-            continue
-
-        density_values = []
-        sparseness_values = []
-
-        for img_path in png_files:
-            try:
-                with Image.open(img_path) as img:
-                    if img.mode != "L":
-                        raise ValueError("Image is not in grayscale (mode 'L')")
-
-                    density = compute_density(img)
-                    density_values.append(density)
-
-                    sparseness = compute_sparseness(img)
-                    sparseness_values.append(sparseness)
-
-            except Exception as e:
-                click.echo(f"[CORRUPT] {font_dir.name} ({img_path.name}): {e}")
-                break
+    report = report or dataset_dir / "check_report.csv"
+    cached = {} if recompute else load_report(report)
+
+    if PackedGlyphStore.is_packed(dataset_dir):
+        store = PackedGlyphStore(dataset_dir)
+        tasks = [(entry["name"], f"{entry['shard']}:{entry['row']}", (str(dataset_dir), font_idx))
+                 for font_idx, entry in enumerate(store.fonts)]
+        compute = packed_font_metrics
+    else:
+        # Every font directory is stat'ed, so glyphs changed outside the scraper are seen too
+        manifest = DatasetManifest.load(dataset_dir, refresh=True)
+        tasks = [(font_name, manifest.font_mtime(font_name),
+                  (font_name, [manifest.glyph_path(font_name, c) for c in sorted(chars)]))
+                 for font_name, chars in manifest.fonts.items()]
+        compute = png_font_metrics
+
+    rows = {}
+    todo = []
+    for font_name, version, args in tasks:
+        row = cached.get(font_name)
+        if row is not None and row.get("version") == str(version):
+            rows[font_name] = row
         else:
-            avg_density = np.mean(density_values)
-            avg_sparseness = np.mean(sparseness_values)
-            metrics.append((font_dir.name, avg_density, avg_sparseness))
+            todo.append((font_name, version, args))
+    click.echo(f"{len(rows)} fonts unchanged since the last report, computing {len(todo)}")
 
-            density_color = color_metric(avg_density, 0.05, 0.25) # type: ignore
-            sparse_color = color_metric(avg_sparseness, 1.5, 5.0) # type: ignore
-            density_str = click.style(f"{avg_density:.3f}", fg=density_color)
-            sparse_str = click.style(f"{avg_sparseness:.2f}", fg=sparse_color)
-            click.echo(f"[SUCCESS] {font_dir.name:<30} | density={density_str} | sparseness={sparse_str}")
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(compute, [args for _, _, args in todo], chunksize=16)
+            for (font_name, version, _), row in zip(todo, results):
+                rows[font_name] = {**row, "font": font_name, "version": str(version)}
 
+    metrics = []
+    for font_name, _, _ in tasks:
+        row = rows[font_name]
+        if row["status"] == "empty":
+            click.echo(f"[EMPTY] {font_name}")
+        elif row["status"] == "corrupt":
+            click.echo(f"[CORRUPT] {font_name}: {row['error']}")
+        else:
+            metrics.append(report_font(font_name, float(row["density"]), float(row["sparseness"])))
+    report_summary(len(tasks), metrics)
+
+    save_report(report, [rows[font_name] for font_name, _, _ in tasks])
+    click.echo(f"Report written to {report}")
+
+def png_font_metrics(args: tuple[str, list[Path]]) -> dict:
+    """Runs in a worker process. Metrics of every glyph PNG of a font, computed as one batch"""
+    font_name, png_files = args
+    if not png_files:
+        return {"status": "empty", "glyphs": 0}
+    glyphs = []
+    for img_path in png_files:
+        try:
+            with Image.open(img_path) as img:
+                if img.mode != "L":
+                    raise ValueError("Image is not in grayscale (mode 'L')")
+                glyphs.append(np.asarray(img))
+        except Exception as e:
+            return {"status": "corrupt", "glyphs": len(png_files), "error": f"{img_path.name}: {e}"}
+    return summarise_glyphs(np.stack(glyphs))
+
+_worker_stores: dict[str, PackedGlyphStore] = {}
+
+def packed_font_metrics(args: tuple[str, int]) -> dict:
+    """Runs in a worker process. Glyphs are read straight out of the shards"""
+    root, font_idx = args
+    # Opened once per worker, rather than pickling the store's index into every task
+    if root not in _worker_stores:
+        _worker_stores[root] = PackedGlyphStore(Path(root))
+    store = _worker_stores[root]
+    chars = store.present_chars(font_idx)
+    if not chars:
+        return {"status": "empty", "glyphs": 0}
+    glyphs = store.font_glyphs(font_idx)
+    return summarise_glyphs(glyphs[[store.char_index(c) for c in chars]])
+
+def summarise_glyphs(glyphs: np.ndarray) -> dict:
+    density, sparseness = glyph_metrics(glyphs)
+    return {"status": "ok", "glyphs": len(glyphs), "density": float(density.mean()), "sparseness": float(sparseness.mean())}
+
+def load_report(path: Path) -> dict[str, dict]:
+    if not path.exists():
+        return {}
+    if path.suffix == ".parquet":
+        import pandas as pd
+        rows = pd.read_parquet(path).astype(str).to_dict("records")
+    else:
+        with open(path, 'r', newline='') as f:
+            rows = list(csv.DictReader(f))
+    return {row["font"]: row for row in rows}
+
+def save_report(path: Path, rows: list[dict]):
+    tmp = path.with_name(path.name + ".tmp")
+    if path.suffix == ".parquet":
+        import pandas as pd
+        pd.DataFrame(rows, columns=REPORT_FIELDS).to_parquet(tmp, index=False)
+    else:
+        with open(tmp, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    os.replace(tmp, path)
+
+def report_font(font_name: str, avg_density: float, avg_sparseness: float) -> tuple:
+    density_color = color_metric(avg_density, 0.05, 0.25) # type: ignore
+    sparse_color = color_metric(avg_sparseness, 1.5, 5.0) # type: ignore
+    density_str = click.style(f"{avg_density:.3f}", fg=density_color)
+    sparse_str = click.style(f"{avg_sparseness:.2f}", fg=sparse_color)
+    click.echo(f"[SUCCESS] {font_name:<30} | density={density_str} | sparseness={sparse_str}")
+    return font_name, avg_density, avg_sparseness
+
+def report_summary(total_fonts: int, metrics: list[tuple]):
     click.echo("\nSummary:")
     click.echo(f"Fonts checked: {total_fonts}")
     click.echo(f"Fonts processed successfully: {len(metrics)}\n")
@@ -67,27 +154,28 @@ def color_metric(value: float, low: float, high: float) -> str:
         color = "green"
     return color
 
-def compute_density(image: Image.Image) -> float:
+def glyph_metrics(glyphs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Density and sparseness of each glyph in a (n, H, W) batch. A 3x3 box sum over the
+    zero-padded ink mask, built from shifted slices, counts each pixel's inked neighbours
+    """
+    binary = glyphs < 128  # Treat black-ish pixels as "on"
+    n, h, w = binary.shape
+    padded = np.pad(binary, ((0, 0), (1, 1), (1, 1))).astype(np.uint8)
+    box = sum(padded[:, dy:dy + h, dx:dx + w] for dy in range(3) for dx in range(3))
+    ink = binary.reshape(n, -1).sum(axis=1)
+    neighbours = (np.where(binary, box - 1, 0)).reshape(n, -1).sum(axis=1)
+    density = ink / (h * w)
+    sparseness = np.divide(neighbours, ink, out=np.zeros(n), where=ink > 0)
+    return density, sparseness
+
+def compute_density(image: Image.Image | np.ndarray) -> float:
     """Pixel density"""
-    arr = np.array(image)
-    binary = arr < 128  # Treat black-ish pixels as "on"
-    return binary.mean()
+    return float(glyph_metrics(np.asarray(image)[None])[0][0])
 
-def compute_sparseness(image: Image.Image) -> float:
+def compute_sparseness(image: Image.Image | np.ndarray) -> float:
     """Sparseness: the number of black pixels near each black pixels"""
-    arr = np.array(image)
-    binary = arr < 128
-    black_pixels = np.argwhere(binary)
-    if len(black_pixels) == 0:
-        return 0.0
-
-    padded = np.pad(binary, 1, mode='constant')
-    sparseness = 0
-    for y, x in black_pixels:
-        neighborhood = padded[y:y+3, x:x+3]
-        neighbors = np.sum(neighborhood) - 1
-        sparseness += neighbors
-    return sparseness / len(black_pixels) # type: ignore
+    return float(glyph_metrics(np.asarray(image)[None])[1][0])
 
 if __name__ == "__main__":
     check_dataset()
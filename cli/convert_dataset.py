@@ -0,0 +1,47 @@
+import click
+from pathlib import Path
+from PIL import Image
+from tqdm import tqdm
+from fontcap_scraper.config import DEFAULT_CHARSET
+from fontcap_scraper.utils import PackedGlyphStore, glyphs_to_array, is_resolution_dir
+
+"""
+CLI tool to migrate a scraped PNG tree into a packed glyph store. Usage:
+python -m cli.convert_dataset --dataset_dir "data/fonts" --output_dir "data/fonts_packed"
+Downsampled <size>px directories are separate PNG trees and are converted separately
+"""
+
+@click.command()
+@click.option('--dataset_dir', type=click.Path(exists=True, file_okay=False, path_type=Path), required=True,
+              help='PNG tree written by the scraper')
+@click.option('--output_dir', type=click.Path(file_okay=False, path_type=Path), required=True,
+              help='Where to create the packed store')
+@click.option('--fonts_per_shard', type=int, default=4096, help='Fonts per shard file')
+def convert(dataset_dir: Path, output_dir: Path, fonts_per_shard: int):
+    font_dirs = sorted(p for p in dataset_dir.iterdir() if p.is_dir() and not is_resolution_dir(p))
+    store = None
+    converted = 0
+    for font_dir in tqdm(font_dirs):
+        glyphs = {}
+        for c in DEFAULT_CHARSET:
+            path = font_dir / f"{ord(c)}.png"
+            if path.exists():
+                with Image.open(path) as img:
+                    glyphs[c] = img.convert('L')
+        if not glyphs:
+            click.echo(f"[EMPTY] {font_dir.name}")
+            continue
+
+        if store is None:
+            img_size = next(iter(glyphs.values())).size[0]
+            store = PackedGlyphStore(output_dir, DEFAULT_CHARSET, img_size, fonts_per_shard)
+        arr, missing = glyphs_to_array(glyphs, store.charset, store.img_size)
+        store.append(font_dir.name, arr, missing)
+        converted += 1
+
+    if store is not None:
+        store.close()
+    click.echo(f"Converted {converted} of {len(font_dirs)} fonts into {output_dir}")
+
+if __name__ == "__main__":
+    convert()
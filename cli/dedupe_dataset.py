@@ -0,0 +1,61 @@
+import json
+import click
+from pathlib import Path
+from PIL import Image
+from tqdm import tqdm
+from fontcap_scraper.config import DEFAULT_CHARSET
+from fontcap_scraper.utils import PackedGlyphStore, glyphs_to_array, is_resolution_dir
+from fontcap_scraper.utils import glyph_fingerprint, NearDuplicateIndex
+
+"""
+CLI tool to find perceptual near-duplicate fonts in an existing dataset. Usage:
+python -m cli.dedupe_dataset --dataset_dir "data/fonts" --output "near_duplicates.json"
+The output's "exclude" list can be passed to get_dataloaders as excluded_fonts
+"""
+
+def iter_font_glyphs(dataset_dir: Path):
+    """(font name, glyph array) for each font in a PNG tree or packed store"""
+    if PackedGlyphStore.is_packed(dataset_dir):
+        store = PackedGlyphStore(dataset_dir)
+        for font_idx, entry in enumerate(store.fonts):
+            yield entry["name"], store.font_glyphs(font_idx)
+        return
+
+    for font_dir in sorted(p for p in dataset_dir.iterdir() if p.is_dir() and not is_resolution_dir(p)):
+        glyphs = {}
+        for c in DEFAULT_CHARSET:
+            path = font_dir / f"{ord(c)}.png"
+            if path.exists():
+                with Image.open(path) as img:
+                    glyphs[c] = img.convert('L')
+        if glyphs:
+            img_size = next(iter(glyphs.values())).size[0]
+            yield font_dir.name, glyphs_to_array(glyphs, DEFAULT_CHARSET, img_size)[0]
+
+@click.command()
+@click.option('--dataset_dir', type=click.Path(exists=True, file_okay=False, path_type=Path), required=True)
+@click.option('--output', type=click.Path(dir_okay=False, path_type=Path), required=True,
+              help='JSON report of near-duplicates')
+@click.option('--threshold', type=float, default=0.03, help='Max fraction of differing fingerprint bits')
+@click.option('--save_index', type=click.Path(dir_okay=False, path_type=Path), required=False,
+              help='Also save the index, e.g. as <output_dir>/near_duplicates.npz for the scraper to extend')
+def dedupe(dataset_dir: Path, output: Path, threshold: float, save_index: Path | None):
+    index = None
+    duplicates = []
+    for font_name, glyphs in tqdm(iter_font_glyphs(dataset_dir)):
+        fingerprint = glyph_fingerprint(glyphs)
+        if index is None:
+            index = NearDuplicateIndex(len(fingerprint) * 8, threshold)
+        matches = index.query(fingerprint)
+        if matches:
+            duplicates.append({"font": font_name, "matches": matches})
+        index.add(font_name, fingerprint)
+
+    with open(output, 'w') as f:
+        json.dump({"duplicates": duplicates, "exclude": [d["font"] for d in duplicates]}, f, indent=2)
+    if save_index and index is not None:
+        index.save(save_index)
+    click.echo(f"Found {len(duplicates)} near-duplicates among {len(index) if index else 0} fonts")
+
+if __name__ == "__main__":
+    dedupe()
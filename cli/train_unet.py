@@ -2,10 +2,15 @@ import logging
 import click
 from pathlib import Path
 from fontcap_model import train_unet
+from fontcap_model.distributed import DistributedConfig, launch
+from fontcap_model.utils import resolve_loader_config
 
 """
 Click command for training the U-Net. Usage (from project root with venv):
 python -m cli.train_unet -dr "data/fonts" -ep 2 -bs 32 -lr 0.001 -chkdir "./something" -chki 1 -pi 1
+Data-parallel over 4 local processes with 8 threads each (on several machines, run this on each
+with --nnodes, its own --node_rank and the first machine's --master_addr):
+python -m cli.train_unet -dr "data/fonts" -ep 2 -bs 32 -lr 0.001 --nproc_per_node 4 --threads_per_rank 8
 """
 
 logging.basicConfig(
@@ -23,17 +28,63 @@ logging.basicConfig(
 @click.option('--checkpoint_dir', '-chkdir', type=click.Path(), required=False,
               default=Path("./checkpoints"), help='Number of training epochs')
 @click.option('--checkpoint_interval', '-chki', type=int, required=False,
-              default=20, help='Save the model parameters every x epochs')
+              default=20, help='Save a checkpoint of the training state every x epochs')
 @click.option('--plot_interval', '-pi', type=int, required=False,
               default=20, help='Save example model outputs every x epochs')
 @click.option('--start_state', '-st', type=click.Path(), required=False,
-              help='Starting parameters file (stored in checkpoints dir')
+              help='Starting parameters file, a state_dict or checkpoint (stored in checkpoints dir)')
 @click.option('--resume_loss', '-rl', is_flag=True, help='Resume loss curve')
+@click.option('--resume', is_flag=True, help='Carry on exactly from the latest checkpoint in the checkpoints dir')
+@click.option('--checkpoint_steps', type=int, required=False, help='Also save a checkpoint every x optimizer steps')
+@click.option('--keep_last', type=int, default=3, help='Number of most recent checkpoints to keep')
+@click.option('--keep_best', type=int, default=1, help='Number of checkpoints with the lowest test loss to keep')
+@click.option('--val_steps', type=int, required=False,
+              help='Validate on a subsample of the test set every x optimizer steps (default: every epoch)')
+@click.option('--val_samples', type=int, default=1024, help='Number of test pairs to validate on')
+@click.option('--patience', type=int, required=False, help='Stop after x validations without improvement')
+@click.option('--lr_patience', type=int, required=False,
+              help='Lower the learning rate after x validations without improvement')
+@click.option('--lr_factor', type=float, default=0.5, help='Factor the learning rate is lowered by')
+@click.option('--min_lr', type=float, default=0.0, help='Lowest the learning rate is lowered to')
+@click.option('--cache', is_flag=True, help='Decode the whole dataset into memory once')
+@click.option('--cache_path', type=click.Path(), required=False,
+              help='Save the decoded dataset here and reuse it in later runs (implies --cache)')
+@click.option('--batched', is_flag=True, help='Fetch whole batches from the dataset instead of single items')
+@click.option('--streaming', is_flag=True, help='Stream a packed store shard by shard (for datasets larger than RAM)')
+@click.option('--render', is_flag=True,
+              help='data_root holds font files (a font cache, directories or archives), render pairs on the fly')
+@click.option('--font_size', type=int, default=28, help='With --render: font size to render at')
+@click.option('--size_jitter', type=int, default=0, help='With --render: vary the font size by up to this much')
+@click.option('--max_offset', type=int, default=0, help='With --render: shift pairs by up to this many pixels')
+@click.option('--augment', is_flag=True, help='Augment training batches (affine jitter, stroke weight, noise)')
+@click.option('--grad_accum', type=int, default=1, help='Accumulate gradients over this many batches per step')
+@click.option('--compile', 'compile_model', is_flag=True, help='Compile the model with torch.compile')
+@click.option('--channels_last', is_flag=True, help='Use the channels_last memory format')
+@click.option('--nproc_per_node', type=int, default=0,
+              help='Train data-parallel with this many processes on this machine (DDP over gloo)')
+@click.option('--nnodes', type=int, default=1, help='Number of machines taking part in distributed training')
+@click.option('--node_rank', type=int, default=0, help="This machine's index, 0 on the --master_addr machine")
+@click.option('--master_addr', type=str, default="127.0.0.1", help='Rendezvous address of distributed training')
+@click.option('--master_port', type=int, default=29500, help='Rendezvous port of distributed training')
+@click.option('--threads_per_rank', type=int, required=False,
+              help="Intra-op threads per process (default: the machine's cores shared out)")
+@click.option('--num_workers', '-nw', type=int, default=0, help='DataLoader worker processes')
+@click.option('--autotune', is_flag=True, help='Benchmark DataLoader settings on the data first and use the fastest')
+@click.option('--loader_config', type=click.Path(dir_okay=False), required=False,
+              help='JSON DataLoader settings. Written by --autotune, otherwise read (overrides --num_workers/--batched)')
 def run(data_root, epochs, batch_size, learning_rate, checkpoint_dir, checkpoint_interval, plot_interval, start_state,
-        resume_loss, verbose):
+        resume_loss, resume, checkpoint_steps, keep_last, keep_best, val_steps,
+        val_samples, patience, lr_patience, lr_factor, min_lr, cache, cache_path, batched, streaming, render,
+        font_size, size_jitter, max_offset, augment, grad_accum, compile_model, channels_last, nproc_per_node,
+        nnodes, node_rank, master_addr, master_port, threads_per_rank, num_workers, autotune,
+        loader_config, verbose):
     if verbose:
         logging.getLogger().setLevel(logging.DEBUG)
-    train_unet(
+    render_options = dict(font_size=font_size, size_jitter=size_jitter, max_offset=max_offset) if render else None
+    config = resolve_loader_config(data_root, batch_size, autotune, loader_config,
+                                   cache=cache, cache_path=cache_path, streaming=streaming, render=render_options)
+    loader_kwargs = config.as_kwargs() if config else {"num_workers": num_workers}
+    options = dict(
         data_root=data_root,
         num_epochs=epochs,
         batch_size=batch_size,
@@ -42,7 +93,32 @@ def run(data_root, epochs, batch_size, learning_rate, checkpoint_dir, checkpoint
         checkpoint_interval=checkpoint_interval,
         plot_interval=plot_interval,
         state_dict_name=start_state,
-        resume_loss=resume_loss)
+        resume_loss=resume_loss,
+        resume=resume,
+        checkpoint_steps=checkpoint_steps,
+        keep_last=keep_last,
+        keep_best=keep_best,
+        val_steps=val_steps,
+        val_samples=val_samples,
+        patience=patience,
+        lr_patience=lr_patience,
+        lr_factor=lr_factor,
+        min_lr=min_lr,
+        cache_dataset=cache,
+        dataset_cache_path=cache_path,
+        batched_loading=batched,
+        streaming=streaming,
+        render=render_options,
+        loader_kwargs=loader_kwargs,
+        augment=augment,
+        grad_accum_steps=grad_accum,
+        compile_model=compile_model,
+        channels_last=channels_last)
+    if nproc_per_node:
+        dist_config = DistributedConfig(nproc_per_node, nnodes, node_rank, master_addr, master_port, threads_per_rank)
+        launch(train_unet, dist_config, **options)
+    else:
+        train_unet(**options)
     return
 
 
@@ -0,0 +1,59 @@
+import logging
+import click
+from pathlib import Path
+from fontcap_model.tuning import Tuner, sample_configs, summary_table
+
+"""
+Click command for a hyperparameter search over learning rate, batch size and model width,
+with weak trials stopped early by ASHA. Usage (from project root with venv):
+python -m cli.tune -m unet -dr "data/fonts" -td "./tune_unet" -n 27 --max_epochs 27 --workers 4
+Running the same command again resumes an interrupted search, or just prints its summary
+"""
+logging.basicConfig(
+    level=logging.INFO,  # or DEBUG, WARNING, etc.
+    format='[%(asctime)s] %(levelname)s: %(message)s',
+)
+
+
+def _ints(value: str) -> tuple[int, ...]:
+    return tuple(int(v) for v in value.split(","))
+
+
+@click.command()
+@click.option('--verbose', '-v', is_flag=True, help='Enable debug logging.')
+@click.option('--model', '-m', type=str, default="unet", help='Registered model to tune, e.g. unet or cnn')
+@click.option('--data_root', '-dr', type=click.Path(exists=True), required=True, help='Path to data')
+@click.option('--tune_dir', '-td', type=click.Path(), default=Path("./tune"),
+              help='Search state and one checkpoints dir per trial. Resumed if it holds a search')
+@click.option('--num_trials', '-n', type=int, default=27, help='Number of configs to try')
+@click.option('--max_epochs', type=int, default=27, help='Epochs a trial trains for if never stopped')
+@click.option('--min_epochs', type=int, default=1, help='Epochs before the first early-stopping decision')
+@click.option('--reduction_factor', type=int, default=3, help='Roughly 1 in this many trials goes past each rung')
+@click.option('--lr_min', type=float, default=1e-4, help='Lowest learning rate (sampled log-uniformly)')
+@click.option('--lr_max', type=float, default=1e-2, help='Highest learning rate')
+@click.option('--batch_sizes', type=str, default="16,32,64,128", help='Comma separated batch sizes to choose from')
+@click.option('--widths', type=str, default="16,32,64", help="Comma separated model widths (base_channels)")
+@click.option('--workers', '-w', type=int, default=2, help='Trials trained at once, each in its own process')
+@click.option('--threads_per_trial', type=int, required=False,
+              help="Intra-op threads per trial (default: the machine's cores shared out)")
+@click.option('--seed', type=int, default=0, help='Seed for sampling configs and initial weights')
+@click.option('--no_cache', is_flag=True, help="Don't decode the dataset once into <tune_dir>/dataset_cache.pt")
+@click.option('--augment', is_flag=True, help='Augment training batches (affine jitter, stroke weight, noise)')
+@click.option('--top', type=int, default=10, help='Number of best trials in the summary')
+def run(model, data_root, tune_dir, num_trials, max_epochs, min_epochs, reduction_factor, lr_min, lr_max,
+        batch_sizes, widths, workers, threads_per_trial, seed, no_cache, augment, top, verbose):
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    configs = sample_configs(num_trials, (lr_min, lr_max), _ints(batch_sizes), _ints(widths), seed)
+    train_kwargs = dict(augment=augment)
+    if not no_cache:
+        train_kwargs["dataset_cache_path"] = str(Path(tune_dir) / "dataset_cache.pt")
+    tuner = Tuner(model, data_root, tune_dir, configs, max_epochs, min_epochs, reduction_factor,
+                  workers, threads_per_trial, seed, train_kwargs)
+    trials = tuner.run()
+    click.echo(summary_table(trials, top))
+    return
+
+
+if __name__ == '__main__':
+    run()
@@ -2,16 +2,26 @@
 Top-level package for fontcap_model
 """
 
-from .dataset import FontcapDataset, EnrichedFontcapDataset, get_dataloaders
+from .dataset import FontcapDataset, EnrichedFontcapDataset, ShardedFontcapDataset, RenderedFontcapDataset
+from .dataset import get_dataloaders, collate_uint8_pairs
+from .trainer import Trainer, train_model
+from .callbacks import Callback, LossHistory, EarlyStopping
+from .checkpoints import CheckpointManager
+from .distributed import DistributedConfig, launch
+from .tuning import Tuner, ASHAScheduler, sample_configs, summary_table
 from .train_cnn_autoencoder import train_cnn_autoencoder
 from .train_unet import train_unet
 from .utils import plot_losses, display_reconstructions, extract_latents
-from .models import CNNAutoencoder, UNet
+from .models import CNNAutoencoder, UNet, MODELS, register_model, make_model
 
 __all__ = [
-    "FontcapDataset", "EnrichedFontcapDataset", "get_dataloaders",
+    "FontcapDataset", "EnrichedFontcapDataset", "ShardedFontcapDataset", "RenderedFontcapDataset",
+    "get_dataloaders", "collate_uint8_pairs",
+    "Trainer", "train_model", "Callback", "LossHistory", "EarlyStopping", "CheckpointManager",
+    "DistributedConfig", "launch",
+    "Tuner", "ASHAScheduler", "sample_configs", "summary_table",
     "train_cnn_autoencoder",
     "train_unet",
     "plot_losses", "display_reconstructions", "extract_latents",
-    "CNNAutoencoder", "UNet"
+    "CNNAutoencoder", "UNet", "MODELS", "register_model", "make_model"
 ]
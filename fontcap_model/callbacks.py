@@ -0,0 +1,223 @@
+import logging
+import json
+from pathlib import Path
+import torch
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+from fontcap_model.utils import PlotWriter, loss_curve_figure, reconstructions_figure
+
+logger = logging.getLogger(__name__)
+
+"""
+Hooks run by the Trainer around its epochs and steps
+"""
+
+
+class Callback:
+    """Hooks called by the Trainer. Subclasses override the ones they need"""
+
+    def on_train_start(self, trainer: "Trainer"):
+        pass
+
+    def on_epoch_start(self, trainer: "Trainer", epoch: int):
+        pass
+
+    def on_step_end(self, trainer: "Trainer", step: int):
+        """After each optimizer step, with the global step number"""
+        pass
+
+    def on_epoch_end(self, trainer: "Trainer", epoch: int):
+        pass
+
+    def on_train_end(self, trainer: "Trainer"):
+        pass
+
+    def state_dict(self) -> dict:
+        """State to keep in the Trainer's checkpoints, for callbacks that need it to resume"""
+        return {}
+
+    def load_state_dict(self, state: dict):
+        pass
+
+
+class LossHistory(Callback):
+    """
+    Keeps the loss curves in <checkpoint_dir>/{train,test}_losses.json, optionally resuming
+    them, and every plot_interval epochs saves them along with the loss plot and example
+    reconstructions. The figures are rendered by a PlotWriter in the background. The
+    examples are the first num_images pairs of one test batch, fetched once at the start
+    and kept, so each plot only costs a forward pass over them on the training thread
+    """
+
+    def __init__(self, checkpoint_dir: Path, plot_interval: int = 1, resume: bool = False, num_images: int = 8):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.plot_interval = plot_interval
+        self.resume = resume
+        self.num_images = num_images
+        self.train_loss_path = self.checkpoint_dir / "train_losses.json"
+        self.test_loss_path = self.checkpoint_dir / "test_losses.json"
+        self.writer = PlotWriter()
+        self._examples: tuple[torch.Tensor, torch.Tensor] | None = None
+
+    def _example_batch(self, trainer: "Trainer") -> tuple[torch.Tensor, torch.Tensor] | None:
+        if self._examples is None and trainer.test_loader is not None:
+            # Starting the loader draws from the RNG, which would throw a resumed run off course
+            with torch.random.fork_rng(devices=[]):
+                batch = next(iter(trainer.test_loader), None)
+            if batch is not None:
+                self._examples = trainer.to_device((batch[0][:self.num_images], batch[1][:self.num_images]))
+        return self._examples
+
+    def on_train_start(self, trainer: "Trainer"):
+        if trainer.train_losses:
+            return  # Restored from a checkpoint
+        if self.resume and self.train_loss_path.exists() and self.test_loss_path.exists():
+            with open(self.train_loss_path, "r") as f:
+                trainer.train_losses = json.load(f)
+            with open(self.test_loss_path, "r") as f:
+                trainer.test_losses = json.load(f)
+            logger.info(f"Resumed loss history (train: {len(trainer.train_losses)}, test: {len(trainer.test_losses)})")
+        else:
+            logger.info(f"Did not resume loss history")
+
+    def on_epoch_end(self, trainer: "Trainer", epoch: int):
+        if epoch % self.plot_interval:
+            return
+        with open(self.train_loss_path, "w") as f:
+            json.dump(trainer.train_losses, f)
+        with open(self.test_loss_path, "w") as f:
+            json.dump(trainer.test_losses, f)
+        self.writer.submit(loss_curve_figure, list(trainer.train_losses), list(trainer.test_losses),
+                           path=self.checkpoint_dir / "loss_curve.png")
+        examples = self._example_batch(trainer)
+        if examples is not None:
+            inputs, targets = examples
+            trainer.model.eval()
+            with torch.inference_mode():
+                outputs = trainer.eval_forward(inputs)
+            images = [t.float().cpu().squeeze(1).numpy() for t in (inputs, outputs, targets)]
+            self.writer.submit(reconstructions_figure, *images, path=self.checkpoint_dir / f"recon_epoch{epoch}.png")
+
+    def on_train_end(self, trainer: "Trainer"):
+        self.writer.close()
+
+
+class EarlyStopping(Callback):
+    """
+    Validates every val_steps optimizer steps (at the end of every epoch if None) on a fixed
+    subsample of up to val_samples test pairs, taken from the test loader once and kept on the
+    device, so validating often stays cheap. A validation improves on the best so far if it is
+    lower by more than min_delta. Then the state is saved as the best checkpoint if checkpoints
+    (a CheckpointManager) is given. With lr_patience, the learning rate is multiplied by lr_factor
+    (down to min_lr) after that many validations without improvement, and with patience,
+    training stops after that many. When distributed, every rank needs one, each validating on
+    its own share of the test set; the losses are averaged over ranks, so they all stop together
+    """
+
+    def __init__(
+            self,
+            val_steps: int | None = None,
+            val_samples: int = 1024,
+            patience: int | None = None,  # Validations without improvement before stopping
+            lr_patience: int | None = None,  # Validations without improvement before lowering the learning rate
+            lr_factor: float = 0.5,
+            min_lr: float = 0.0,
+            min_delta: float = 0.0,
+            checkpoints: "CheckpointManager | None" = None):
+        self.val_steps = val_steps
+        self.val_samples = val_samples
+        for name, value in (("patience", patience), ("lr_patience", lr_patience)):
+            if value is not None and value < 1:
+                raise ValueError(f"{name} must be at least 1, got {value}")
+        self.patience = patience
+        self.lr_patience = lr_patience
+        self.lr_factor = lr_factor
+        self.min_lr = min_lr
+        self.min_delta = min_delta
+        self.checkpoints = checkpoints
+        self.best_loss = float("inf")
+        self.best_step = 0
+        self.bad_validations = 0
+        self.stopped = False
+        self.val_losses: list[tuple[int, float]] = []  # (global step, loss)
+        self.scheduler: ReduceLROnPlateau | None = None
+        self._scheduler_state: dict | None = None
+        self._batches: list[tuple[torch.Tensor, torch.Tensor]] = []
+
+    def _cache_subsample(self, trainer: "Trainer"):
+        samples = 0
+        with torch.random.fork_rng(devices=[]):  # Leaves training's random draws as they would be without it
+            for batch in trainer.test_loader:  # type: ignore
+                lower, upper = trainer.to_device(batch)
+                take = min(lower.size(0), self.val_samples - samples)
+                self._batches.append((lower[:take], upper[:take]))
+                samples += take
+                if samples >= self.val_samples:
+                    break
+        logger.info(f"Validating on {samples} test pairs every "
+                    + (f"{self.val_steps} steps" if self.val_steps else "epoch"))
+
+    def on_train_start(self, trainer: "Trainer"):
+        if trainer.test_loader is None:
+            logger.warning("No test loader to validate on, early stopping is off")
+            return
+        if not self._batches:
+            self._cache_subsample(trainer)
+        if self.lr_patience is not None and self.scheduler is None:
+            # ReduceLROnPlateau acts after more than its patience bad validations, patience after as many
+            self.scheduler = ReduceLROnPlateau(trainer.optimizer, factor=self.lr_factor,
+                                               patience=self.lr_patience - 1, threshold=self.min_delta,
+                                               threshold_mode="abs", min_lr=self.min_lr)
+            if self._scheduler_state is not None:
+                self.scheduler.load_state_dict(self._scheduler_state)
+        trainer.stop_training = self.stopped
+
+    def on_step_end(self, trainer: "Trainer", step: int):
+        if self.val_steps and not step % self.val_steps:
+            self.validate(trainer)
+            trainer.model.train()
+
+    def on_epoch_end(self, trainer: "Trainer", epoch: int):
+        if not self.val_steps:
+            self.validate(trainer)
+
+    def validate(self, trainer: "Trainer"):
+        if not self._batches:
+            return
+        loss = trainer.evaluate(self._batches)
+        self.val_losses.append((trainer.global_step, loss))
+        if loss < self.best_loss - self.min_delta:
+            self.best_loss, self.best_step = loss, trainer.global_step
+            self.bad_validations = 0
+            if self.checkpoints is not None:
+                self.checkpoints.save_best(trainer, loss)
+        else:
+            self.bad_validations += 1
+        if self.scheduler is not None:
+            learning_rate = trainer.learning_rate
+            self.scheduler.step(loss)
+            if trainer.learning_rate != learning_rate:
+                logger.info(f"Validation loss has plateaued, learning rate lowered to {trainer.learning_rate:.3g}")
+        logger.debug(f"[Step {trainer.global_step}] Val Loss: {loss:.4f} | Best: {self.best_loss:.4f}")
+        if self.patience is not None and self.bad_validations >= self.patience:
+            logger.info(f"Stopping early: no improvement in {self.bad_validations} validations, best val loss "
+                        f"{self.best_loss:.4f} at step {self.best_step}")
+            self.stopped = trainer.stop_training = True
+
+    def state_dict(self) -> dict:
+        return {
+            "best_loss": self.best_loss,
+            "best_step": self.best_step,
+            "bad_validations": self.bad_validations,
+            "stopped": self.stopped,
+            "val_losses": [list(v) for v in self.val_losses],
+            "scheduler": self.scheduler.state_dict() if self.scheduler is not None else None,
+        }
+
+    def load_state_dict(self, state: dict):
+        self.best_loss = state["best_loss"]
+        self.best_step = state["best_step"]
+        self.bad_validations = state["bad_validations"]
+        self.stopped = state["stopped"]
+        self.val_losses = [(int(step), float(loss)) for step, loss in state["val_losses"]]
+        # The scheduler is made in on_train_start, which comes after loading a checkpoint
+        self._scheduler_state = state["scheduler"]
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import queue
+import threading
+import torch
+from pathlib import Path
+from fontcap_model.callbacks import Callback
+from fontcap_model.distributed import is_main_process
+
+logger = logging.getLogger(__name__)
+
+"""
+Full training state checkpoints, written off the training thread
+"""
+
+INDEX_FILE = "checkpoints.json"
+BEST_FILE = "best.pt"
+
+
+def _to_cpu(obj):
+    """Copy of a (nested) state with every tensor cloned to the CPU"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: _to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+
+class CheckpointManager(Callback):
+    """
+    Saves Trainer.state_dict() (model, optimizer, losses, RNG states and the position in the
+    epoch) to <checkpoint_dir>/checkpoint_e<epoch>_s<step>.pt every every_epochs epochs, and
+    every every_steps optimizer steps if set. The training thread only copies the state to
+    the CPU; a background thread writes it to a temporary file and renames it into place, so
+    a crash never leaves a half-written checkpoint. Afterwards, checkpoints other than the
+    keep_last most recent and the keep_best with the lowest test loss are deleted. A checkpoint
+    that fails to write is raised on the training thread by the next save or close.
+    save_best writes <checkpoint_dir>/best.pt instead, replacing the previous one, for callbacks
+    that track a metric of their own (see EarlyStopping).
+    The checkpoints are listed in <checkpoint_dir>/checkpoints.json, which load reads to
+    resume from the latest one. When distributed, the manager should run on every rank, as
+    the state gathers every rank's RNG state (see Trainer), but only rank 0 writes
+    """
+
+    def __init__(
+            self,
+            checkpoint_dir: Path,
+            every_epochs: int = 1,
+            every_steps: int | None = None,
+            keep_last: int = 3,
+            keep_best: int = 1):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.checkpoint_dir.mkdir(exist_ok=True, parents=True)
+        self.every_epochs = every_epochs
+        self.every_steps = every_steps
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.index_path = self.checkpoint_dir / INDEX_FILE
+        self.entries: list[dict] = []
+        self.best_entry: dict | None = None  # Written by save_best
+        if self.index_path.exists():
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            self.entries = index["checkpoints"]
+            self.best_entry = index.get("best")
+        self._lock = threading.Lock()
+        # Bounded, so a slow disk holds training up instead of piling up copies of the state
+        self._queue: queue.Queue = queue.Queue(maxsize=2)
+        self._thread: threading.Thread | None = None
+        self._error: Exception | None = None  # From the writer thread, raised by the next save or close
+
+    def on_step_end(self, trainer: "Trainer", step: int):
+        if self.every_steps and not step % self.every_steps:
+            self.save(trainer)
+
+    def on_epoch_end(self, trainer: "Trainer", epoch: int):
+        if not epoch % self.every_epochs:
+            self.save(trainer, trainer.test_losses[-1] if trainer.test_losses else None)
+
+    def on_train_end(self, trainer: "Trainer"):
+        self.close()
+
+    def save(self, trainer: "Trainer", metric: float | None = None, best: bool = False):
+        """Queue a checkpoint of the trainer's current state, as best.pt if best"""
+        state = _to_cpu(trainer.state_dict())
+        if not is_main_process():
+            return
+        self._raise_error()
+        if trainer.epoch_step:
+            entry = {"epoch": trainer.epoch + 1, "epoch_step": trainer.epoch_step}
+        else:
+            entry = {"epoch": trainer.epoch, "epoch_step": 0}
+        entry.update(file=BEST_FILE if best else f"checkpoint_e{entry['epoch']:04d}_s{trainer.global_step:08d}.pt",
+                     global_step=trainer.global_step, metric=metric)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+            self._thread.start()
+        self._queue.put((entry, state))
+
+    def save_best(self, trainer: "Trainer", metric: float):
+        self.save(trainer, metric, best=True)
+
+    def close(self):
+        """Wait for queued checkpoints to be written"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        while (item := self._queue.get()) is not None:
+            # Keep draining after a failure, so save never blocks on a full queue
+            if self._error is not None:
+                continue
+            entry, state = item
+            path = self.checkpoint_dir / entry["file"]
+            try:
+                self._write(path, state)
+                with self._lock:
+                    if entry["file"] == BEST_FILE:
+                        self.best_entry = entry
+                    else:
+                        self.entries = [e for e in self.entries if e["file"] != entry["file"]] + [entry]
+                        self._prune()
+                    self._write_index()
+            except Exception as e:
+                logger.error(f"Could not write checkpoint {path}: {e}")
+                self._error = e
+                continue
+            logger.debug(f"Saved checkpoint {path}")
+
+    @staticmethod
+    def _write(path: Path, state: dict):
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            torch.save(state, tmp)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _prune(self):
+        keep = {e["file"] for e in self.entries[-self.keep_last:]} if self.keep_last else set()
+        scored = sorted((e for e in self.entries if e["metric"] is not None), key=lambda e: e["metric"])
+        keep.update(e["file"] for e in scored[:self.keep_best])
+        for entry in self.entries:
+            if entry["file"] not in keep:
+                (self.checkpoint_dir / entry["file"]).unlink(missing_ok=True)
+        self.entries = [e for e in self.entries if e["file"] in keep]
+
+    def _write_index(self):
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump({"checkpoints": self.entries, "best": self.best_entry}, f, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def latest(self) -> Path | None:
+        with self._lock:
+            return self.checkpoint_dir / self.entries[-1]["file"] if self.entries else None
+
+    def best(self) -> Path | None:
+        """best.pt if save_best was used, otherwise the kept checkpoint with the lowest test loss"""
+        with self._lock:
+            if self.best_entry is not None:
+                return self.checkpoint_dir / self.best_entry["file"]
+            scored = [e for e in self.entries if e["metric"] is not None]
+            return self.checkpoint_dir / min(scored, key=lambda e: e["metric"])["file"] if scored else None
+
+    def load(self, trainer: "Trainer", path: Path | None = None) -> bool:
+        """Restore the trainer from a checkpoint, the latest by default. False if there is none"""
+        path = path or self.latest()
+        if path is None or not Path(path).exists():
+            return False
+        trainer.load_state_dict(torch.load(path, map_location="cpu", weights_only=True))
+        if trainer.epoch_step:
+            position = f"epoch {trainer.epoch + 1}, step {trainer.epoch_step}"
+        else:
+            position = f"end of epoch {trainer.epoch}"
+        logger.info(f"Resumed from {path} ({position})")
+        return True
@@ -1,93 +1,575 @@
+import copy
+import hashlib
+import json
+import logging
+import random
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import torch
-from torch.utils.data import Dataset, DataLoader, random_split
+from torch.utils.data import Dataset, IterableDataset, DataLoader, Subset, random_split, get_worker_info
+from torch.utils.data import Sampler, BatchSampler
 from PIL import Image
 import numpy as np
 import io
 import base64
+from fontcap_scraper.utils.glyph_store import PackedGlyphStore, resolution_dir, META_FILE, INDEX_FILE
+from fontcap_scraper.utils.manifest import DatasetManifest
+from fontcap_scraper.utils.font_cache import FontCache
+from fontcap_scraper.utils.rendering import load_font, render_with_font
+from fontcap_scraper.sources.local import LocalFontSource
+
+logger = logging.getLogger(__name__)
 
 CHARSET = "abcdefghijklmnopqrstuvwxyz"
 
 
+def _resolution_root(data_root: Path, img_size: int | None) -> Path:
+    """Glyphs downsampled by the scraper sit in <size>px subdirectories. None means the base resolution"""
+    if img_size is not None and resolution_dir(data_root, img_size).is_dir():
+        return resolution_dir(data_root, img_size)
+    return data_root
+
+
+def _open_store(data_root: Path, img_size: int | None = None) -> PackedGlyphStore | None:
+    """The packed glyph store at data_root, or None if it is a PNG tree"""
+    if not PackedGlyphStore.is_packed(data_root):
+        return None
+    store = PackedGlyphStore(data_root)
+    if img_size is not None and store.img_size != img_size:
+        raise ValueError(f"No {img_size}px glyphs under {data_root} (store is {store.img_size}px)")
+    return store
+
+
+def _packed_pairs(store: PackedGlyphStore, excluded_fonts: list[str]):
+    """(font index, lowercase index, uppercase index, font name, char) for every pair in a packed store"""
+    for font_idx, entry in enumerate(store.fonts):
+        if entry["name"] in excluded_fonts:
+            continue
+        present = set(store.present_chars(font_idx))
+        for c in CHARSET:
+            if c.lower() in present and c.upper() in present:
+                yield font_idx, store.char_index(c.lower()), store.char_index(c.upper()), entry["name"], c
+
+
+def _png_pairs(manifest: DatasetManifest, excluded_fonts: list[str]):
+    """(lowercase path, uppercase path, font name, char) for every pair in a PNG tree, from its manifest"""
+    excluded = set(excluded_fonts)
+    for font_name, chars in manifest.fonts.items():
+        if font_name in excluded:
+            continue
+        for c in CHARSET:
+            if c.lower() in chars and c.upper() in chars:
+                yield manifest.glyph_path(font_name, c.lower()), manifest.glyph_path(font_name, c.upper()), font_name, c
+
+
+def _load_gray(path: Path) -> np.ndarray:
+    with Image.open(path) as img:
+        return np.asarray(img.convert('L'))
+
+
+def _is_batch_index(idx) -> bool:
+    return isinstance(idx, (list, tuple, np.ndarray, torch.Tensor)) and np.ndim(idx) == 1
+
+
+def _packed_batch(store: PackedGlyphStore, font_idx, lower_idx, upper_idx) -> np.ndarray:
+    """(batch, 2, S, S) uint8 lower/upper pairs, fancy-indexed out of each shard in one go"""
+    font_idx, lower_idx, upper_idx = (np.asarray(a, dtype=np.int64) for a in (font_idx, lower_idx, upper_idx))
+    shards = np.array([store.fonts[i]["shard"] for i in font_idx], dtype=np.int64)
+    rows = np.array([store.fonts[i]["row"] for i in font_idx], dtype=np.int64)
+    out = np.empty((len(font_idx), 2, store.img_size, store.img_size), dtype=np.uint8)
+    for shard in np.unique(shards):
+        sel = shards == shard
+        glyphs = store.shard(int(shard))
+        out[sel, 0] = glyphs[rows[sel], lower_idx[sel]]
+        out[sel, 1] = glyphs[rows[sel], upper_idx[sel]]
+    return out
+
+
+def _split_pairs(pairs: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """Normalised (batch, 1, S, S) lower and upper tensors from a (batch, 2, S, S) uint8 tensor"""
+    pairs = pairs.float().div_(255.0)
+    return pairs[:, 0:1], pairs[:, 1:2]
+
+
+def collate_uint8_pairs(batch: list[tuple[torch.Tensor, torch.Tensor]]) -> tuple[torch.Tensor, torch.Tensor]:
+    """Collate for cached datasets: stacks uint8 pairs and normalises the whole batch at once"""
+    lower = torch.stack([item[0] for item in batch]).float().div_(255.0)
+    upper = torch.stack([item[1] for item in batch]).float().div_(255.0)
+    return lower, upper
+
+
 class FontcapDataset(Dataset):
-    """Dataset wrapper for scraped fonts"""
+    """
+    Dataset wrapper for scraped fonts.
+    With cache=True every pair is decoded once into a single (pairs, 2, S, S) uint8 tensor, and
+    items are uint8 slices of it, to be normalised per batch with collate_uint8_pairs. With a
+    cache_path the tensor is saved there and reused while the dataset's pairs are unchanged
+    """
 
-    def __init__(self, data_root: Path, excluded_fonts: list[str]):
-        self.data_root = Path(data_root)
+    def __init__(
+            self,
+            data_root: Path,
+            excluded_fonts: list[str],
+            img_size: int | None = None,
+            cache: bool = False,
+            cache_path: Path | None = None):
+        self.data_root = _resolution_root(Path(data_root), img_size)
         self.excluded_fonts = excluded_fonts
+        self.store = _open_store(self.data_root, img_size)
+        self.manifest = DatasetManifest.load(self.data_root) if self.store is None else None
         self.pairs = self._collect_pairs()
+        self.glyphs: torch.Tensor | None = None
+        if cache or cache_path:
+            self.glyphs = self._load_cache(Path(cache_path) if cache_path else None)
 
-    def _collect_pairs(self):
-        pairs = []
-        for font_dir in self.data_root.iterdir():
-            if not font_dir.is_dir() or font_dir.name in self.excluded_fonts:
-                continue
+    def _cache_key(self) -> str:
+        """
+        Identifies the pairs and the files they are read from, so a saved cache is only reused
+        for the same dataset, and not after re-scraping over it in place: the sizes and mtimes
+        of a packed store's files, or for a PNG tree the manifest's font directory mtimes and
+        scraper journal signature, rather than a stat of every glyph file
+        """
+        digest = hashlib.sha256(str(self.data_root.resolve()).encode())
+        for pair in self.pairs:
+            digest.update(repr(tuple(str(p) for p in pair)).encode())
+        if self.manifest is not None:
+            digest.update(json.dumps(self.manifest.signature, sort_keys=True).encode())
+            for font_name in self.manifest.fonts:
+                digest.update(f"{font_name}:{self.manifest.font_mtime(font_name)}".encode())
+            return digest.hexdigest()
+        files = [self.data_root / META_FILE, self.data_root / INDEX_FILE, *sorted(self.data_root.glob("shard_*.bin"))]
+        for path in files:
+            stat = path.stat()
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def _load_cache(self, cache_path: Path | None) -> torch.Tensor:
+        key = self._cache_key()
+        if cache_path is not None and cache_path.exists():
+            saved = torch.load(cache_path, weights_only=True)
+            if saved["key"] == key:
+                logger.info(f"Loaded {len(self.pairs)} cached pairs from {cache_path}")
+                return saved["glyphs"]
+            logger.info(f"Dataset has changed since {cache_path} was written, rebuilding it")
 
-            for c in CHARSET:
-                upper_path = font_dir / f"{ord(c.upper())}.png"
-                lower_path = font_dir / f"{ord(c.lower())}.png"
-                if upper_path.exists() and lower_path.exists():
-                    pairs.append((lower_path, upper_path))
+        glyphs = self._decode_all()
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_path.with_name(cache_path.name + ".tmp")
+            torch.save({"key": key, "glyphs": glyphs}, tmp)
+            tmp.replace(cache_path)
+            logger.info(f"Saved {len(self.pairs)} decoded pairs to {cache_path}")
+        return glyphs
 
-        return pairs
+    def _decode_all(self) -> torch.Tensor:
+        """Every pair as one contiguous (pairs, 2, S, S) uint8 tensor"""
+        if self.store is not None:
+            return torch.from_numpy(_packed_batch(self.store, *zip(*self.pairs)))
+
+        if not self.pairs:
+            return torch.empty((0, 2, 0, 0), dtype=torch.uint8)
+        size = _load_gray(self.pairs[0][0]).shape[0]
+        out = np.empty((len(self.pairs), 2, size, size), dtype=np.uint8)
+        # PIL releases the GIL while decoding, so threads keep several cores busy
+        with ThreadPoolExecutor() as pool:
+            paths = (path for pair in self.pairs for path in pair)
+            for i, arr in enumerate(pool.map(_load_gray, paths, chunksize=256)):
+                out[i // 2, i % 2] = arr
+        return torch.from_numpy(out)
+
+    def _collect_pairs(self):
+        if self.store is not None:
+            return [pair[:3] for pair in _packed_pairs(self.store, self.excluded_fonts)]
+        return [pair[:2] for pair in _png_pairs(self.manifest, self.excluded_fonts)]  # type: ignore
 
     def __len__(self):
         return len(self.pairs)
 
     def __getitem__(self, idx):
         """Pulls images from data directory. unsqueezes them into (1, 32, 32) tensors"""
-        lower_path, upper_path = self.pairs[idx]
-        lower_img = Image.open(lower_path).convert('L')
-        upper_img = Image.open(upper_path).convert('L')
-        # Normalize pixel value
-        lower_arr = np.array(lower_img, dtype=np.float32) / 255.0
-        upper_arr = np.array(upper_img, dtype=np.float32) / 255.0
+        if _is_batch_index(idx):
+            return self.get_batch(idx)
+        if self.glyphs is not None:
+            # Still uint8, see collate_uint8_pairs
+            pair = self.glyphs[idx]
+            return pair[0:1], pair[1:2]
+        if self.store is not None:
+            font_idx, lower_idx, upper_idx = self.pairs[idx]
+            glyphs = self.store.font_glyphs(font_idx)
+            lower_arr = glyphs[lower_idx].astype(np.float32) / 255.0
+            upper_arr = glyphs[upper_idx].astype(np.float32) / 255.0
+        else:
+            lower_path, upper_path = self.pairs[idx]
+            lower_img = Image.open(lower_path).convert('L')
+            upper_img = Image.open(upper_path).convert('L')
+            # Normalize pixel value
+            lower_arr = np.array(lower_img, dtype=np.float32) / 255.0
+            upper_arr = np.array(upper_img, dtype=np.float32) / 255.0
         lower_tensor = torch.from_numpy(lower_arr).unsqueeze(0)
         upper_tensor = torch.from_numpy(upper_arr).unsqueeze(0)
 
         return lower_tensor, upper_tensor
 
+    def get_batch(self, indices) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        A whole batch in one call: normalised (batch, 1, S, S) lower and upper tensors, as the
+        default collate would have built them from single items
+        """
+        if self.glyphs is not None:
+            return _split_pairs(self.glyphs[torch.as_tensor(indices, dtype=torch.long)])
+        pairs = [self.pairs[i] for i in indices]
+        if self.store is not None:
+            return _split_pairs(torch.from_numpy(_packed_batch(self.store, *zip(*pairs))))
+        return _split_pairs(torch.from_numpy(np.stack([[_load_gray(lower), _load_gray(upper)] for lower, upper in pairs])))
+
 
 class EnrichedFontcapDataset(Dataset):
-    """Dataset wrapper for scraped fonts"""
+    """
+    Dataset wrapper for scraped fonts, for analysis. Items are (lower, upper, font id,
+    char id, pair id). Ids map back with font_name/char, and thumbnail(pair id) gives the
+    lowercase glyph as a base64 PNG, encoded on first use and cached by (font, char)
+    """
 
-    def __init__(self, data_root: Path, excluded_fonts: list[str]):
-        self.data_root = Path(data_root)
-        self.excluded_fonts = excluded_fonts
+    def __init__(self, data_root: Path, excluded_fonts: list[str] | None = None, img_size: int | None = None):
+        self.data_root = _resolution_root(Path(data_root), img_size)
+        self.excluded_fonts = excluded_fonts or []
+        self.store = _open_store(self.data_root, img_size)
         self.pairs = self._collect_pairs()
+        self.font_names = sorted({pair[-2] for pair in self.pairs})
+        self._font_ids = {name: i for i, name in enumerate(self.font_names)}
+        self._char_ids = {c: i for i, c in enumerate(CHARSET)}
+        self._thumbnails: dict[tuple[str, str], str] = {}
 
     def _collect_pairs(self):
-        pairs = []
-        for font_dir in self.data_root.iterdir():
-            if not font_dir.is_dir() or font_dir.name in self.excluded_fonts:
-                continue
-
-            font_name = font_dir.name
-            for c in CHARSET:
-                upper_path = font_dir / f"{ord(c.upper())}.png"
-                lower_path = font_dir / f"{ord(c.lower())}.png"
-                if upper_path.exists() and lower_path.exists():
-                    pairs.append((lower_path, upper_path, font_name, c))
-        return pairs
+        if self.store is not None:
+            return list(_packed_pairs(self.store, self.excluded_fonts))
+        return list(_png_pairs(DatasetManifest.load(self.data_root), self.excluded_fonts))
 
     def __len__(self):
         return len(self.pairs)
 
+    def font_name(self, font_id: int) -> str:
+        return self.font_names[font_id]
+
+    @staticmethod
+    def char(char_id: int) -> str:
+        return CHARSET[char_id]
+
+    def pair_labels(self, pair_id: int) -> tuple[str, str]:
+        """(font name, char) of a pair"""
+        return self.pairs[pair_id][-2], self.pairs[pair_id][-1]
+
+    def thumbnail(self, pair_id: int) -> str:
+        """Base64 PNG of a pair's lowercase glyph"""
+        key = self.pair_labels(pair_id)
+        if key not in self._thumbnails:
+            pair = self.pairs[pair_id]
+            if self.store is not None:
+                buf = io.BytesIO()
+                Image.fromarray(np.array(self.store.font_glyphs(pair[0])[pair[1]])).save(buf, format='PNG')
+                png = buf.getvalue()
+            else:
+                png = Path(pair[0]).read_bytes()  # Already a PNG
+            self._thumbnails[key] = base64.b64encode(png).decode('utf-8')
+        return self._thumbnails[key]
+
     def __getitem__(self, idx):
-        def pil_to_base64(pil_img):
-            buf = io.BytesIO()
-            pil_img.save(buf, format='PNG')
-            byte_im = buf.getvalue()
-            return base64.b64encode(byte_im).decode('utf-8')
-
-        lower_path, upper_path, font_name, char = self.pairs[idx]
-        lower_img = Image.open(lower_path).convert('L')
-        upper_img = Image.open(upper_path).convert('L')
-        lower_arr = np.array(lower_img, dtype=np.float32) / 255.0
-        upper_arr = np.array(upper_img, dtype=np.float32) / 255.0
+        if _is_batch_index(idx):
+            return self.get_batch(idx)
+        if self.store is not None:
+            font_idx, lower_idx, upper_idx, font_name, char = self.pairs[idx]
+            glyphs = self.store.font_glyphs(font_idx)
+            lower_arr = glyphs[lower_idx].astype(np.float32) / 255.0
+            upper_arr = glyphs[upper_idx].astype(np.float32) / 255.0
+        else:
+            lower_path, upper_path, font_name, char = self.pairs[idx]
+            lower_arr = _load_gray(lower_path).astype(np.float32) / 255.0
+            upper_arr = _load_gray(upper_path).astype(np.float32) / 255.0
         lower_tensor = torch.from_numpy(lower_arr).unsqueeze(0)
         upper_tensor = torch.from_numpy(upper_arr).unsqueeze(0)
-        return lower_tensor, upper_tensor, font_name, char, pil_to_base64(lower_img.copy())
+        return lower_tensor, upper_tensor, self._font_ids[font_name], self._char_ids[char], idx
+
+    def get_batch(self, indices):
+        """A whole batch in one call, laid out as the default collate would lay out single items"""
+        pairs = [self.pairs[i] for i in indices]
+        if self.store is not None:
+            font_idx, lower_idx, upper_idx, font_names, chars = zip(*pairs)
+            glyphs = _packed_batch(self.store, font_idx, lower_idx, upper_idx)
+        else:
+            lower_paths, upper_paths, font_names, chars = zip(*pairs)
+            glyphs = np.stack([[_load_gray(lower), _load_gray(upper)] for lower, upper in zip(lower_paths, upper_paths)])
+        lower, upper = _split_pairs(torch.from_numpy(glyphs))
+        font_ids = torch.tensor([self._font_ids[name] for name in font_names])
+        char_ids = torch.tensor([self._char_ids[c] for c in chars])
+        return lower, upper, font_ids, char_ids, torch.as_tensor(indices, dtype=torch.long)
+
+
+class RenderedFontcapDataset(Dataset):
+    """
+    Renders pairs straight from font files, so changing img_size, font_size or the charset
+    needs no re-scrape. font_root is a FontCache directory (as filled by the scraper) or
+    any files/directories/archives the local font source can read. Each font is rendered
+    once up front at font_size to index its usable letters (both cases inked); fonts that
+    can't be rendered and letters a font lacks have no items. Items render just their two
+    glyphs, from fonts loaded once per font size, of which the last cache_size are kept
+    (per DataLoader worker). size_jitter and max_offset randomise the font size and shift
+    the pair by up to that many pixels, the same for both glyphs, as augmentation;
+    without_augmentation gives a copy without them, e.g. for validation. The augmentation
+    of an item is drawn from (seed, epoch, index), so it doesn't depend on which worker
+    renders it or what it rendered before. Call set_epoch each epoch to vary it
+    """
+
+    def __init__(
+            self,
+            font_root: Path | list[Path],
+            excluded_fonts: list[str] | None = None,
+            img_size: int = 32,
+            font_size: int = 28,
+            cache_size: int = 512,
+            size_jitter: int = 0,
+            max_offset: int = 0,
+            seed: int = 0):
+        self.img_size = img_size
+        self.font_size = font_size
+        self.cache_size = cache_size
+        self.size_jitter = size_jitter
+        self.max_offset = max_offset
+        self.seed = seed
+        self.epoch = 0
+        excluded = set(excluded_fonts or [])
+
+        roots = [Path(font_root)] if isinstance(font_root, (str, Path)) else [Path(p) for p in font_root]
+        self.cache = None
+        self.source = None
+        if len(roots) == 1 and (roots[0] / "urls").is_dir():
+            self.cache = FontCache(roots[0])
+            # Several URLs can point at the same file
+            fonts = {record["sha256"]: record["name"] or record["sha256"][:12] for record in self.cache.records()}
+            self.fonts = sorted(((name, digest) for digest, name in fonts.items() if name not in excluded))
+        else:
+            self.source = LocalFontSource(roots)
+            self.fonts = [(m.name, m) for m in self.source.fetch_font_list() if m.name not in excluded]
+        self.items = self._index()  # (font, letter) rows
+        if self.source is not None:
+            self.source.close()  # Forked DataLoader workers would otherwise share the open archives
+        self._reset_caches()
+
+    def _index(self) -> np.ndarray:
+        charset = list(CHARSET) + list(CHARSET.upper())
+        items = []
+        for font_i in range(len(self.fonts)):
+            font_bytes = self._read(font_i)
+            font = load_font(font_bytes, self.font_size) if font_bytes else None
+            glyphs = render_with_font(font, charset, self.img_size) if font is not None else None
+            if glyphs is None:
+                continue
+            inked = (glyphs < 255).any(axis=(1, 2))
+            items.extend((font_i, char_i) for char_i in np.flatnonzero(inked[:len(CHARSET)] & inked[len(CHARSET):]))
+        logger.info(f"Indexed {len(items)} pairs in {len(self.fonts)} fonts "
+                    f"({len(self.fonts) * len(CHARSET) - len(items)} missing or unrenderable)")
+        return np.array(items, dtype=np.int64).reshape(-1, 2)
+
+    def _reset_caches(self):
+        self._bytes: OrderedDict[int, bytes | None] = OrderedDict()
+        self._fonts: OrderedDict[tuple[int, int], object] = OrderedDict()
+
+    def __getstate__(self):
+        # Loaded fonts don't pickle, and each DataLoader worker fills its own caches anyway
+        state = self.__dict__.copy()
+        state["_bytes"], state["_fonts"] = OrderedDict(), OrderedDict()
+        return state
+
+    def without_augmentation(self) -> "RenderedFontcapDataset":
+        """A copy sharing the index, without size jitter or offsets"""
+        dataset = copy.copy(self)
+        dataset.size_jitter = dataset.max_offset = 0
+        dataset._reset_caches()
+        return dataset
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def augmented(self) -> bool:
+        return bool(self.size_jitter or self.max_offset)
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _read(self, font_i: int) -> bytes | None:
+        _, ref = self.fonts[font_i]
+        return self.cache.read(ref) if self.cache is not None else self.source.read_font(ref)  # type: ignore
+
+    @staticmethod
+    def _cached(cache: OrderedDict, key, make, cache_size: int):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        value = cache[key] = make()
+        if len(cache) > cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def _font(self, font_i: int, font_size: int):
+        def load():
+            font_bytes = self._cached(self._bytes, font_i, lambda: self._read(font_i), self.cache_size)
+            return load_font(font_bytes, font_size) if font_bytes else None
+        return self._cached(self._fonts, (font_i, font_size), load, self.cache_size)
+
+    def _render_pair(self, font_i: int, char_i: int, font_size: int) -> np.ndarray | None:
+        font = self._font(font_i, font_size)
+        glyphs = render_with_font(font, [CHARSET[char_i], CHARSET[char_i].upper()], self.img_size) if font else None
+        return glyphs if glyphs is not None and (glyphs < 255).any(axis=(1, 2)).all() else None
+
+    def _shift(self, glyph: np.ndarray, dx: int, dy: int) -> np.ndarray:
+        out = np.full_like(glyph, 255)
+        size = self.img_size
+        out[max(0, dy):size + min(0, dy), max(0, dx):size + min(0, dx)] = \
+            glyph[max(0, -dy):size + min(0, -dy), max(0, -dx):size + min(0, -dx)]
+        return out
+
+    def __getitem__(self, idx):
+        font_i, char_i = (int(v) for v in self.items[idx])
+        rng = random.Random(f"{self.seed}/{self.epoch}/{idx}")
+        font_size = self.font_size
+        if self.size_jitter:
+            font_size += rng.randint(-self.size_jitter, self.size_jitter)
+
+        glyphs = self._render_pair(font_i, char_i, font_size)
+        if glyphs is None and font_size != self.font_size:
+            glyphs = self._render_pair(font_i, char_i, self.font_size)  # Indexed at this size, so it renders
+        if glyphs is None:
+            raise RuntimeError(f"Could not render '{CHARSET[char_i]}' of {self.fonts[font_i][0]}")
+        lower, upper = glyphs[0], glyphs[1]
+
+        if self.max_offset:
+            dx, dy = rng.randint(-self.max_offset, self.max_offset), rng.randint(-self.max_offset, self.max_offset)
+            lower, upper = self._shift(lower, dx, dy), self._shift(upper, dx, dy)
+        lower_tensor = torch.from_numpy(lower.astype(np.float32) / 255.0).unsqueeze(0)
+        upper_tensor = torch.from_numpy(upper.astype(np.float32) / 255.0).unsqueeze(0)
+        return lower_tensor, upper_tensor
+
+
+def _in_val_split(font_name: str, val_ratio: float) -> bool:
+    """Deterministic per-font split, so every pair of a font lands on the same side"""
+    return int(hashlib.sha1(font_name.encode()).hexdigest()[:8], 16) / 0x100000000 < val_ratio
+
+
+class ShardedFontcapDataset(IterableDataset):
+    """
+    Streams pairs out of one or more packed glyph stores (e.g. several weights or corpora)
+    without holding them in memory or reading them at random. Each epoch the shards are
+    shuffled, and every DataLoader worker gets its own contiguous range of rows in each, so
+    a store of one large shard still keeps them all busy. A worker reads its ranges front to
+    back, one font record at a time, through a shuffle buffer of shuffle_buffer pairs.
+    split="train"/"val" keeps a fixed fraction val_ratio of fonts, chosen by name hash, for
+    validation. Call set_epoch each epoch to reshuffle. Items are (lower, upper), plus
+    (font name, char) with with_names=True
+    """
+
+    def __init__(
+            self,
+            data_roots: Path | list[Path],
+            excluded_fonts: list[str] | None = None,
+            img_size: int | None = None,
+            split: str | None = None,
+            val_ratio: float = 0.2,
+            shuffle: bool = True,
+            shuffle_buffer: int = 4096,
+            seed: int = 42,
+            with_names: bool = False):
+        if split not in (None, "train", "val"):
+            raise ValueError(f"Unknown split '{split}'")
+        roots = [data_roots] if isinstance(data_roots, (str, Path)) else data_roots
+        self.stores = []
+        for root in roots:
+            store = _open_store(_resolution_root(Path(root), img_size), img_size)
+            if store is None:
+                raise ValueError(f"{root} is not a packed glyph store. Convert it with cli.convert_dataset")
+            self.stores.append(store)
+        if len({store.img_size for store in self.stores}) > 1:
+            raise ValueError("All stores must hold the same image size")
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.with_names = with_names
+        self.epoch = 0
+
+        # (store, shard) -> [(row, font name, [(lower idx, upper idx, char), ...]), ...] in row order
+        excluded = set(excluded_fonts or [])
+        self.shards: dict[tuple[int, int], list] = {}
+        self.num_pairs = 0
+        for store_idx, store in enumerate(self.stores):
+            fonts = {}
+            for font_idx, lower_idx, upper_idx, font_name, c in _packed_pairs(store, excluded):
+                if split is not None and _in_val_split(font_name, val_ratio) != (split == "val"):
+                    continue
+                fonts.setdefault(font_idx, []).append((lower_idx, upper_idx, c))
+                self.num_pairs += 1
+            for font_idx, pairs in fonts.items():
+                entry = store.fonts[font_idx]
+                self.shards.setdefault((store_idx, entry["shard"]), []).append((entry["row"], entry["name"], pairs))
+
+    def __len__(self):
+        return self.num_pairs
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _worker_shards(self) -> tuple[list[tuple[int, int, slice]], int]:
+        """This worker's shards for the epoch, each with the range of its fonts to read, and its worker id"""
+        shards = sorted(self.shards)
+        if self.shuffle:
+            # Same seed in every worker, so they agree on the order before taking their share
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        worker = get_worker_info()
+        if worker is None:
+            return [(store_idx, shard, slice(None)) for store_idx, shard in shards], 0
+        ranges = []
+        for store_idx, shard in shards:
+            num_fonts = len(self.shards[(store_idx, shard)])
+            start = num_fonts * worker.id // worker.num_workers
+            stop = num_fonts * (worker.id + 1) // worker.num_workers
+            if start < stop:
+                ranges.append((store_idx, shard, slice(start, stop)))
+        return ranges, worker.id
+
+    def _records(self, shards: list[tuple[int, int, slice]]):
+        for store_idx, shard, fonts in shards:
+            glyphs = self.stores[store_idx].shard(shard)
+            for row, font_name, pairs in self.shards[(store_idx, shard)][fonts]:
+                font = np.array(glyphs[row])  # One sequential read per font
+                for lower_idx, upper_idx, c in pairs:
+                    yield font[lower_idx], font[upper_idx], font_name, c
+
+    def _item(self, record):
+        lower, upper, font_name, c = record
+        lower_tensor = torch.from_numpy(lower.astype(np.float32) / 255.0).unsqueeze(0)
+        upper_tensor = torch.from_numpy(upper.astype(np.float32) / 255.0).unsqueeze(0)
+        if self.with_names:
+            return lower_tensor, upper_tensor, font_name, c
+        return lower_tensor, upper_tensor
+
+    def __iter__(self):
+        shards, worker_id = self._worker_shards()
+        if not self.shuffle:
+            for record in self._records(shards):
+                yield self._item(record)
+            return
+
+        rng = random.Random(f"{self.seed}/{self.epoch}/{worker_id}")
+        buffer = []
+        for record in self._records(shards):
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(record)
+                continue
+            i = rng.randrange(len(buffer))
+            buffer[i], record = record, buffer[i]
+            yield self._item(record)
+        rng.shuffle(buffer)
+        for record in buffer:
+            yield self._item(record)
 
 
 def get_dataloaders(
@@ -96,18 +578,159 @@ def get_dataloaders(
         batch_size: int = 32,
         shuffle: bool = True,
         seed: int = 42,
-        excluded_fonts: list[str] | None = None
+        excluded_fonts: list[str] | None = None,
+        img_size: int | None = None,
+        cache: bool = False,
+        cache_path: str | Path | None = None,
+        batched: bool = False,
+        streaming: bool = False,
+        num_workers: int = 0,
+        pin_memory: bool = False,
+        prefetch_factor: int | None = None,
+        persistent_workers: bool = False,
+        render: dict | None = None,
+        num_replicas: int = 1,
+        rank: int = 0
 ) -> tuple[DataLoader, DataLoader]:
+    """
+    Train and validation loaders over FontcapDataset. cache/cache_path enable its decoded
+    uint8 cache, which is normalised per batch in the loaders. With batched=True the loaders
+    sample whole batches of indices and fetch each with one get_batch call, instead of
+    fetching and collating items one by one.
+    With streaming=True, a packed store is instead streamed shard by shard through
+    ShardedFontcapDataset, split by font with val fraction 1 - train_ratio.
+    With render (a dict of RenderedFontcapDataset options, possibly empty), data_root holds
+    font files instead, which are rendered on the fly at img_size (32 if unset), with its
+    size jitter and offsets only applied to the train split.
+    For distributed training, each of num_replicas ranks loads its own share of both splits.
+    The remaining arguments are passed on to the DataLoaders, see make_loader
+    """
     if not excluded_fonts:
         excluded_fonts = []
     if type(data_root) is str:
         data_root = Path(data_root)
-    dataset = FontcapDataset(data_root, excluded_fonts=excluded_fonts)  # type: ignore
+    loader_kwargs = dict(batch_size=batch_size, shuffle=shuffle, batched=batched, num_workers=num_workers,
+                         pin_memory=pin_memory, prefetch_factor=prefetch_factor, persistent_workers=persistent_workers,
+                         seed=seed, num_replicas=num_replicas, rank=rank)
+    if streaming:
+        loaders = []
+        for split in ("train", "val"):
+            dataset = ShardedFontcapDataset(data_root, excluded_fonts, img_size, split=split,  # type: ignore
+                                            val_ratio=1 - train_ratio, shuffle=shuffle, seed=seed)
+            loaders.append(make_loader(dataset, **loader_kwargs))
+        return loaders[0], loaders[1]
+
+    val_dataset = None
+    if render is not None:
+        dataset = RenderedFontcapDataset(data_root, excluded_fonts, img_size=img_size or 32,  # type: ignore
+                                         **{"seed": seed, **render})
+        val_dataset = dataset.without_augmentation()  # So the test loss is measured on fixed pairs
+        loader_kwargs["batched"] = False  # Items are rendered one at a time anyway
+    else:
+        dataset = FontcapDataset(data_root, excluded_fonts=excluded_fonts, img_size=img_size,  # type: ignore
+                                 cache=cache, cache_path=cache_path)  # type: ignore
     total_size = len(dataset)
     train_size = int(train_ratio * total_size)
     val_size = total_size - train_size
-    torch.manual_seed(seed)
-    train_set, val_set = random_split(dataset, [train_size, val_size])
-    train_loader = DataLoader(train_set, batch_size=batch_size, shuffle=shuffle)
-    val_loader = DataLoader(val_set, batch_size=batch_size, shuffle=shuffle)
-    return train_loader, val_loader
+    # A generator of its own, so the split doesn't reseed the global RNG (e.g. per rank, see distributed)
+    train_set, val_set = random_split(dataset, [train_size, val_size], generator=torch.Generator().manual_seed(seed))
+    if val_dataset is not None:
+        val_set = Subset(val_dataset, val_set.indices)
+    return make_loader(train_set, **loader_kwargs), make_loader(val_set, **loader_kwargs)
+
+
+class ResumableSampler(Sampler[int]):
+    """
+    Indices of a map-style dataset in an order fixed by (seed, epoch): a seeded permutation
+    when shuffling, otherwise sequential. set_epoch chooses the epoch, and start skips the first
+    samples of it, so a run stopped partway through an epoch can carry on exactly where it
+    was. Without set_epoch calls, each pass uses the next epoch's order.
+    For distributed training, rank takes every num_replicas-th index of the order, which is
+    padded by wrapping around so every rank gets the same number (as DistributedSampler does)
+    """
+
+    def __init__(self, data_source, shuffle: bool = True, seed: int = 0, num_replicas: int = 1, rank: int = 0):
+        self.data_source = data_source
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.start = 0
+
+    def _num_samples(self) -> int:
+        return -(-len(self.data_source) // self.num_replicas)
+
+    def set_epoch(self, epoch: int, start: int = 0):
+        self.epoch = epoch
+        self.start = start
+
+    def __len__(self):
+        return self._num_samples() - self.start
+
+    def __iter__(self):
+        n = len(self.data_source)
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed * 1_000_003 + self.epoch)
+            order = torch.randperm(n, generator=generator).tolist()
+        else:
+            order = list(range(n))
+        if self.num_replicas > 1:
+            total = self._num_samples() * self.num_replicas
+            order = (order * (total // max(n, 1) + 1))[:total][self.rank::self.num_replicas]
+        start = self.start
+        # Only the pass straight after resuming is partial
+        self.epoch += 1
+        self.start = 0
+        return iter(order[start:])
+
+
+def follows_epoch(dataset: Dataset) -> bool:
+    """
+    Whether a dataset's items change with set_epoch: the streaming dataset's order, and
+    rendered pairs with augmentation. Persistent workers keep the copy they started with
+    """
+    base = getattr(dataset, "dataset", dataset)  # Through random_split's Subset
+    return isinstance(base, IterableDataset) or getattr(base, "augmented", False)
+
+
+def make_loader(
+        dataset: Dataset,
+        batch_size: int = 32,
+        shuffle: bool = True,
+        batched: bool = False,
+        num_workers: int = 0,
+        pin_memory: bool = False,
+        prefetch_factor: int | None = None,
+        persistent_workers: bool = False,
+        seed: int = 0,
+        num_replicas: int = 1,
+        rank: int = 0) -> DataLoader:
+    """
+    DataLoader over any of the datasets here, or a Subset of one. batched=True samples
+    whole batches of indices and fetches each with one dataset[list of indices] call, with
+    batch_size=None turning off per-item collation. Map-style datasets are sampled by a
+    ResumableSampler with this seed, sharded between num_replicas ranks for distributed
+    training. Streaming datasets shuffle themselves. The loader draws its workers' seeds from
+    a generator of its own, seeded with seed, so setting up an epoch's batches leaves the global
+    RNG alone (see Trainer.state_dict). Datasets that follow set_epoch can't have persistent
+    workers: their copies of the dataset would not see it (see follows_epoch)
+    """
+    kwargs = dict(num_workers=num_workers, pin_memory=pin_memory, generator=torch.Generator().manual_seed(seed))
+    if num_workers:
+        # DataLoader rejects these without workers
+        kwargs.update(prefetch_factor=prefetch_factor, persistent_workers=persistent_workers)
+    if num_workers and persistent_workers and follows_epoch(dataset):
+        raise ValueError("Datasets that follow set_epoch can't use persistent workers, which would miss it")
+    if isinstance(dataset, IterableDataset):
+        if num_replicas > 1:
+            raise ValueError("Streaming datasets can't be sharded for distributed training")
+        return DataLoader(dataset, batch_size=batch_size, **kwargs)  # type: ignore
+    sampler = ResumableSampler(dataset, shuffle, seed, num_replicas, rank)
+    if batched:
+        return DataLoader(dataset, sampler=BatchSampler(sampler, batch_size, drop_last=False), batch_size=None,
+                          **kwargs)  # type: ignore
+    base = getattr(dataset, "dataset", dataset)  # Through random_split's Subset
+    collate_fn = collate_uint8_pairs if getattr(base, "glyphs", None) is not None else None
+    return DataLoader(dataset, batch_size=batch_size, sampler=sampler, collate_fn=collate_fn, **kwargs)  # type: ignore
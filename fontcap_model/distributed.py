@@ -0,0 +1,103 @@
+import logging
+import os
+from dataclasses import dataclass
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+logger = logging.getLogger(__name__)
+
+"""
+Data-parallel training over several processes, on one machine or several, with
+DistributedDataParallel and the gloo backend (CPU)
+"""
+
+
+@dataclass
+class DistributedConfig:
+    nproc_per_node: int = 1  # Ranks started on this machine
+    nnodes: int = 1  # Machines taking part
+    node_rank: int = 0  # This machine's index, 0 on the one at master_addr
+    master_addr: str = "127.0.0.1"  # Rendezvous address, reachable from every machine
+    master_port: int = 29500
+    threads_per_rank: int | None = None  # Intra-op threads per rank. Default: this machine's cores shared out
+    backend: str = "gloo"
+
+    @property
+    def world_size(self) -> int:
+        return self.nproc_per_node * self.nnodes
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    """Whether this process should log, plot and save, i.e. rank 0 or not distributed"""
+    return get_rank() == 0
+
+
+def all_reduce_sum(tensor: torch.Tensor) -> torch.Tensor:
+    """Sum of a tensor over all ranks (in place), or the tensor itself when not distributed"""
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def all_gather_object(obj) -> list:
+    """obj from every rank, in rank order, or [obj] when not distributed"""
+    if not is_distributed():
+        return [obj]
+    gathered = [None] * get_world_size()
+    dist.all_gather_object(gathered, obj)
+    return gathered
+
+
+def _setup_rank(rank: int, threads: int):
+    torch.set_num_threads(threads)
+    # Ranks start from the same default seed, so would draw the same augmentations
+    torch.manual_seed(torch.initial_seed() + rank)
+    if rank:
+        logging.getLogger().setLevel(logging.WARNING)
+
+
+def _run_rank(local_rank: int, config: DistributedConfig, fn, kwargs: dict):
+    rank = config.node_rank * config.nproc_per_node + local_rank
+    threads = config.threads_per_rank or max(1, (os.cpu_count() or 1) // config.nproc_per_node)
+    _setup_rank(rank, threads)
+    dist.init_process_group(config.backend, init_method=f"tcp://{config.master_addr}:{config.master_port}",
+                            rank=rank, world_size=config.world_size)
+    logger.info(f"Rank {rank}/{config.world_size} started with {threads} threads")
+    try:
+        fn(**kwargs)
+    finally:
+        dist.destroy_process_group()
+
+
+def launch(fn, config: DistributedConfig, **kwargs):
+    """
+    Run fn(**kwargs) in config.nproc_per_node processes on this machine, each one rank of a
+    process group of config.world_size ranks. Every machine runs the same launch with its own
+    node_rank. Inside fn, the training code picks the process group up by itself: each rank
+    trains on its share of the data and gradients are averaged across ranks every step.
+    If this process was started by torchrun (RANK and WORLD_SIZE are set), fn runs here as
+    the rank torchrun assigned instead
+    """
+    if "RANK" in os.environ and "WORLD_SIZE" in os.environ:
+        _setup_rank(int(os.environ["RANK"]), config.threads_per_rank or torch.get_num_threads())
+        dist.init_process_group(config.backend)
+        try:
+            return fn(**kwargs)
+        finally:
+            dist.destroy_process_group()
+    logger.info(f"Starting {config.nproc_per_node} ranks on node {config.node_rank} of {config.nnodes} "
+                f"(rendezvous at {config.master_addr}:{config.master_port})")
+    mp.spawn(_run_rank, args=(config, fn, kwargs), nprocs=config.nproc_per_node, join=True)
@@ -1,4 +1,5 @@
+from .registry import MODELS, register_model, make_model
 from .cnn_autoencoder import CNNAutoencoder
 from .u_net import UNet
 
-__all__ = ["CNNAutoencoder", "UNet"]
+__all__ = ["MODELS", "register_model", "make_model", "CNNAutoencoder", "UNet"]
@@ -1,27 +1,30 @@
 import torch.nn as nn
 from torch.nn import Module
+from fontcap_model.models.registry import register_model
 
-# TODO: add parameterisation to this mode
+@register_model("cnn")
 class CNNAutoencoder(Module):
     """
-    Simple convolutional autoencoder model
+    Simple convolutional autoencoder model. base_channels is the width of the first
+    layer, doubled at each layer down
     """
-    def __init__(self):
+    def __init__(self, base_channels: int = 32):
         super().__init__()
+        c = base_channels
         self.encoder = nn.Sequential(
-            nn.Conv2d(1, 32, kernel_size=3, stride=2, padding=1),   # 32x16x16
+            nn.Conv2d(1, c, kernel_size=3, stride=2, padding=1),          # cx16x16
             nn.ReLU(True),
-            nn.Conv2d(32, 64, kernel_size=3, stride=2, padding=1),  # 64x8x8
+            nn.Conv2d(c, 2 * c, kernel_size=3, stride=2, padding=1),      # 2cx8x8
             nn.ReLU(True),
-            nn.Conv2d(64, 128, kernel_size=3, stride=2, padding=1), # 128x4x4
+            nn.Conv2d(2 * c, 4 * c, kernel_size=3, stride=2, padding=1),  # 4cx4x4
             nn.ReLU(True)
         )
         self.decoder = nn.Sequential(
-            nn.ConvTranspose2d(128, 64, kernel_size=3, stride=2, padding=1, output_padding=1),  # 64x8x8
+            nn.ConvTranspose2d(4 * c, 2 * c, kernel_size=3, stride=2, padding=1, output_padding=1),  # 2cx8x8
             nn.ReLU(True),
-            nn.ConvTranspose2d(64, 32, kernel_size=3, stride=2, padding=1, output_padding=1),   # 32x16x16
+            nn.ConvTranspose2d(2 * c, c, kernel_size=3, stride=2, padding=1, output_padding=1),      # cx16x16
             nn.ReLU(True),
-            nn.ConvTranspose2d(32, 1, kernel_size=3, stride=2, padding=1, output_padding=1),    # 1x32x32
+            nn.ConvTranspose2d(c, 1, kernel_size=3, stride=2, padding=1, output_padding=1),          # 1x32x32
             nn.Sigmoid()
         )
 
@@ -0,0 +1,19 @@
+from torch.nn import Module
+
+"""
+Registry of trainable models, so training code and CLIs can refer to them by name
+"""
+
+MODELS: dict[str, type[Module]] = {}
+
+def register_model(name: str):
+    """Class decorator making a model available to the Trainer under this name"""
+    def register(cls: type[Module]) -> type[Module]:
+        MODELS[name] = cls
+        return cls
+    return register
+
+def make_model(name: str, **kwargs) -> Module:
+    if name not in MODELS:
+        raise NotImplementedError(f"Model '{name}' not implemented")
+    return MODELS[name](**kwargs)
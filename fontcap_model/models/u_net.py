@@ -1,14 +1,16 @@
 import torch
 import torch.nn as nn
+from fontcap_model.models.registry import register_model
 
 
 
-# TODO: parameterise this
+@register_model("unet")
 class UNet(nn.Module):
-    """Implementation of a U-net"""
+    """Implementation of a U-net. base_channels is the width of the first level, doubled at each level down"""
 
-    def __init__(self):
+    def __init__(self, base_channels: int = 64):
         super().__init__()
+        c = base_channels
 
         def conv_block(in_c, out_c):
             return nn.Sequential(
@@ -24,29 +26,29 @@ class UNet(nn.Module):
                 nn.ReLU(True)
             )
 
-        self.enc1 = conv_block(1, 64)
+        self.enc1 = conv_block(1, c)
         self.pool1 = nn.MaxPool2d(2)
-        self.enc2 = conv_block(64, 128)
+        self.enc2 = conv_block(c, 2 * c)
         self.pool2 = nn.MaxPool2d(2)
 
-        self.bottleneck = conv_block(128, 256)
+        self.bottleneck = conv_block(2 * c, 4 * c)
 
-        self.up2 = conv_transpose_block(256, 128)
-        self.dec2 = conv_block(256, 128)
-        self.up1 = conv_transpose_block(128, 64)
-        self.dec1 = conv_block(128, 64)
+        self.up2 = conv_transpose_block(4 * c, 2 * c)
+        self.dec2 = conv_block(4 * c, 2 * c)
+        self.up1 = conv_transpose_block(2 * c, c)
+        self.dec1 = conv_block(2 * c, c)
 
-        self.out = nn.Conv2d(64, 1, kernel_size=1)
+        self.out = nn.Conv2d(c, 1, kernel_size=1)
 
     def forward(self, x):
-        encoded1 = self.enc1(x)  # 64x32x32
-        encoded2 = self.enc2(self.pool1(encoded1))  # 128x16x16
+        encoded1 = self.enc1(x)  # cx32x32
+        encoded2 = self.enc2(self.pool1(encoded1))  # 2cx16x16
 
-        bottleneck = self.bottleneck(self.pool2(encoded2))  # 256x8x8
+        bottleneck = self.bottleneck(self.pool2(encoded2))  # 4cx8x8
 
-        up2 = self.up2(bottleneck)  # 128x16x16
-        decoded2 = self.dec2(torch.cat([up2, encoded2], dim=1))  # 128x16x16
-        up1 = self.up1(decoded2)  # 64x32x32
-        decoded1 = self.dec1(torch.cat([up1, encoded1], dim=1))  # 64x32x32
+        up2 = self.up2(bottleneck)  # 2cx16x16
+        decoded2 = self.dec2(torch.cat([up2, encoded2], dim=1))  # 2cx16x16
+        up1 = self.up1(decoded2)  # cx32x32
+        decoded1 = self.dec1(torch.cat([up1, encoded1], dim=1))  # cx32x32
 
         return torch.sigmoid(self.out(decoded1))
@@ -0,0 +1,387 @@
+import logging
+import random
+import time
+from collections.abc import Iterable
+from contextlib import nullcontext
+from itertools import islice
+import numpy as np
+import torch
+from torch import nn, optim
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, BatchSampler
+from pathlib import Path
+from tqdm import tqdm
+from fontcap_model.dataset import get_dataloaders
+from fontcap_model.models import make_model
+from fontcap_model.utils import BatchAugment
+from fontcap_model.callbacks import Callback, LossHistory, EarlyStopping
+from fontcap_model.checkpoints import CheckpointManager
+from fontcap_model.distributed import is_distributed, is_main_process, get_rank, get_world_size, all_reduce_sum
+from fontcap_model.distributed import all_gather_object
+
+logger = logging.getLogger(__name__)
+
+"""
+Training engine shared by every model: the Trainer runs the epochs, and callbacks (see
+callbacks.py) do the logging, checkpointing and plotting around it
+"""
+
+
+def _rng_state() -> dict:
+    numpy_state = np.random.get_state()
+    return {
+        "python": random.getstate(),
+        "numpy": (numpy_state[0], torch.from_numpy(numpy_state[1].astype(np.int64)), *numpy_state[2:]),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def _set_rng_state(state: dict):
+    random.setstate((state["python"][0], tuple(state["python"][1]), state["python"][2]))
+    numpy_state = state["numpy"]
+    np.random.set_state((numpy_state[0], numpy_state[1].numpy().astype(np.uint32), *numpy_state[2:]))
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def _epoch_sampler(loader: DataLoader):
+    """The loader's sampler if it can be set to an epoch and position, e.g. a ResumableSampler"""
+    sampler = loader.sampler
+    if isinstance(sampler, BatchSampler):
+        sampler = sampler.sampler
+    return sampler if hasattr(sampler, "set_epoch") else None
+
+
+class Trainer:
+    """
+    Trains a model (an instance, or the name of a registered model) to map lowercase glyphs
+    to uppercase ones. Per-batch losses are summed on the device and only read back once per
+    epoch, so steps never wait on the device, and losses are averaged over samples.
+    compile runs the model through torch.compile, and channels_last uses the NHWC memory
+    format, which is faster for convolutions on most CPUs and recent GPUs.
+    With grad_accum_steps > 1, gradients of that many batches are accumulated per optimizer step.
+    Epoch losses are kept in train_losses/test_losses. Datasets and samplers with set_epoch
+    (e.g. the streaming dataset) get it called at the start of every epoch.
+    state_dict() holds everything needed to carry on exactly where training was, including
+    partway through an epoch: the position in it, the partial loss and the RNG states,
+    including that of the train loader's own generator (see make_loader) as it was when the
+    epoch's batches were set up, so they are set up the same way again. The rest of an
+    interrupted epoch is skipped by the ResumableSampler, or by reading past the batches
+    already seen for other loaders. It includes the state of callbacks that have one.
+    Callbacks can end training early by setting stop_training (see EarlyStopping).
+    Inside a distributed process group (see distributed.launch), the model is wrapped in
+    DistributedDataParallel, so gradients are averaged across ranks, and epoch losses are
+    summed over all ranks. The loaders should then give each rank its share of the data.
+    state_dict then gathers the RNG states of every rank, so must be called on all of them,
+    and each rank resumes with its own
+    """
+
+    def __init__(
+            self,
+            model: nn.Module | str,
+            train_loader: DataLoader,
+            test_loader: DataLoader | None = None,
+            learning_rate: float = 1e-3,
+            device: torch.device | str | None = None,
+            loss_fn: nn.Module | None = None,
+            augment: BatchAugment | None = None,
+            grad_accum_steps: int = 1,
+            compile_model: bool = False,
+            channels_last: bool = False,
+            callbacks: list[Callback] | None = None,
+            model_kwargs: dict | None = None,
+            progress: bool = True):
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        if isinstance(model, str):
+            model = make_model(model, **(model_kwargs or {}))
+        self.memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        # The uncompiled model, whose state_dict has the usual keys
+        self.model = model.to(self.device, memory_format=self.memory_format)  # type: ignore
+        # Evaluation runs the plain model: DDP's forward can start collectives, which would hang
+        # when only one rank runs it (e.g. for plots)
+        self.eval_forward = torch.compile(self.model) if compile_model else self.model
+        self._ddp = DistributedDataParallel(self.model) if is_distributed() else None
+        if self._ddp is None:
+            self.forward = self.eval_forward
+        else:
+            self.forward = torch.compile(self._ddp) if compile_model else self._ddp
+        self.train_loader = train_loader
+        self.test_loader = test_loader
+        self.optimizer = optim.Adam(self.model.parameters(), lr=learning_rate)
+        self.loss_fn = loss_fn or nn.MSELoss()
+        self.augment = augment
+        self.grad_accum_steps = grad_accum_steps
+        self.callbacks = list(callbacks or [])
+        self.progress = progress  # Progress bar over each epoch's batches
+        self.train_losses: list[float] = []
+        self.test_losses: list[float] = []
+        self.epoch = 0  # Last finished epoch
+        self.epoch_step = 0  # Batches done in the current epoch
+        self.epoch_samples = 0
+        self.global_step = 0  # Optimizer steps
+        self.stop_training = False  # Set by callbacks to end fit after the current step
+        self._epoch_loss = torch.zeros((), device=self.device)
+        self._resume_rng: dict | None = None
+        self._epoch_loader_rng: torch.Tensor | None = None  # The train loader's generator state at the epoch start
+        self._resume_loader_rng: torch.Tensor | None = None
+        self.non_blocking = self.device.type == "cuda"
+
+    @property
+    def learning_rate(self) -> float:
+        return self.optimizer.param_groups[0]["lr"]
+
+    def to_device(self, batch) -> tuple[torch.Tensor, torch.Tensor]:
+        lower, upper = batch[0], batch[1]
+        lower = lower.to(self.device, non_blocking=self.non_blocking, memory_format=self.memory_format)
+        upper = upper.to(self.device, non_blocking=self.non_blocking, memory_format=self.memory_format)
+        return lower, upper
+
+    def _callback(self, hook: str, *args):
+        for callback in self.callbacks:
+            getattr(callback, hook)(self, *args)
+
+    def state_dict(self) -> dict:
+        return {
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "epoch": self.epoch,
+            "epoch_step": self.epoch_step,
+            "epoch_samples": self.epoch_samples,
+            "epoch_loss": self._epoch_loss,
+            "global_step": self.global_step,
+            "train_losses": list(self.train_losses),
+            "test_losses": list(self.test_losses),
+            "rng": all_gather_object(_rng_state()),  # One per rank
+            "loader_rng": self._loader_rng_state(),
+            "callbacks": {type(c).__name__: c.state_dict() for c in self.callbacks if c.state_dict()},
+        }
+
+    def load_state_dict(self, state: dict):
+        self.model.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.epoch = state["epoch"]
+        self.epoch_step = state["epoch_step"]
+        self.epoch_samples = state["epoch_samples"]
+        self._epoch_loss = state["epoch_loss"].to(self.device)
+        self.global_step = state["global_step"]
+        self.train_losses = list(state["train_losses"])
+        self.test_losses = list(state["test_losses"])
+        # Applied in train_epoch, at the point of the epoch the state was saved at
+        self._resume_rng = self._rank_rng_state(state["rng"])
+        self._resume_loader_rng = state.get("loader_rng")
+        callback_states = state.get("callbacks", {})
+        for callback in self.callbacks:
+            if type(callback).__name__ in callback_states:
+                callback.load_state_dict(callback_states[type(callback).__name__])
+
+    @staticmethod
+    def _rank_rng_state(states: list[dict] | dict) -> dict | None:
+        """This rank's RNG state out of a checkpoint's"""
+        if isinstance(states, dict):
+            states = [states]  # Saved before the states of every rank were kept
+        if len(states) != get_world_size():
+            # A different number of ranks draws different data anyway, so keep each rank's own seed
+            logger.warning(f"Checkpoint holds the RNG states of {len(states)} ranks, not {get_world_size()}. "
+                           f"Not restoring them, so the run will not carry on exactly")
+            return None
+        return states[get_rank()]
+
+    def _loader_rng_state(self) -> torch.Tensor | None:
+        generator = self.train_loader.generator
+        if generator is None:
+            return None
+        # Between epochs, the state the next epoch's batches will be set up from
+        return self._epoch_loader_rng if self.epoch_step else generator.get_state()
+
+    def _mean_loss(self, total_loss: torch.Tensor, samples: int) -> float:
+        """Loss per sample, over every rank when distributed"""
+        totals = all_reduce_sum(torch.stack([total_loss, torch.tensor(float(samples), device=self.device)]))
+        return totals[0].item() / max(totals[1].item(), 1)
+
+    def _step(self):
+        self.optimizer.step()
+        self.optimizer.zero_grad(set_to_none=True)
+        self.global_step += 1
+        self._callback("on_step_end", self.global_step)
+
+    def train_epoch(self, epoch: int, num_epochs: int | None = None) -> float:
+        """Train one epoch, or the rest of it when resuming partway through"""
+        self.model.train()
+        if not self.epoch_step:
+            self._epoch_loss = torch.zeros((), device=self.device)
+            self.epoch_samples = 0
+        dataset = getattr(self.train_loader.dataset, "dataset", self.train_loader.dataset)  # Through random_split's Subset
+        set_epoch = getattr(dataset, "set_epoch", None)
+        if set_epoch is not None:
+            set_epoch(epoch)  # e.g. reshuffles the shards, or varies the rendered augmentation
+        sampler = _epoch_sampler(self.train_loader)
+        if sampler is not None:
+            sampler.set_epoch(epoch, self.epoch_samples)
+        if self._resume_rng is not None:
+            _set_rng_state(self._resume_rng)
+            self._resume_rng = None
+        generator = self.train_loader.generator
+        if generator is not None:
+            # Setting up the batches draws the workers' seeds from it
+            if self._resume_loader_rng is not None:
+                generator.set_state(self._resume_loader_rng)
+                self._resume_loader_rng = None
+            self._epoch_loader_rng = generator.get_state()
+        try:
+            # Batches left this epoch, taken before iter() as the sampler's length counts from its start
+            remaining = len(self.train_loader) - (self.epoch_step if sampler is None else 0)
+        except TypeError:
+            remaining = None  # Iterable datasets without a length, which are never distributed
+        batches = iter(self.train_loader)
+        if sampler is None and self.epoch_step:
+            batches = islice(batches, self.epoch_step, None)
+
+        pending = 0  # Batches whose gradients haven't been stepped yet
+        self.optimizer.zero_grad(set_to_none=True)
+        desc = f"[Train] Epoch {epoch}/{num_epochs}" if num_epochs else f"[Train] Epoch {epoch}"
+        for batch in tqdm(batches, desc=desc, initial=self.epoch_step, disable=not (self.progress and is_main_process())):
+            lower, upper = self.to_device(batch)
+            if self.augment is not None:
+                lower, upper = self.augment(lower, upper)
+
+            # Gradients are only averaged across ranks on the batch that completes a step, which
+            # includes the last batch of the epoch, stepped with fewer than grad_accum_steps
+            if remaining is not None:
+                remaining -= 1
+            syncing = self._ddp is None or pending + 1 == self.grad_accum_steps or remaining == 0
+            with nullcontext() if syncing else self._ddp.no_sync():  # type: ignore
+                loss = self.loss_fn(self.forward(lower), upper)
+                (loss / self.grad_accum_steps).backward()
+            self._epoch_loss += loss.detach() * lower.size(0)
+            self.epoch_samples += lower.size(0)
+            self.epoch_step += 1
+            pending += 1
+            if pending == self.grad_accum_steps:
+                pending = 0
+                self._step()
+                if self.stop_training:
+                    break
+        if pending:
+            self._step()
+        self.epoch_step = 0
+        return self._mean_loss(self._epoch_loss, self.epoch_samples)
+
+    def evaluate(self, loader: Iterable | None = None) -> float:
+        """Mean loss per sample over a loader (or any iterable of batches), the test loader by default"""
+        loader = loader if loader is not None else self.test_loader
+        self.model.eval()
+        total_loss = torch.zeros((), device=self.device)
+        samples = 0
+        with torch.inference_mode():
+            for batch in loader:  # type: ignore
+                lower, upper = self.to_device(batch)
+                total_loss += self.loss_fn(self.eval_forward(lower), upper) * lower.size(0)
+                samples += lower.size(0)
+        return self._mean_loss(total_loss, samples)
+
+    def fit(self, num_epochs: int):
+        """Train until epoch num_epochs, continuing from self.epoch"""
+        self._callback("on_train_start")
+        for epoch in range(self.epoch + 1, num_epochs + 1):
+            if self.stop_training:
+                logger.info(f"Stopped early after epoch {self.epoch}")
+                break
+            self._callback("on_epoch_start", epoch)
+            start = time.perf_counter()
+            train_loss = self.train_epoch(epoch, num_epochs)
+            elapsed = time.perf_counter() - start
+            self.train_losses.append(train_loss)
+            if self.test_loader is not None:
+                self.test_losses.append(self.evaluate())
+            self.epoch = epoch
+
+            test_loss = f"{self.test_losses[-1]:.4f}" if self.test_losses else "-"
+            logger.info(f"[Epoch {epoch}] Train Loss: {train_loss:.4f} | Test Loss: {test_loss} | "
+                        f"LR: {self.learning_rate} | {elapsed:.1f}s")
+            self._callback("on_epoch_end", epoch)
+        self._callback("on_train_end")
+        return self
+
+
+def train_model(
+        model_name: str,
+        data_root: str | Path,
+        num_epochs: int,
+        batch_size: int,
+        learning_rate: float,
+        checkpoint_dir: str | Path,
+        checkpoint_interval: int = 5,  # Saves a checkpoint every x epochs
+        plot_interval: int = 1,  # Plots every x epochs
+        state_dict_name: str | None = None,  # Starting weights (a state_dict or checkpoint) in checkpoint_dir
+        resume_loss: bool = False,  # Resumes the loss curve
+        resume: bool = False,  # Carry on exactly from the latest checkpoint in checkpoint_dir
+        checkpoint_steps: int | None = None,  # Also save a checkpoint every x optimizer steps
+        keep_last: int = 3,  # Checkpoints kept: the most recent ones...
+        keep_best: int = 1,  # ...and those with the lowest test loss
+        val_steps: int | None = None,  # Validate on a subsample of the test set every x optimizer steps
+        val_samples: int = 1024,  # Size of that subsample
+        patience: int | None = None,  # Stop after x validations without improvement
+        lr_patience: int | None = None,  # Lower the learning rate after x validations without improvement
+        lr_factor: float = 0.5,  # ...multiplying it by this
+        min_lr: float = 0.0,
+        cache_dataset: bool = False,  # Decode the dataset once into memory
+        dataset_cache_path: str | Path | None = None,  # Saves the decoded dataset for later runs
+        batched_loading: bool = False,  # Fetch whole batches from the dataset instead of single items
+        streaming: bool = False,  # Stream a packed store shard by shard instead of reading it at random
+        render: dict | None = None,  # Render pairs from font files under data_root, with these RenderedFontcapDataset options
+        loader_kwargs: dict | None = None,  # DataLoader settings, e.g. LoaderConfig.as_kwargs() from autotuning
+        augment: bool = False,  # Randomly jitter, reweight and add noise to training batches
+        grad_accum_steps: int = 1,  # Batches per optimizer step
+        compile_model: bool = False,  # Run the model through torch.compile
+        channels_last: bool = False,  # NHWC memory format
+        seed: int = 42,  # Train/test split
+        model_kwargs: dict | None = None,
+        callbacks: list[Callback] | None = None,  # Run after the loss history and checkpoint callbacks
+        progress: bool = True  # Show a progress bar for each epoch
+) -> Trainer:
+    """
+    Train a registered model on a dataset, saving checkpoints, loss curves and example
+    reconstructions to checkpoint_dir. Checkpoints hold the full training state, see
+    CheckpointManager. With any of val_steps, patience or lr_patience, an EarlyStopping
+    callback validates (every epoch unless val_steps is set), saves the best state to
+    checkpoint_dir/best.pt, and stops or lowers the learning rate when the validation loss
+    plateaus. A new checkpoints directory should be created each run
+    or they will overwrite, e.g. ./checkpoints_cnn. Sensible defaults:
+    batch_size: 32
+    learning_rate: 1e-3
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    checkpoint_dir.mkdir(exist_ok=True, parents=True)
+
+    model = make_model(model_name, **(model_kwargs or {}))
+    if state_dict_name:
+        state = torch.load(checkpoint_dir / state_dict_name, map_location="cpu", weights_only=True)
+        model.load_state_dict(state["model"] if "optimizer" in state else state)
+
+    train_loader, test_loader = get_dataloaders(data_root, batch_size=batch_size, shuffle=True, seed=seed,
+                                                cache=cache_dataset, cache_path=dataset_cache_path,
+                                                streaming=streaming, render=render,
+                                                num_replicas=get_world_size(), rank=get_rank(),
+                                                **{"batched": batched_loading, **(loader_kwargs or {})})
+    checkpoints = CheckpointManager(checkpoint_dir, checkpoint_interval, checkpoint_steps, keep_last, keep_best)
+    # Every rank resumes from the checkpoint, but only the first writes outputs. The checkpoints
+    # run on every rank, as they gather the RNG state of each
+    outputs: list[Callback] = [LossHistory(checkpoint_dir, plot_interval, resume_loss)] if is_main_process() else []
+    if val_steps or patience is not None or lr_patience is not None:
+        # On every rank, as they validate together. Ahead of the checkpoints, so those hold the
+        # validation of their own step and the learning rate it set
+        outputs.append(EarlyStopping(val_steps, val_samples, patience, lr_patience, lr_factor, min_lr,
+                                     checkpoints=checkpoints))
+    outputs.append(checkpoints)
+    trainer = Trainer(model, train_loader, test_loader, learning_rate,
+                      device="cpu" if is_distributed() else None,  # gloo reduces CPU tensors
+                      augment=BatchAugment() if augment else None,
+                      grad_accum_steps=grad_accum_steps, compile_model=compile_model, channels_last=channels_last,
+                      callbacks=[*outputs, *(callbacks or [])], progress=progress)
+    logger.info(f"Training {model_name} on device: {trainer.device}"
+                + (f", rank {get_rank()} of {get_world_size()}" if is_distributed() else ""))
+    if resume and not checkpoints.load(trainer):
+        logger.info(f"No checkpoint to resume from in {checkpoint_dir}")
+    return trainer.fit(num_epochs)
@@ -0,0 +1,229 @@
+import json
+import logging
+import math
+import multiprocessing as mp
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+import torch
+from fontcap_model.dataset import FontcapDataset
+from fontcap_model.trainer import train_model
+
+logger = logging.getLogger(__name__)
+
+"""
+Parallel hyperparameter search. Trials (a learning rate, batch size and model width each)
+train in a pool of processes, and an ASHA scheduler stops the weak ones early on their
+per-epoch test loss. Trials train in segments, from one rung of the scheduler to the next,
+resuming from their own checkpoints, so the search state is only a small JSON file and an
+interrupted search carries on where it left off
+"""
+
+STATE_FILE = "tune.json"
+
+
+@dataclass
+class Trial:
+    trial_id: int
+    config: dict  # learning_rate, batch_size, base_channels
+    status: str = "pending"  # pending, running, stopped (by the scheduler), completed or failed
+    test_losses: list[float] = field(default_factory=list)
+
+    @property
+    def epochs(self) -> int:
+        return len(self.test_losses)
+
+    @property
+    def best_loss(self) -> float | None:
+        return min(self.test_losses) if self.test_losses else None
+
+
+class ASHAScheduler:
+    """
+    Asynchronous successive halving. Rungs are at min_epochs * reduction_factor^k epochs,
+    below max_epochs. A trial reaching a rung carries on only if its test loss there is in the
+    best 1/reduction_factor of those recorded at that rung so far, so no trial waits for the
+    others, and about a reduction_factor-th of the trials make it past each rung
+    """
+
+    def __init__(self, max_epochs: int, min_epochs: int = 1, reduction_factor: int = 3):
+        self.max_epochs = max_epochs
+        self.reduction_factor = reduction_factor
+        self.rungs: list[int] = []
+        rung = min_epochs
+        while rung < max_epochs:
+            self.rungs.append(rung)
+            rung *= reduction_factor
+        self.results: dict[int, dict[int, float]] = {rung: {} for rung in self.rungs}  # Rung -> trial -> loss
+
+    def next_milestone(self, epochs: int) -> int:
+        """Epoch a trial trained for this many epochs should next stop at to be judged"""
+        return next((rung for rung in self.rungs if rung > epochs), self.max_epochs)
+
+    def should_continue(self, trial_id: int, epoch: int, loss: float) -> bool:
+        if epoch >= self.max_epochs:
+            return False
+        if epoch not in self.results:
+            return True
+        self.results[epoch][trial_id] = loss
+        ranked = sorted(self.results[epoch].values())
+        return ranked.index(loss) < math.ceil(len(ranked) / self.reduction_factor)
+
+    def state_dict(self) -> dict:
+        return {"results": {str(rung): {str(t): loss for t, loss in results.items()}
+                            for rung, results in self.results.items()}}
+
+    def load_state_dict(self, state: dict):
+        for rung, results in state["results"].items():
+            if int(rung) in self.results:
+                self.results[int(rung)] = {int(t): loss for t, loss in results.items()}
+
+
+def sample_configs(
+        num_trials: int,
+        learning_rates: tuple[float, float] = (1e-4, 1e-2),  # Sampled log-uniformly between these
+        batch_sizes: tuple[int, ...] = (16, 32, 64, 128),
+        widths: tuple[int, ...] = (16, 32, 64),  # base_channels of the model
+        seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    low, high = math.log(learning_rates[0]), math.log(learning_rates[1])
+    return [{
+        "learning_rate": float(f"{math.exp(rng.uniform(low, high)):.3g}"),
+        "batch_size": rng.choice(batch_sizes),
+        "base_channels": rng.choice(widths),
+    } for _ in range(num_trials)]
+
+
+def _run_trial(
+        model_name: str,
+        data_root: str,
+        trial_dir: Path,
+        config: dict,
+        num_epochs: int,
+        plot_interval: int,
+        seed: int,
+        threads: int,
+        train_kwargs: dict) -> list[float]:
+    """Train a trial up to num_epochs, resuming from its latest checkpoint. Runs in a pool process"""
+    torch.set_num_threads(threads)
+    torch.manual_seed(seed)  # Initial weights, when not resuming
+    trainer = train_model(model_name, data_root, num_epochs, config["batch_size"], config["learning_rate"], trial_dir,
+                          checkpoint_interval=1, plot_interval=plot_interval, keep_last=1, keep_best=0, resume=True,
+                          model_kwargs={"base_channels": config["base_channels"]}, progress=False, **train_kwargs)
+    return trainer.test_losses
+
+
+class Tuner:
+    """
+    Runs trials of model_name on data_root in num_workers processes with threads_per_trial
+    intra-op threads each (the cores shared out by default), until each has trained
+    max_epochs or been stopped by the scheduler. Trials promoted by the scheduler are run
+    before new ones. Every trial trains in <tune_dir>/trial_<id> (checkpoints, loss curves
+    and plots), and after every segment the search is saved to <tune_dir>/tune.json. If that
+    exists, the search resumes from it with its own trials and scheduler settings, and trials
+    that were running carry on from their latest checkpoint. train_kwargs are passed on to
+    train_model, e.g. dataset options; with a dataset_cache_path the dataset is decoded once
+    up front rather than by every trial
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            data_root: str | Path,
+            tune_dir: str | Path,
+            configs: list[dict],
+            max_epochs: int = 27,
+            min_epochs: int = 1,  # First rung
+            reduction_factor: int = 3,
+            num_workers: int = 2,
+            threads_per_trial: int | None = None,
+            seed: int = 0,
+            train_kwargs: dict | None = None):
+        self.data_root = str(data_root)
+        self.tune_dir = Path(tune_dir)
+        self.tune_dir.mkdir(exist_ok=True, parents=True)
+        self.state_path = self.tune_dir / STATE_FILE
+        self.num_workers = num_workers
+        self.threads_per_trial = threads_per_trial or max(1, (os.cpu_count() or 1) // num_workers)
+        self.seed = seed
+        self.train_kwargs = train_kwargs or {}
+        self.settings = dict(model_name=model_name, max_epochs=max_epochs, min_epochs=min_epochs,
+                             reduction_factor=reduction_factor)
+        self.trials = [Trial(i, config) for i, config in enumerate(configs)]
+        state = self._load() if self.state_path.exists() else None
+        self.scheduler = ASHAScheduler(self.settings["max_epochs"], self.settings["min_epochs"],
+                                       self.settings["reduction_factor"])
+        if state is not None:
+            self.scheduler.load_state_dict(state["scheduler"])
+
+    def _load(self) -> dict:
+        with open(self.state_path, 'r') as f:
+            state = json.load(f)
+        if state["settings"] != self.settings:
+            logger.info(f"Resuming the search in {self.state_path} with its settings: {state['settings']}")
+        self.settings = state["settings"]
+        self.trials = [Trial(**trial) for trial in state["trials"]]
+        done = sum(t.status in ("stopped", "completed", "failed") for t in self.trials)
+        logger.info(f"Resumed search with {len(self.trials)} trials, {done} finished")
+        return state
+
+    def save(self):
+        state = {"settings": self.settings, "scheduler": self.scheduler.state_dict(),
+                 "trials": [asdict(trial) for trial in self.trials]}
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def _submit(self, pool: ProcessPoolExecutor, trial: Trial):
+        target = self.scheduler.next_milestone(trial.epochs)
+        trial.status = "running"
+        return pool.submit(_run_trial, self.settings["model_name"], self.data_root,
+                           self.tune_dir / f"trial_{trial.trial_id}", trial.config, target,
+                           self.settings["max_epochs"],  # Plots once a trial has finished
+                           self.seed + trial.trial_id, self.threads_per_trial, self.train_kwargs)
+
+    def _record(self, trial: Trial, test_losses: list[float]):
+        trial.test_losses = test_losses
+        carry_on = self.scheduler.should_continue(trial.trial_id, trial.epochs, test_losses[-1])
+        if carry_on:
+            trial.status = "pending"
+        else:
+            trial.status = "completed" if trial.epochs >= self.settings["max_epochs"] else "stopped"
+        logger.info(f"Trial {trial.trial_id} {trial.config} epoch {trial.epochs}: test loss {test_losses[-1]:.4f}"
+                    f" -> {'continues' if carry_on else trial.status}")
+        return carry_on
+
+    def run(self) -> list[Trial]:
+        queue = [t for t in self.trials if t.status in ("pending", "running")]
+        if self.train_kwargs.get("dataset_cache_path") and queue:
+            FontcapDataset(Path(self.data_root), [], cache_path=self.train_kwargs["dataset_cache_path"])
+        # Spawned rather than forked, as the parent has already started torch's thread pools
+        with ProcessPoolExecutor(self.num_workers, mp_context=mp.get_context("spawn")) as pool:
+            running = {}
+            while queue or running:
+                while queue and len(running) < self.num_workers:
+                    trial = queue.pop(0)
+                    running[self._submit(pool, trial)] = trial
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    trial = running.pop(future)
+                    try:
+                        if self._record(trial, future.result()):
+                            queue.insert(0, trial)
+                    except Exception as e:
+                        logger.error(f"Trial {trial.trial_id} {trial.config} failed: {e}")
+                        trial.status = "failed"
+                    self.save()
+        return self.trials
+
+
+def summary_table(trials: list[Trial], top: int | None = 10) -> str:
+    """The trials with the lowest test losses, best first"""
+    ranked = sorted((t for t in trials if t.best_loss is not None), key=lambda t: t.best_loss)[:top]  # type: ignore
+    header = f"{'trial':>5}  {'lr':>9}  {'batch':>5}  {'width':>5}  {'epochs':>6}  {'best loss':>9}  status"
+    rows = [f"{t.trial_id:>5}  {t.config['learning_rate']:>9.3g}  {t.config['batch_size']:>5}  "
+            f"{t.config['base_channels']:>5}  {t.epochs:>6}  {t.best_loss:>9.4f}  {t.status}" for t in ranked]
+    return "\n".join([header, "-" * len(header), *rows])
@@ -1,7 +1,13 @@
-from .plotting import plot_losses, display_reconstructions
+from .plotting import plot_losses, display_reconstructions, PlotWriter, loss_curve_figure, reconstructions_figure
 from .introspection import extract_latents
+from .training_utils import benchmark_loader
+from .augmentation import BatchAugment
+from .autotune import LoaderConfig, autotune_loader, resolve_loader_config, save_loader_config, load_loader_config
 
 __all__ = [
-    "plot_losses", "display_reconstructions",
-    "extract_latents"
+    "plot_losses", "display_reconstructions", "PlotWriter", "loss_curve_figure", "reconstructions_figure",
+    "extract_latents",
+    "benchmark_loader",
+    "BatchAugment",
+    "LoaderConfig", "autotune_loader", "resolve_loader_config", "save_loader_config", "load_loader_config"
 ]
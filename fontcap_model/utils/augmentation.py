@@ -0,0 +1,78 @@
+import math
+import torch
+import torch.nn.functional as F
+
+"""
+Batched augmentation of (B, 1, S, S) glyph pairs, black on white in [0, 1], applied on the
+training device after loading so the DataLoader stays as fast as it is
+"""
+
+
+class BatchAugment:
+    """
+    Random affine jitter (rotation, scale, shear, translation), stroke weight changes and
+    input noise for a batch of pairs. The affine and stroke weight transforms are drawn per
+    pair and applied identically to the lowercase and uppercase glyphs, so the target stays
+    consistent with the input. Noise is only added to the lowercase input.
+    Everything is a handful of batched ops (one grid_sample and two 3x3 pools for the whole
+    batch), so the cost is negligible next to the forward pass
+    """
+
+    def __init__(
+            self,
+            max_rotation: float = 8.0,  # Degrees
+            max_scale: float = 0.1,  # Fraction
+            max_shear: float = 0.1,
+            max_translate: float = 0.08,  # Fraction of the image size
+            morph_prob: float = 0.3,  # Chance of making the strokes thicker or thinner by a pixel
+            noise_std: float = 0.03):
+        self.max_rotation = max_rotation
+        self.max_scale = max_scale
+        self.max_shear = max_shear
+        self.max_translate = max_translate
+        self.morph_prob = morph_prob
+        self.noise_std = noise_std
+
+    @staticmethod
+    def _uniform(n: int, bound: float, device) -> torch.Tensor:
+        return (torch.rand(n, device=device) * 2 - 1) * bound
+
+    def _thetas(self, n: int, device) -> torch.Tensor:
+        angle = self._uniform(n, math.radians(self.max_rotation), device)
+        scale = 1 + self._uniform(n, self.max_scale, device)
+        shear = self._uniform(n, self.max_shear, device)
+        # affine_grid's coordinates span [-1, 1], so a fraction f of the image is 2f
+        tx, ty = self._uniform(n, 2 * self.max_translate, device), self._uniform(n, 2 * self.max_translate, device)
+        cos, sin = torch.cos(angle) * scale, torch.sin(angle) * scale
+        return torch.stack([
+            torch.stack([cos, -sin + shear, tx], dim=1),
+            torch.stack([sin, cos, ty], dim=1),
+        ], dim=1)
+
+    def __call__(self, lower: torch.Tensor, upper: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        n = lower.size(0)
+        device = lower.device
+        pairs = torch.cat([lower, upper])
+
+        thetas = self._thetas(n, device).to(pairs.dtype).repeat(2, 1, 1)
+        grid = F.affine_grid(thetas, list(pairs.shape), align_corners=False)
+        # Sample the ink rather than the image, so the zero padding is background
+        pairs = 1 - F.grid_sample(1 - pairs, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+        if self.morph_prob:
+            # Min-pooling the image dilates the ink (thicker strokes), max-pooling erodes it. A full
+            # pixel is a lot at 32px, so each chosen pair is blended towards it by a random amount.
+            # Only the chosen pairs are pooled
+            choice = torch.rand(n, device=device).repeat(2)
+            amount = (0.3 + 0.7 * torch.rand(n, 1, 1, 1, device=device, dtype=pairs.dtype)).repeat(2, 1, 1, 1)
+            thicker = choice < self.morph_prob / 2
+            thinner = (choice >= self.morph_prob / 2) & (choice < self.morph_prob)
+            pairs[thicker] = torch.lerp(pairs[thicker], -F.max_pool2d(-pairs[thicker], 3, stride=1, padding=1),
+                                        amount[thicker])
+            pairs[thinner] = torch.lerp(pairs[thinner], F.max_pool2d(pairs[thinner], 3, stride=1, padding=1),
+                                        amount[thinner])
+
+        lower, upper = pairs[:n], pairs[n:]
+        if self.noise_std:
+            lower = (lower + torch.randn_like(lower) * self.noise_std).clamp(0, 1)
+        return lower, upper
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, asdict, replace
+from pathlib import Path
+import torch
+from torch.utils.data import Dataset
+from fontcap_model.dataset import FontcapDataset, ShardedFontcapDataset, RenderedFontcapDataset, make_loader, follows_epoch
+from fontcap_model.utils.training_utils import benchmark_loader
+
+logger = logging.getLogger(__name__)
+
+"""
+DataLoader autotuning: benchmark loader settings against the real dataset and keep the fastest
+"""
+
+
+@dataclass(frozen=True)
+class LoaderConfig:
+    """DataLoader settings, as accepted by get_dataloaders"""
+    num_workers: int = 0
+    prefetch_factor: int | None = None
+    persistent_workers: bool = False
+    pin_memory: bool = False
+    batched: bool = False
+
+    def as_kwargs(self) -> dict:
+        return asdict(self)
+
+    def describe(self) -> str:
+        return ", ".join(f"{k}={v}" for k, v in asdict(self).items())
+
+
+def save_loader_config(config: LoaderConfig, path: Path):
+    with open(path, 'w') as f:
+        json.dump(asdict(config), f, indent=2)
+
+
+def load_loader_config(path: Path) -> LoaderConfig:
+    with open(path, 'r') as f:
+        return LoaderConfig(**json.load(f))
+
+
+def autotune_loader(
+        dataset: Dataset,
+        batch_size: int,
+        seconds_per_config: float = 3.0,
+        max_workers: int | None = None) -> tuple[LoaderConfig, list[dict]]:
+    """
+    Find the fastest loader settings for a dataset by a greedy search, one setting at a time:
+    batch fetching, then the number of workers, prefetching, persistent workers and, on
+    CUDA, pinned memory (persistent workers only for datasets that don't follow set_epoch,
+    see make_loader).
+    Each candidate is iterated for seconds_per_config.
+    Returns the best config and every benchmark result
+    """
+    max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    worker_counts = sorted({0, *(n for n in (1, 2, 4, 8, 16) if n <= max_workers)})
+    results = []
+    measured: dict[LoaderConfig, float] = {}
+
+    def measure(config: LoaderConfig) -> float:
+        if config not in measured:
+            loader = make_loader(dataset, batch_size=batch_size, shuffle=True, **asdict(config))
+            stats = benchmark_loader(loader, max_seconds=seconds_per_config)
+            measured[config] = stats["samples_per_sec"]
+            results.append({**asdict(config), **stats})
+            logger.info(f"{config.describe()}: {stats['samples_per_sec']:.0f} samples/s")
+        return measured[config]
+
+    best = LoaderConfig()
+    searches = [
+        ("batched", [False, True]),
+        ("num_workers", worker_counts),
+        ("prefetch_factor", [None, 4, 8]),
+        ("persistent_workers", [False, True]),
+    ]
+    if torch.cuda.is_available():
+        searches.append(("pin_memory", [False, True]))
+    if not hasattr(dataset, "get_batch"):
+        searches = searches[1:]  # Streamed and rendered pairs come one at a time
+    if follows_epoch(dataset):
+        # Persistent workers keep their own copy of the dataset, so would miss set_epoch
+        searches = [(field, values) for field, values in searches if field != "persistent_workers"]
+    for field, values in searches:
+        if field in ("prefetch_factor", "persistent_workers") and best.num_workers == 0:
+            continue  # Only apply to worker processes
+        best = max((replace(best, **{field: value}) for value in values), key=measure)
+    logger.info(f"Fastest loader: {best.describe()} ({measured[best]:.0f} samples/s)")
+    return best, results
+
+
+def resolve_loader_config(
+        data_root: str | Path,
+        batch_size: int,
+        autotune: bool = False,
+        config_path: str | Path | None = None,
+        img_size: int | None = None,
+        cache: bool = False,
+        cache_path: str | Path | None = None,
+        streaming: bool = False,
+        render: dict | None = None,
+        seconds_per_config: float = 3.0) -> LoaderConfig | None:
+    """
+    For the training CLIs: autotune on the training data if asked to, saving the result to
+    config_path if given, or otherwise load a previously saved config from config_path
+    """
+    if not autotune:
+        if config_path is None:
+            return None
+        config = load_loader_config(Path(config_path))
+        logger.info(f"Loaded loader config from {config_path}: {config.describe()}")
+        return config
+
+    if streaming:
+        dataset = ShardedFontcapDataset(Path(data_root), img_size=img_size, split="train")
+    elif render is not None:
+        dataset = RenderedFontcapDataset(Path(data_root), img_size=img_size or 32, **render)
+    else:
+        dataset = FontcapDataset(Path(data_root), [], img_size=img_size, cache=cache, cache_path=cache_path)
+    config, _ = autotune_loader(dataset, batch_size, seconds_per_config)
+    if config_path is not None:
+        save_loader_config(config, Path(config_path))
+        logger.info(f"Saved loader config to {config_path}")
+    return config
@@ -1,40 +1,48 @@
 import torch
+from torch.utils.data import DataLoader
 from fontcap_model.dataset import EnrichedFontcapDataset
 from fontcap_model.models import CNNAutoencoder, UNet
 
 
 def extract_latents(
         model: CNNAutoencoder | UNet,
-        dataloader: EnrichedFontcapDataset,
+        dataloader: DataLoader,
         device,
         num=500):
     """
-    Extract latent representation from the bottleneck layers of the CNN or U-Net model
+    Extract latent representation from the bottleneck layers of the CNN or U-Net model.
+    The dataloader must be over an EnrichedFontcapDataset (or a Subset of one).
+    Returns latents, font names, chars and pair ids. Thumbnails for plotted points can be
+    fetched with dataset.thumbnail(pair_id)
     """
+    dataset = dataloader.dataset
+    while not isinstance(dataset, EnrichedFontcapDataset):
+        dataset = dataset.dataset  # type: ignore  # Through Subsets
     model.eval()
     model.to(device)
 
     all_latents = []
-    all_fonts = []
-    all_chars = []
-    all_b64s = []
+    all_ids = []
 
     with torch.no_grad():
         limited = iter(dataloader)
         for i in range(num):
-            lower_batch, _, font_names, chars, b64s = next(limited)
+            batch = next(limited, None)
+            if batch is None:
+                break
+            lower_batch, _, _, _, pair_ids = batch
             lower_batch = lower_batch.to(device)
 
             # Forward pass through encoder
             encoded = model.encoder(lower_batch)              # [B, C, H, W]
             latent_vecs = encoded.view(encoded.size(0), -1)   # Flatten to [B, N]
 
-            all_latents.append(latent_vecs)
-            all_fonts.extend(font_names)
-            all_chars.extend(chars)
-            all_b64s.extend(b64s)
+            all_latents.append(latent_vecs.cpu())
+            all_ids.append(pair_ids)
 
     # Stack latents
     latents = torch.cat(all_latents, dim=0).numpy()
+    pair_ids = torch.cat(all_ids).tolist()
+    fonts, chars = zip(*(dataset.pair_labels(i) for i in pair_ids)) if pair_ids else ((), ())
 
-    return latents, all_fonts, all_chars, all_b64s
+    return latents, list(fonts), list(chars), pair_ids
@@ -1,41 +1,78 @@
+import logging
+import multiprocessing as mp
 from pathlib import Path
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+import numpy as np
 from torch.nn import Module
 from torch import no_grad
 
+logger = logging.getLogger(__name__)
+
 """
-Utility functions to plot stuff during or after training
+Utility functions to plot stuff during or after training. Figures are built with the
+object-oriented Figure API rather than pyplot's global state, so they can be rendered
+in a background process (see PlotWriter)
 """
 
+def loss_curve_figure(
+        train_losses: list[float],
+        test_losses: list[float],
+        fig: Figure | None = None) -> Figure:
+    fig = fig or Figure(figsize=(8, 4))
+    ax = fig.subplots()
+    ax.plot(train_losses, label="Train Loss")
+    ax.plot(test_losses, label="Test Loss")
+    ax.set_xlabel("Epoch")
+    ax.set_ylabel("Loss")
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def reconstructions_figure(
+        inputs: np.ndarray,
+        outputs: np.ndarray,
+        targets: np.ndarray,
+        fig: Figure | None = None) -> Figure:
+    """Rows of input, output and target images, from (N, S, S) arrays"""
+    num_images = len(inputs)
+    fig = fig or Figure(figsize=(6, num_images * 1.5))
+    axes = fig.subplots(num_images, 3, squeeze=False)
+    for i in range(num_images):
+        axes[i, 0].imshow(inputs[i], cmap="gray")
+        axes[i, 0].set_title("input")
+        axes[i, 1].imshow(outputs[i], cmap="gray")
+        axes[i, 1].set_title("output")
+        axes[i, 2].imshow(targets[i], cmap="gray")
+        axes[i, 2].set_title("target")
+
+        for ax in axes[i]:
+            ax.axis("off")
+    fig.tight_layout()
+    return fig
+
 def plot_losses(
-        train_losses: list[float], 
-        test_losses: list[float], 
+        train_losses: list[float],
+        test_losses: list[float],
         path: Path | None):
-    plt.figure(figsize=(8, 4))
-    plt.plot(train_losses, label="Train Loss")
-    plt.plot(test_losses, label="Test Loss")
-    plt.xlabel("Epoch")
-    plt.ylabel("Loss")
-    plt.legend()
-    plt.grid(True)
-    plt.tight_layout()
     if path:
-        plt.savefig(path)
-        plt.close()
+        loss_curve_figure(train_losses, test_losses).savefig(path)
     else:
+        loss_curve_figure(train_losses, test_losses, plt.figure(figsize=(8, 4)))
         plt.show()
     return
 
 def display_reconstructions(
-        model: Module, 
-        dataloader, 
-        device, 
-        path: Path | None, 
+        model: Module,
+        dataloader,
+        device,
+        path: Path | None,
         num_images: int = 8):
     """Displays actual vs predicted model output images"""
     model.eval()
-    inputs, targets = next(iter(dataloader))
-    inputs, targets = inputs.to(device), targets.to(device)
+    batch = next(iter(dataloader))
+    inputs, targets = batch[0].to(device), batch[1].to(device)
 
     with no_grad():
         outputs = model(inputs)
@@ -44,22 +81,47 @@ def display_reconstructions(
     outputs = outputs[:num_images].cpu().squeeze(1).numpy()
     targets = targets[:num_images].cpu().squeeze(1).numpy()
 
-    _, axes = plt.subplots(num_images, 3, figsize=(6, num_images * 1.5))
-    for i in range(num_images):
-        axes[i, 0].imshow(inputs[i], cmap="gray")
-        axes[i, 0].set_title("input")
-        axes[i, 1].imshow(outputs[i], cmap="gray")
-        axes[i, 1].set_title("output")
-        axes[i, 2].imshow(targets[i], cmap="gray")
-        axes[i, 2].set_title("target")
-
-        for ax in axes[i]:
-            ax.axis("off")
-
-    plt.tight_layout()
     if path:
-        plt.savefig(path)
-        plt.close()
+        reconstructions_figure(inputs, outputs, targets).savefig(path)
     else:
+        reconstructions_figure(inputs, outputs, targets, plt.figure(figsize=(6, len(inputs) * 1.5)))
         plt.show()
     return
+
+
+def _plot_worker(jobs):
+    while (job := jobs.get()) is not None:
+        render, args, path = job
+        try:
+            render(*args).savefig(path)
+        except Exception as e:
+            logger.error(f"Could not write plot {path}: {e}")
+
+
+class PlotWriter:
+    """
+    Renders figures and saves them in a background process, so plotting neither blocks
+    the training loop nor competes with it for the GIL. submit(render, *args, path=...)
+    queues render(*args), which must be a module-level function returning a Figure, and
+    returns straight away. The arguments are pickled, so should be plain data such as
+    lists and numpy arrays. The process is started like DataLoader workers are, so where
+    that is by spawning, training scripts need an if __name__ == "__main__" guard
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._process = None
+
+    def submit(self, render, *args, path: Path):
+        if self._process is None:
+            self._queue = mp.Queue()
+            self._process = mp.Process(target=_plot_worker, args=(self._queue,), name="plot-writer", daemon=True)
+            self._process.start()
+        self._queue.put((render, args, path))  # type: ignore
+
+    def close(self):
+        """Wait for the queued plots to be written"""
+        if self._process is not None:
+            self._queue.put(None)  # type: ignore
+            self._process.join()
+            self._process = None
@@ -0,0 +1,44 @@
+import time
+from torch.utils.data import DataLoader
+
+"""
+Helpers for tuning the training setup
+"""
+
+def benchmark_loader(
+        loader: DataLoader,
+        max_batches: int | None = None,
+        warmup_batches: int = 2,
+        max_seconds: float | None = None) -> dict:
+    """
+    Iterate a loader without training on it and measure its throughput. Warmup batches
+    (worker startup, first file opens) are not timed. With max_seconds, the loader is
+    iterated for that long, over several epochs if need be, so per-epoch costs such as
+    starting workers are counted
+    """
+    batches = samples = seen = 0
+    # The clock starts once the last warmup batch is in, so it times only the batches counted
+    start = time.perf_counter() if warmup_batches == 0 else None
+    done = False
+    while not done:
+        for batch in loader:
+            seen += 1
+            if seen == warmup_batches:
+                start = time.perf_counter()
+            elif seen > warmup_batches:
+                batches += 1
+                samples += len(batch[0])
+            out_of_time = max_seconds is not None and start is not None and time.perf_counter() - start >= max_seconds
+            if out_of_time or (max_batches is not None and batches >= max_batches):
+                done = True
+                break
+        # Without a time budget, one epoch is enough
+        done = done or max_seconds is None or not seen
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    return {
+        "batches": batches,
+        "samples": samples,
+        "seconds": elapsed,
+        "samples_per_sec": samples / elapsed if elapsed else 0.0,
+        "batches_per_sec": batches / elapsed if elapsed else 0.0,
+    }
@@ -2,8 +2,8 @@
 Top-level package for fontcap_scraper
 """
 
-from main import run_scraper
-from config import FontcapConfig
+from .main import run_scraper
+from .config import FontcapConfig
 from .sources import GoogleFontsSource
 from .utils import render_glyphs, save_glyphs, font_hash
 
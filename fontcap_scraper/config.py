@@ -2,6 +2,8 @@ import yaml
 from pathlib import Path
 from dataclasses import dataclass, field
 
+DEFAULT_CHARSET = [chr(i) for i in range(65, 91)] + [chr(i) for i in range(97, 123)]
+
 @dataclass
 class FontcapConfig:
     """Configuration class for the scraper. Usually loaded from YAML"""
@@ -11,15 +13,39 @@ class FontcapConfig:
     img_size: int
     font_size: int
     min_chars_required: int
-    index_file: Path
+    index_file: Path  # Legacy hash list, imported into the journal if there isn't one yet
+    max_concurrent_downloads: int = 8  # Size of the download thread pool and connection pool
+    render_workers: int | None = None  # Rendering processes, defaults to one per core
+    render_queue_size: int = 32  # Fonts allowed in flight between downloading and writing
+    font_cache_dir: Path | None = None  # Raw font file store. Not cached if unset
+    revalidate_cache: bool = True  # If False, cached fonts are used without asking the server
+    journal_file: Path = Path("journal.jsonl")  # Append-only record of committed (and deliberately skipped) fonts
+    storage: str = "png"  # "png" for one file per glyph, "packed" for a PackedGlyphStore in output_dir
+    img_sizes: list[int] = field(default_factory=list)  # Downsampled copies of img_size, kept in output_dir/<size>px
+    near_duplicates: str = "flag"  # Perceptual near-duplicate check: "off", "flag" (log them) or "skip" (don't save them)
+    near_duplicate_threshold: float = 0.03  # Max fraction of differing fingerprint bits
+    metrics_file: Path | None = Path("metrics.json")  # Scrape metrics report. Prometheus text if it ends in .prom
+    metrics_interval: float | None = None  # Also rewrite the report every this many seconds during the run
 
     def __post_init__(self):
+        if self.storage not in ("png", "packed"):
+            raise ValueError(f"Unknown storage backend '{self.storage}'")
+        if self.near_duplicates not in ("off", "flag", "skip"):
+            raise ValueError(f"Unknown near_duplicates mode '{self.near_duplicates}'")
+        for size in self.img_sizes:
+            if self.img_size % size:
+                raise ValueError(f"img_sizes must divide img_size ({self.img_size}), got {size}")
         self.index_file = self.output_dir / self.index_file
+        self.journal_file = self.output_dir / self.journal_file
+        if self.metrics_file:
+            self.metrics_file = self.output_dir / self.metrics_file
 
     @classmethod
     def from_yaml(cls, path: Path):
         with open(path, 'r') as f:
             data = yaml.safe_load(f)
-        data.setdefault('charset', [chr(i) for i in range(65, 91)] + [chr(i) for i in range(97, 123)])
+        data.setdefault('charset', DEFAULT_CHARSET)
         data['output_dir'] = Path(data['output_dir'])
+        if data.get('font_cache_dir'):
+            data['font_cache_dir'] = Path(data['font_cache_dir'])
         return cls(**data)
@@ -1,68 +1,57 @@
 import logging
-from tqdm import tqdm
-import requests
+from contextlib import closing
 from fontcap_scraper.config import FontcapConfig
-from fontcap_scraper.utils import render_glyphs, save_glyphs, font_hash, load_known_hashes, update_known_hashes
-from fontcap_scraper.sources import GoogleFontsSource
+from fontcap_scraper.pipeline import ScrapePipeline
+from fontcap_scraper.utils import load_known_hashes, ScrapeJournal
+from fontcap_scraper.utils import make_session, fetch_fonts, FontCache
+from fontcap_scraper.utils import ScrapeMetrics, MetricsReporter
+from fontcap_scraper.sources import make_source, unique_names
 
 logger = logging.getLogger(__name__)
 
 def run_scraper(cfg: FontcapConfig):
     """Scrape fonts according to the supplied configuration"""
     cfg.output_dir.mkdir(parents=True, exist_ok=True)
-    if not cfg.index_file.exists():
-        logger.warning(f"Index file does not exist at the specified location {cfg.index_file}. A new one will be created")
-    
-    # Load known hashes
-    known_hashes = load_known_hashes(cfg.index_file)
 
-    for source in cfg.font_sources:
-        logger.info(f"Scraping source {source}...")
-        if source["name"] == "google_fonts":
-            font_source = GoogleFontsSource(source["url"], source["api_key"])
-        else:
-            raise NotImplementedError(f"Source '{source['name']}' not implemented")
+    # Load known hashes. Fonts are journalled as they are committed, so a crashed run resumes where it stopped
+    journal = ScrapeJournal(cfg.journal_file)
+    if not journal.exists():
+        logger.warning(f"Journal does not exist at the specified location {cfg.journal_file}. A new one will be created")
+        if cfg.index_file.exists():
+            logger.info(f"Importing known hashes from {cfg.index_file}")
+            journal.import_hashes(load_known_hashes(cfg.index_file))
+    journal.load()
+    # One pooled session is shared by all download threads
+    session = make_session(cfg.max_concurrent_downloads)
+    cache = FontCache(cfg.font_cache_dir) if cfg.font_cache_dir else None
+    # Shared by every stage, reported to cfg.metrics_file periodically and at the end
+    metrics = ScrapeMetrics()
+    # Names of committed fonts and of those queued so far, which no other font may take
+    taken_names = set(journal.names)
 
-        # Get list of all fonts available
-        font_metadata_list = []
-        font_metadata_list = font_source.fetch_font_list()
-        logger.info(f"Found {len(font_metadata_list)} fonts")
-
-        # Download each font file if it doesn't exist
-        for metadata in tqdm(font_metadata_list):
-            font_bytes = download_font_file(metadata.url)
-            if not font_bytes:
-                logger.info(f"Unsuccessful scrape of {metadata.name}: download failed")
-                continue
-
-            hsh = font_hash(font_bytes)
-            if hsh in known_hashes:
-                logger.info(f"{metadata.name} already known")
-                continue
-
-            glyphs = render_glyphs(font_bytes, cfg.charset, cfg.img_size, cfg.font_size)
-            if glyphs is None or len(glyphs) < cfg.min_chars_required:
-                logger.info(f"Unsuccessful scrape of {metadata.name}: not enough glyphs")
-                continue
-
-            save_glyphs(metadata.name, glyphs, cfg.output_dir)
-            known_hashes.add(hsh)
-            logger.info(f"Successfully scraped font {metadata.name}")
-        
-        logger.info(f"Scraping source {source['name']} complete!")
-        
-    # Update and store hashes
-    update_known_hashes(cfg.index_file, known_hashes)
-    return
-
-
-def download_font_file(url: str) -> bytes:
-    """Attemps to download the font .tff file"""
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.content
-    except requests.RequestException as e:
-        print(f"Failed to download font from {url}: {e}")
-        return b""
-    
\ No newline at end of file
+        with MetricsReporter(metrics, cfg.metrics_file, cfg.metrics_interval), ScrapePipeline(cfg, journal, metrics) as pipeline:
+            for source in cfg.font_sources:
+                logger.info(f"Scraping source {source}...")
+                font_source = make_source(source, session=session, cache=cache, revalidate=cfg.revalidate_cache)
+                try:
+                    # Get list of all fonts available, skipping any already committed
+                    font_metadata_list = font_source.fetch_font_list()
+                    logger.info(f"Found {len(font_metadata_list)} fonts")
+                    font_metadata_list = [m for m in font_metadata_list if m.url not in journal.urls]
+                    font_metadata_list = unique_names(font_metadata_list, taken_names)
+                    logger.info(f"{len(font_metadata_list)} fonts not yet committed")
+
+                    # Fonts are hashed as they are read, then rendered and written in the background. Closing
+                    # the reads waits for those in flight, before the source they read from is closed
+                    with closing(fetch_fonts(font_source.read_font, font_metadata_list, cfg.max_concurrent_downloads,
+                                             metrics)) as fonts:
+                        pipeline.process(fonts, total=len(font_metadata_list))
+                finally:
+                    # Also when the pipeline fails, e.g. on a write error, so archives and threads aren't left open
+                    font_source.close()
+
+                logger.info(f"Scraping source {source['name']} complete!")
+    finally:
+        session.close()
+        journal.close()
@@ -0,0 +1,258 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+from fontcap_scraper.config import FontcapConfig
+from fontcap_scraper.sources.base import FontMetadata
+from fontcap_scraper.utils import render_pyramid, blank_chars, encode_glyphs, save_encoded_glyphs, font_hash
+from fontcap_scraper.utils import ScrapeJournal, PackedGlyphStore, resolution_dir, is_resolution_dir, glyphs_to_array
+from fontcap_scraper.utils import glyph_fingerprint, NearDuplicateIndex, ScrapeMetrics
+
+logger = logging.getLogger(__name__)
+
+"""
+Producer/consumer scrape pipeline:
+downloads (thread pool) -> render + encode every resolution (process pool) -> writer thread
+"""
+
+
+def render_and_encode(
+        font_bytes: bytes,
+        charset: list[str],
+        img_size: int,
+        font_size: int,
+        storage: str = "png",
+        img_sizes: list[int] | None = None) -> tuple[int, dict[int, object], np.ndarray] | None:
+    """
+    Runs in a worker process. Renders the font once at img_size, derives img_sizes from it, and
+    encodes every size for the storage backend: PNG bytes per char, or a (glyph array, missing
+    chars) pair for the packed store.
+    Returns (number of glyphs rendered, encoded glyphs by size, perceptual fingerprint)
+    """
+    pyramid = render_pyramid(font_bytes, charset, img_size, font_size, img_sizes or [])
+    if pyramid is None:
+        return None
+    # Judge missing glyphs at full resolution, so every size holds the same chars
+    missing = blank_chars(pyramid[img_size], charset)
+    num_glyphs = len(charset) - len(missing)
+    fingerprint = glyph_fingerprint(pyramid[img_size])
+    if storage == "packed":
+        return num_glyphs, {size: (glyphs, missing) for size, glyphs in pyramid.items()}, fingerprint
+    return num_glyphs, {size: encode_glyphs(glyphs, charset, missing) for size, glyphs in pyramid.items()}, fingerprint
+
+
+def timed_render_and_encode(*args) -> tuple[object, float]:
+    """render_and_encode, and how long it took in the worker, excluding pickling and queueing"""
+    start = time.perf_counter()
+    result = render_and_encode(*args)
+    return result, time.perf_counter() - start
+
+
+class ScrapePipeline:
+    """
+    Feeds downloaded fonts through a rendering process pool to a single writer thread.
+    Downloads must arrive in list order (as fetch_fonts yields them): hashes are claimed and
+    fonts committed in that order, so the first of several identical fonts is the one kept,
+    and a font is only recorded in the journal once its glyphs have been written, as in the
+    sequential loop
+    """
+
+    def __init__(self, cfg: FontcapConfig, journal: ScrapeJournal, metrics: ScrapeMetrics | None = None):
+        self.cfg = cfg
+        self.journal = journal
+        self.metrics = metrics if metrics is not None else ScrapeMetrics()
+        # Hashes that are known or in flight. Identical bytes render identically, so
+        # a duplicate of an in-flight font can be skipped whether or not that one succeeds
+        self._claimed = set(journal.hashes)
+        self._pool = None
+        self._stores: dict[int, PackedGlyphStore] = {}
+        self._near_dups: NearDuplicateIndex | None = None
+        self._near_dups_path = cfg.output_dir / "near_duplicates.npz"
+        self._flags_path = cfg.output_dir / "near_duplicates.jsonl"
+        self._flagged: set[str] = set()  # Fonts already in the flags file
+        self._indexed: set[str] = set()  # Fonts in the near-duplicate index
+
+    def __enter__(self):
+        # Spawn rather than fork, since the download threads are already running
+        self._pool = ProcessPoolExecutor(max_workers=self.cfg.render_workers, mp_context=get_context("spawn"))
+        if self.cfg.storage == "packed":
+            self._stores = {size: PackedGlyphStore(self._size_dir(size), self.cfg.charset, size)
+                            for size in [self.cfg.img_size, *self.cfg.img_sizes]}
+        if self.cfg.near_duplicates != "off":
+            if self._near_dups_path.exists():
+                self._near_dups = NearDuplicateIndex.load(self._near_dups_path, self.cfg.near_duplicate_threshold)
+            else:
+                num_bits = len(self.cfg.charset) * 64  # glyph_fingerprint's 8x8 grid
+                self._near_dups = NearDuplicateIndex(num_bits, self.cfg.near_duplicate_threshold)
+            self._index_unsaved_fonts()
+            self._indexed = set(self._near_dups.names)  # type: ignore
+            if self._flags_path.exists():
+                with open(self._flags_path, 'r') as f:
+                    self._flagged = {json.loads(line)["font"] for line in f if line.strip()}
+        return self
+
+    def _index_unsaved_fonts(self):
+        """
+        The index is only saved on exit, while fonts are committed as they go, so after a hard
+        kill the output holds fonts the saved index lacks. They are fingerprinted from their
+        stored glyphs, which are exactly the base-size render the fingerprint is taken from
+        """
+        indexed = set(self._near_dups.names)  # type: ignore
+        added = 0
+        if self._stores:
+            store = self._stores[self.cfg.img_size]
+            for font_idx, entry in enumerate(store.fonts):
+                if entry["name"] not in indexed:
+                    self._near_dups.add(entry["name"], glyph_fingerprint(store.font_glyphs(font_idx)))  # type: ignore
+                    added += 1
+        elif self.cfg.output_dir.is_dir():
+            for font_dir in sorted(self.cfg.output_dir.iterdir()):
+                if not font_dir.is_dir() or is_resolution_dir(font_dir) or font_dir.name in indexed:
+                    continue
+                glyphs = {}
+                for c in self.cfg.charset:
+                    path = font_dir / f"{ord(c)}.png"
+                    if path.exists():
+                        with Image.open(path) as img:
+                            glyphs[c] = img.convert('L')
+                if glyphs:
+                    arr, _ = glyphs_to_array(glyphs, self.cfg.charset, self.cfg.img_size)
+                    self._near_dups.add(font_dir.name, glyph_fingerprint(arr))  # type: ignore
+                    added += 1
+        if added:
+            logger.info(f"Added {added} fonts missing from {self._near_dups_path} to the near-duplicate index")
+
+    def __exit__(self, *exc_info):
+        self._pool.shutdown(cancel_futures=True)
+        for store in self._stores.values():
+            store.close()
+        if self._near_dups is not None:
+            self._near_dups.save(self._near_dups_path)
+
+    def _size_dir(self, img_size: int) -> Path:
+        """The base resolution lives in output_dir itself, downsampled copies beside it"""
+        if img_size == self.cfg.img_size:
+            return self.cfg.output_dir
+        return resolution_dir(self.cfg.output_dir, img_size)
+
+    def process(self, downloads: Iterable[tuple[FontMetadata, bytes]], total: int | None = None):
+        """Run one source's downloads through the pipeline. Returns once every font is written"""
+        # Bounded, so rendering can't run arbitrarily far ahead of the writer
+        results = queue.Queue(maxsize=self.cfg.render_queue_size)
+        errors = []
+        writer = threading.Thread(target=self._write, args=(results, errors), name="glyph-writer")
+        writer.start()
+        try:
+            for metadata, font_bytes in tqdm(downloads, total=total):
+                if errors:
+                    break
+                if not font_bytes:
+                    logger.info(f"Unsuccessful scrape of {metadata.name}: download failed")
+                    self.metrics.failure("fetch_failed")
+                    continue
+
+                with self.metrics.time("hash"):
+                    hsh = font_hash(font_bytes)
+                if hsh in self._claimed:
+                    logger.info(f"{metadata.name} already known")
+                    self.metrics.inc("skipped_known")
+                    # Journalled by the writer, behind the font it duplicates
+                    results.put((metadata, hsh, None))
+                    continue
+                self._claimed.add(hsh)
+
+                future = self._pool.submit(timed_render_and_encode, font_bytes, self.cfg.charset, self.cfg.img_size,
+                                           self.cfg.font_size, self.cfg.storage, self.cfg.img_sizes)
+                # Time spent here means the writer is the bottleneck
+                with self.metrics.time("queue_wait"):
+                    results.put((metadata, hsh, future))
+        finally:
+            results.put(None)
+            writer.join()
+        if errors:
+            raise errors[0]
+
+    def _write(self, results: queue.Queue, errors: list):
+        while (item := results.get()) is not None:
+            # Keep draining after a failure so the producer never blocks on a full queue
+            if errors:
+                continue
+            metadata, hsh, future = item
+            if future is None:
+                # A byte-identical copy. Journalled once the original is, so reruns skip its URL
+                if hsh in self.journal.hashes:
+                    with self.metrics.time("journal"):
+                        self.journal.record(hsh, metadata.name, metadata.url, status="duplicate")
+                continue
+            try:
+                # Time spent here means rendering is the bottleneck
+                with self.metrics.time("render_wait"):
+                    result, render_seconds = future.result()
+                self.metrics.observe_render(render_seconds)
+            except Exception as e:
+                logger.warning(f"Rendering {metadata.name} failed: {e}")
+                self.metrics.failure("render_error")
+                continue
+            if result is None or result[0] < self.cfg.min_chars_required:
+                logger.info(f"Unsuccessful scrape of {metadata.name}: not enough glyphs")
+                self.metrics.failure("unreadable_font" if result is None else "not_enough_glyphs")
+                continue
+
+            _, encoded, fingerprint = result
+            if self._near_dups is not None:
+                with self.metrics.time("near_duplicates"):
+                    # A font written by a run that stopped before journalling it is indexed already
+                    matches = [match for match in self._near_dups.query(fingerprint) if match[0] != metadata.name]
+                if matches:
+                    self._flag_near_duplicate(metadata.name, matches)
+                    self.metrics.inc("near_duplicates")
+                    if self.cfg.near_duplicates == "skip":
+                        logger.info(f"Skipped {metadata.name}: near-duplicate of {matches[0][0]}")
+                        self.metrics.inc("skipped_near_duplicate")
+                        # Journalled, so reruns don't fetch and render it again
+                        with self.metrics.time("journal"):
+                            self.journal.record(hsh, metadata.name, metadata.url, status="near_duplicate")
+                        continue
+
+            try:
+                with self.metrics.time("write"):
+                    self._save(metadata.name, encoded)
+            except Exception as e:
+                self.metrics.failure("write_error")
+                errors.append(e)
+                continue
+            with self.metrics.time("journal"):
+                self.journal.record(hsh, metadata.name, metadata.url)
+            if self._near_dups is not None and metadata.name not in self._indexed:
+                self._near_dups.add(metadata.name, fingerprint)
+                self._indexed.add(metadata.name)
+            self.metrics.inc("fonts_committed")
+            logger.info(f"Successfully scraped font {metadata.name}")
+
+    def _save(self, font_name: str, encoded_by_size: dict[int, object]):
+        for size, encoded in encoded_by_size.items():
+            if self._stores:
+                glyphs, missing = encoded  # type: ignore
+                self._stores[size].append(font_name, glyphs, missing)
+                # Glyphs must be durable before the journal says the font is committed
+                self._stores[size].flush()
+                self.metrics.inc("bytes_written", glyphs.nbytes)
+            else:
+                save_encoded_glyphs(font_name, encoded, self._size_dir(size))  # type: ignore
+                self.metrics.inc("bytes_written", sum(len(png) for png in encoded.values()))  # type: ignore
+
+    def _flag_near_duplicate(self, font_name: str, matches: list[tuple[str, float]]):
+        logger.info(f"{font_name} is a near-duplicate of {', '.join(name for name, _ in matches)}")
+        if font_name in self._flagged:
+            return  # Flagged by a run that stopped before committing it
+        with open(self._flags_path, 'a') as f:
+            f.write(json.dumps({"font": font_name, "matches": matches}) + "\n")
+        self._flagged.add(font_name)
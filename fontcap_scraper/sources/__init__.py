@@ -1,3 +1,5 @@
+from .base import FontMetadata, FontSource, SOURCES, register_source, make_source, unique_names
 from .google_fonts import GoogleFontsSource
+from .local import LocalFontSource
 
-__all__ = ["GoogleFontsSource"]
\ No newline at end of file
+__all__ = ["FontMetadata", "FontSource", "SOURCES", "register_source", "make_source", "unique_names", "GoogleFontsSource", "LocalFontSource"]
@@ -0,0 +1,68 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+
+@dataclass
+class FontMetadata:
+    name: str
+    url: str
+    kind: str
+    category: str
+
+class FontSource(ABC):
+    """
+    A place fonts come from. A source lists its fonts, then reads the bytes of any font it
+    listed. read_font is called from several threads at once, so it must be thread-safe.
+    Sources are built from their entry in the config's font_sources by from_config
+    """
+
+    @classmethod
+    @abstractmethod
+    def from_config(cls, source_cfg: dict, **context) -> "FontSource":
+        """
+        Build the source from its config entry. context carries shared scraper state:
+        session (requests.Session), cache (FontCache or None) and revalidate (bool)
+        """
+
+    @abstractmethod
+    def fetch_font_list(self) -> list[FontMetadata]:
+        """List every font the source offers. url must identify the font uniquely and stably"""
+
+    @abstractmethod
+    def read_font(self, metadata: FontMetadata) -> bytes:
+        """The font's file contents, or b"" if it could not be read"""
+
+    def close(self):
+        """Release anything held open while reading fonts"""
+
+
+def unique_names(font_metadata_list: list[FontMetadata], taken: set[str]) -> list[FontMetadata]:
+    """
+    The fonts, renamed with _2, _3, ... where needed so their names are unique among
+    themselves and not in taken, which the names given are added to. Font names become
+    output directories, so a clash would overwrite another font's glyphs
+    """
+    unique = []
+    for metadata in font_metadata_list:
+        name, n = metadata.name, 1
+        while name in taken:
+            n += 1
+            name = f"{metadata.name}_{n}"
+        taken.add(name)
+        unique.append(metadata if name == metadata.name else replace(metadata, name=name))
+    return unique
+
+
+SOURCES: dict[str, type[FontSource]] = {}
+
+def register_source(name: str):
+    """Class decorator making a source available as font_sources entries with this name"""
+    def register(cls: type[FontSource]) -> type[FontSource]:
+        SOURCES[name] = cls
+        return cls
+    return register
+
+def make_source(source_cfg: dict, **context) -> FontSource:
+    """Build the source named by a font_sources config entry"""
+    if source_cfg["name"] not in SOURCES:
+        raise NotImplementedError(f"Source '{source_cfg['name']}' not implemented")
+    return SOURCES[source_cfg["name"]].from_config(source_cfg, **context)
@@ -1,20 +1,33 @@
 import requests
 from typing import Optional
-from dataclasses import dataclass
+from fontcap_scraper.sources.base import FontMetadata, FontSource, register_source
+# Module import: utils.downloading imports this package while it is being loaded
+from fontcap_scraper.utils import downloading
+from fontcap_scraper.utils.font_cache import FontCache
 
-@dataclass
-class FontMetadata:
-    name: str
-    url: str
-    kind: str
-    category: str
-
-class GoogleFontsSource:
-    def __init__(self, api_url: str, api_key: str):
+@register_source("google_fonts")
+class GoogleFontsSource(FontSource):
+    def __init__(
+            self,
+            api_url: str,
+            api_key: str,
+            session: requests.Session | None = None,
+            cache: FontCache | None = None,
+            revalidate: bool = True):
         if not api_key or not api_url:
             raise Exception("Valid API information is required")
         self.api_url = api_url
         self.api_key = api_key
+        self.session = session
+        self.cache = cache
+        self.revalidate = revalidate
+
+    @classmethod
+    def from_config(cls, source_cfg: dict, **context) -> "GoogleFontsSource":
+        return cls(source_cfg["url"], source_cfg["api_key"], **context)
+
+    def read_font(self, metadata: FontMetadata) -> bytes:
+        return downloading.download_font_file(metadata.url, self.session, self.cache, self.revalidate, metadata.name)
 
     def fetch_font_list(self) -> list[FontMetadata]:
         """Fetch list of fonts from Google Fonts API."""
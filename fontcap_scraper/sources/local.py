@@ -0,0 +1,172 @@
+import logging
+import os
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from fontcap_scraper.sources.base import FontMetadata, FontSource, register_source, unique_names
+
+logger = logging.getLogger(__name__)
+
+"""
+Fonts already on disk: loose font files, and fonts inside zip and tar archives. Archives are
+never extracted, members are read straight out of them
+"""
+
+FONT_SUFFIXES = (".ttf", ".otf")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def _is_font(name: str) -> bool:
+    return name.lower().endswith(FONT_SUFFIXES)
+
+
+def _archive_kind(name: str) -> str | None:
+    name = name.lower()
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith(TAR_SUFFIXES):
+        return "tar"
+    return None
+
+
+@dataclass
+class _Location:
+    """Where a listed font's bytes are"""
+    path: Path
+    member: str | None = None  # Name inside a zip or tar archive
+    tarinfo: tarfile.TarInfo | None = None  # For members of compressed tars
+    offset: int | None = None  # Data offset of a member of an uncompressed tar
+    size: int = 0
+
+
+@register_source("local")
+class LocalFontSource(FontSource):
+    """
+    Scans the configured files and directories (recursively) for .ttf/.otf files and
+    zip/tar archives. Directories and archive listings are scanned on scan_workers threads.
+    Members of zips and compressed tars are read through one archive handle per reading
+    thread. Uncompressed tar members are read directly at their offset in the file
+    """
+
+    def __init__(self, paths: list[Path], scan_workers: int = 8):
+        self.paths = [Path(p).expanduser() for p in paths]
+        self.scan_workers = scan_workers
+        self._locations: dict[str, _Location] = {}
+        self._local = threading.local()
+        self._handles = []
+        self._handles_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Archive handles are per thread and per process, e.g. in DataLoader workers
+        state = self.__dict__.copy()
+        state.update(_local=None, _handles=[], _handles_lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._handles_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, source_cfg: dict, **context) -> "LocalFontSource":
+        # Nothing is downloaded, so the session and cache aren't needed
+        return cls(source_cfg["paths"], source_cfg.get("scan_workers", 8))
+
+    def fetch_font_list(self) -> list[FontMetadata]:
+        with ThreadPoolExecutor(max_workers=self.scan_workers, thread_name_prefix="scan") as pool:
+            files = [path for found in pool.map(self._walk, self.paths) for path in found]
+            locations = [_Location(path, size=path.stat().st_size) for path in files if _is_font(path.name)]
+            archives = [path for path in files if _archive_kind(path.name)]
+            for members in pool.map(self._scan_archive, archives):
+                locations.extend(members)
+        logger.info(f"Found {len(locations)} font files under {len(self.paths)} paths ({len(archives)} archives)")
+
+        font_list = []
+        self._locations = {}
+        for location in locations:
+            url = location.path.resolve().as_uri()
+            if location.member is not None:
+                url += f"!/{location.member}"
+            name = Path(location.member or location.path.name).stem.replace(" ", "_")
+            self._locations[url] = location
+            font_list.append(FontMetadata(name=name, url=url, kind="local", category=""))
+        # Unique within the scan. run_scraper also keeps them clear of other sources' and earlier runs' fonts
+        return unique_names(font_list, set())
+
+    @staticmethod
+    def _walk(root: Path) -> list[Path]:
+        if root.is_file():
+            return [root]
+        if not root.is_dir():
+            logger.warning(f"Font path {root} does not exist")
+            return []
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            files.extend(Path(dirpath) / name for name in sorted(filenames)
+                         if _is_font(name) or _archive_kind(name))
+        return files
+
+    @staticmethod
+    def _scan_archive(path: Path) -> list[_Location]:
+        try:
+            if _archive_kind(path.name) == "zip":
+                with zipfile.ZipFile(path) as zf:
+                    return [_Location(path, info.filename, size=info.file_size)
+                            for info in zf.infolist() if not info.is_dir() and _is_font(info.filename)]
+            try:
+                tf = tarfile.open(path, "r:")
+                compressed = False
+            except tarfile.ReadError:
+                tf = tarfile.open(path, "r:*")
+                compressed = True
+            with tf:
+                return [_Location(path, m.name, tarinfo=m if compressed else None,
+                                  offset=None if compressed else m.offset_data, size=m.size)
+                        for m in tf if m.isfile() and _is_font(m.name)]
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            logger.warning(f"Could not read archive {path}: {e}")
+            return []
+
+    def _archive(self, path: Path):
+        """This thread's open handle on an archive"""
+        handles = getattr(self._local, "archives", None)
+        if handles is None:
+            handles = self._local.archives = {}
+        if path not in handles:
+            handle = zipfile.ZipFile(path) if _archive_kind(path.name) == "zip" else tarfile.open(path, "r:*")
+            handles[path] = handle
+            with self._handles_lock:
+                self._handles.append(handle)
+        return handles[path]
+
+    def read_font(self, metadata: FontMetadata) -> bytes:
+        location = self._locations.get(metadata.url)
+        if location is None:
+            logger.warning(f"{metadata.url} was not listed by this source")
+            return b""
+        try:
+            if location.member is None:
+                return location.path.read_bytes()
+            if location.offset is not None:
+                with open(location.path, 'rb') as f:
+                    f.seek(location.offset)
+                    return f.read(location.size)
+            archive = self._archive(location.path)
+            if isinstance(archive, zipfile.ZipFile):
+                return archive.read(location.member)
+            # Extracting by TarInfo seeks straight to the member instead of listing the archive again
+            return archive.extractfile(location.tarinfo).read()
+        except (OSError, zipfile.BadZipFile, tarfile.TarError, KeyError) as e:
+            logger.warning(f"Failed to read font {metadata.url}: {e}")
+            return b""
+
+    def close(self):
+        with self._handles_lock:
+            for handle in self._handles:
+                handle.close()
+            self._handles = []
+        self._local = threading.local()
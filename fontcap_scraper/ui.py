@@ -8,6 +8,9 @@ from PIL import Image
 from random import shuffle
 import io
 from base64 import b64encode
+import sys
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # streamlit only puts this file's directory on the path
+from fontcap_scraper.utils import PackedGlyphStore, is_resolution_dir
 
 """
 Simple streamlit UI to view the fonts. Usage: streamlit run fontcap_scraper/ui.py
@@ -16,9 +19,23 @@ Simple streamlit UI to view the fonts. Usage: streamlit run fontcap_scraper/ui.p
 # TODO make these configurable
 DATA_ROOT = Path("data/fonts")
 INDEX_FILE = DATA_ROOT / "index.json"
+UPPERCASE = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+LOWERCASE = "abcdefghijklmnopqrstuvwxyz"
+
+def load_packed_fonts(store: PackedGlyphStore, limit: int = 100) -> list:
+    font_idxs = list(range(len(store)))
+    shuffle(font_idxs)
+    font_data = []
+    for font_idx in font_idxs[:limit]:
+        glyphs = store.font_glyphs(font_idx)
+        font_data.append({
+            "name": store.fonts[font_idx]["name"],
+            "images": {c: Image.fromarray(glyphs[store.char_index(c)]) for c in store.present_chars(font_idx)}
+        })
+    return font_data
 
 def load_fonts_metadata(font_root: Path, limit: int = 100) -> list:
-    font_dirs = [d for d in font_root.iterdir() if d.is_dir()]
+    font_dirs = [d for d in font_root.iterdir() if d.is_dir() and not is_resolution_dir(d)]
     shuffle(font_dirs)  # random order
     selected = font_dirs[:limit]
 
@@ -31,12 +48,17 @@ def load_fonts_metadata(font_root: Path, limit: int = 100) -> list:
         font_data.append({
             "name": font_name,
             "path": font_dir,
-            "glyphs": glyph_files
+            "glyphs": glyph_files,
+            "images": {c: Image.open(font_dir / f"{ord(c)}.png") for c in UPPERCASE + LOWERCASE
+                       if (font_dir / f"{ord(c)}.png").exists()}
         })
     return font_data
 
 max_fonts = st.sidebar.number_input("Number of fonts to display", min_value=1, max_value=500, value=100)
-fonts = load_fonts_metadata(DATA_ROOT, limit=max_fonts)
+if PackedGlyphStore.is_packed(DATA_ROOT):
+    fonts = load_packed_fonts(PackedGlyphStore(DATA_ROOT), limit=max_fonts)
+else:
+    fonts = load_fonts_metadata(DATA_ROOT, limit=max_fonts)
 
 st.markdown("""
     <style>
@@ -80,8 +102,8 @@ def render_glyph_row(images: list[Image.Image], label: str, top_margin: int = 50
 for font in fonts:
     st.markdown(f"### {font['name']}")
 
-    uppercase = [Image.open(font["path"] / f"{ord(c)}.png") for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ" if (font["path"] / f"{ord(c)}.png").exists()]
-    lowercase = [Image.open(font["path"] / f"{ord(c)}.png") for c in "abcdefghijklmnopqrstuvwxyz" if (font["path"] / f"{ord(c)}.png").exists()]
+    uppercase = [font["images"][c] for c in UPPERCASE if c in font["images"]]
+    lowercase = [font["images"][c] for c in LOWERCASE if c in font["images"]]
 
     render_glyph_row(uppercase, "Uppercase") # type: ignore
     render_glyph_row(lowercase, "Lowercase") # type: ignore
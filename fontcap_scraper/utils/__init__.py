@@ -1,7 +1,19 @@
-from .rendering import render_glyphs, save_glyphs
+from .rendering import render_glyphs, load_font, render_with_font, render_pyramid, downsample_glyphs, blank_chars, save_glyphs, encode_glyphs, save_encoded_glyphs, glyphs_to_array
 from .deduplication import font_hash, load_known_hashes, update_known_hashes
+from .downloading import make_session, download_font_file, fetch_fonts
+from .font_cache import FontCache
+from .journal import ScrapeJournal
+from .glyph_store import PackedGlyphStore, resolution_dir, is_resolution_dir
+from .near_duplicates import glyph_fingerprint, NearDuplicateIndex
+from .metrics import ScrapeMetrics, MetricsReporter
+from .manifest import DatasetManifest
 
 __all__ = [
-    "render_glyphs", "save_glyphs",
-    "font_hash", "load_known_hashes", "update_known_hashes"
+    "render_glyphs", "load_font", "render_with_font", "render_pyramid", "downsample_glyphs", "blank_chars", "save_glyphs", "encode_glyphs", "save_encoded_glyphs", "glyphs_to_array",
+    "font_hash", "load_known_hashes", "update_known_hashes",
+    "make_session", "download_font_file", "fetch_fonts",
+    "FontCache", "ScrapeJournal", "PackedGlyphStore", "resolution_dir", "is_resolution_dir",
+    "glyph_fingerprint", "NearDuplicateIndex",
+    "ScrapeMetrics", "MetricsReporter",
+    "DatasetManifest"
 ]
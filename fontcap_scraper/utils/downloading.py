@@ -0,0 +1,94 @@
+import logging
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from fontcap_scraper.sources.base import FontMetadata
+from fontcap_scraper.utils.font_cache import FontCache
+from fontcap_scraper.utils.metrics import ScrapeMetrics
+
+logger = logging.getLogger(__name__)
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """Session whose connection pool can serve pool_size concurrent downloads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_font_file(
+        url: str,
+        session: requests.Session | None = None,
+        cache: FontCache | None = None,
+        revalidate: bool = True,
+        name: str | None = None) -> bytes:
+    """
+    Attemps to download the font .tff file. With a cache, a previously seen URL is
+    revalidated with a conditional request (or not at all if revalidate is False), and
+    its bytes are read from disk unless the server reports a change
+    """
+    record = cache.lookup(url) if cache else None
+    cached = cache.read(record["sha256"]) if cache and record else None
+    if cached is not None and not revalidate:
+        return cached
+
+    headers = cache.conditional_headers(record) if cache and record and cached is not None else {}
+    getter = session if session is not None else requests
+    try:
+        response = getter.get(url, headers=headers, timeout=10)
+        if response.status_code == 304 and cached is not None:
+            return cached
+        response.raise_for_status()
+    except requests.RequestException as e:
+        if cached is not None:
+            logger.warning(f"Could not revalidate {url}, using cached copy: {e}")
+            return cached
+        logger.warning(f"Failed to download font from {url}: {e}")
+        return b""
+
+    if cache:
+        cache.store(url, response.content, name=name,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"))
+    return response.content
+
+
+def fetch_fonts(
+        read_font: Callable[[FontMetadata], bytes],
+        font_metadata_list: Iterable[FontMetadata],
+        max_concurrency: int,
+        metrics: ScrapeMetrics | None = None) -> Iterator[tuple[FontMetadata, bytes]]:
+    """
+    Read fonts with read_font (e.g. a source's read_font) on a bounded thread pool, yielding
+    (metadata, bytes) in the order of font_metadata_list. At most 2 * max_concurrency reads are
+    held at once, so a slow consumer doesn't cause the whole source to be buffered in memory
+    """
+    if metrics is not None:
+        untimed = read_font
+
+        def read_font(metadata: FontMetadata) -> bytes:
+            start = time.perf_counter()
+            font_bytes = untimed(metadata)
+            metrics.observe_stage("fetch", time.perf_counter() - start)
+            metrics.inc("fonts_fetched")
+            metrics.inc("bytes_fetched", len(font_bytes))
+            return font_bytes
+
+    window = 2 * max_concurrency
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="fetch") as pool:
+        # Reads run ahead of the consumer but are handed over in list order, so which of two
+        # identical fonts is kept doesn't depend on which finished downloading first
+        pending = deque()
+        for metadata in font_metadata_list:
+            pending.append((metadata, pool.submit(read_font, metadata)))
+            if len(pending) >= window:
+                metadata, future = pending.popleft()
+                yield metadata, future.result()
+        while pending:
+            metadata, future = pending.popleft()
+            yield metadata, future.result()
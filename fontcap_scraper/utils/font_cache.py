@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+from collections.abc import Iterator
+from hashlib import sha256
+from pathlib import Path
+
+"""
+Local content-addressed store of raw font files, so re-scrapes and re-renders
+don't have to go back to the network
+"""
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class FontCache:
+    """
+    Font files are stored once under objects/<sha256[:2]>/<sha256>. Each URL gets a
+    small JSON record under urls/ holding the sha256 of its current contents, the
+    font name, and the ETag/Last-Modified headers used to revalidate it
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.urls_dir = self.root / "urls"
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def _record_path(self, url: str) -> Path:
+        return self.urls_dir / f"{sha256(url.encode()).hexdigest()}.json"
+
+    def lookup(self, url: str) -> dict | None:
+        """The cache record for url, if it has been downloaded before"""
+        path = self._record_path(url)
+        if not path.exists():
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def read(self, digest: str) -> bytes | None:
+        path = self._object_path(digest)
+        return path.read_bytes() if path.exists() else None
+
+    def store(
+            self,
+            url: str,
+            font_bytes: bytes,
+            name: str | None = None,
+            etag: str | None = None,
+            last_modified: str | None = None) -> str:
+        """Add font_bytes to the store and point url at them. Returns the sha256"""
+        digest = sha256(font_bytes).hexdigest()
+        object_path = self._object_path(digest)
+        if not object_path.exists():
+            _atomic_write(object_path, font_bytes)
+        record = {
+            "url": url,
+            "sha256": digest,
+            "name": name,
+            "etag": etag,
+            "last_modified": last_modified
+        }
+        _atomic_write(self._record_path(url), json.dumps(record).encode())
+        return digest
+
+    def conditional_headers(self, record: dict) -> dict[str, str]:
+        """Request headers to revalidate a cached URL"""
+        headers = {}
+        if record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def records(self) -> Iterator[dict]:
+        """Every cached URL record, e.g. to re-render the corpus without touching the network"""
+        if not self.urls_dir.exists():
+            return
+        for path in self.urls_dir.glob("*.json"):
+            with open(path, 'r') as f:
+                yield json.load(f)
@@ -0,0 +1,165 @@
+import json
+import os
+import re
+from pathlib import Path
+import numpy as np
+
+"""
+Packed glyph storage: one fixed-size uint8 record per font in sharded, memory-mappable
+files, instead of one PNG file per glyph
+"""
+
+META_FILE = "glyph_store.json"
+INDEX_FILE = "fonts.jsonl"
+
+
+def resolution_dir(root: Path, img_size: int) -> Path:
+    """Where glyphs downsampled to img_size are kept, next to the base resolution in root"""
+    return Path(root) / f"{img_size}px"
+
+
+def is_resolution_dir(path: Path) -> bool:
+    return path.is_dir() and re.fullmatch(r"\d+px", path.name) is not None
+
+
+class PackedGlyphStore:
+    """
+    Each shard is a raw file of (len(charset), img_size, img_size) uint8 records, one per
+    font, so a shard can be memory-mapped as a single array. fonts.jsonl maps fonts to
+    their shard and row and lists any characters the font is missing (left white).
+    Records are appended to the shard before the index line is written, so a crash can
+    only leave an unindexed record, which is cut off the next time the store is written to
+    """
+
+    def __init__(
+            self,
+            root: Path,
+            charset: list[str] | None = None,
+            img_size: int | None = None,
+            fonts_per_shard: int = 4096):
+        self.root = Path(root)
+        meta_path = self.root / META_FILE
+        if meta_path.exists():
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if charset is not None and list(charset) != meta["charset"]:
+                raise ValueError(f"Charset does not match the existing store at {self.root}")
+            if img_size is not None and img_size != meta["img_size"]:
+                raise ValueError(f"Image size does not match the existing store at {self.root}")
+        else:
+            if charset is None or img_size is None:
+                raise ValueError(f"No glyph store at {self.root}. charset and img_size are required to create one")
+            meta = {"charset": list(charset), "img_size": img_size, "fonts_per_shard": fonts_per_shard}
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+
+        self.charset: list[str] = meta["charset"]
+        self.img_size: int = meta["img_size"]
+        self.fonts_per_shard: int = meta["fonts_per_shard"]
+        self.record_shape = (len(self.charset), self.img_size, self.img_size)
+        self.record_size = int(np.prod(self.record_shape))
+        self._char_index = {c: i for i, c in enumerate(self.charset)}
+        self._index_size = 0
+        self.fonts: list[dict] = self._load_index()
+        self._shards: dict[int, np.memmap] = {}
+        self._index_file = None
+        self._shard_file = None
+
+    def __getstate__(self):
+        # Memory maps and open files are re-created lazily, e.g. in DataLoader workers
+        state = self.__dict__.copy()
+        state.update(_shards={}, _index_file=None, _shard_file=None)
+        return state
+
+    @staticmethod
+    def is_packed(root: Path) -> bool:
+        return (Path(root) / META_FILE).exists()
+
+    def __len__(self):
+        return len(self.fonts)
+
+    def char_index(self, char: str) -> int:
+        return self._char_index[char]
+
+    def _shard_path(self, shard: int) -> Path:
+        return self.root / f"shard_{shard:05d}.bin"
+
+    def _load_index(self) -> list[dict]:
+        path = self.root / INDEX_FILE
+        if not path.exists():
+            return []
+        fonts = []
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Torn by a crash
+                self._index_size += len(line)
+                fonts.append(json.loads(line))
+        return fonts
+
+    def shard(self, shard: int) -> np.memmap:
+        """Memory-mapped (fonts, chars, img_size, img_size) view of a shard"""
+        if shard not in self._shards:
+            path = self._shard_path(shard)
+            rows = path.stat().st_size // self.record_size
+            self._shards[shard] = np.memmap(path, dtype=np.uint8, mode='r', shape=(rows, *self.record_shape))
+        return self._shards[shard]
+
+    def font_glyphs(self, font_idx: int) -> np.ndarray:
+        """(chars, img_size, img_size) glyphs of a font. A view, nothing is copied"""
+        entry = self.fonts[font_idx]
+        return self.shard(entry["shard"])[entry["row"]]
+
+    def present_chars(self, font_idx: int) -> list[str]:
+        missing = set(self.fonts[font_idx].get("missing", []))
+        return [c for c in self.charset if c not in missing]
+
+    def append(self, font_name: str, glyphs: np.ndarray, missing: list[str] | None = None):
+        """Add a font's (chars, img_size, img_size) uint8 glyph array to the store"""
+        glyphs = np.ascontiguousarray(glyphs, dtype=np.uint8)
+        if glyphs.shape != self.record_shape:
+            raise ValueError(f"Expected glyphs of shape {self.record_shape}, got {glyphs.shape}")
+
+        shard, row = divmod(len(self.fonts), self.fonts_per_shard)
+        if self._shard_file is None or self._shard_file[0] != shard:
+            self._open_shard(shard, row)
+        _, f = self._shard_file  # type: ignore
+        f.write(glyphs.tobytes())
+        f.flush()
+
+        entry = {"name": font_name, "shard": shard, "row": row, "missing": list(missing or [])}
+        if self._index_file is None:
+            self._index_file = open(self.root / INDEX_FILE, 'ab')
+            self._index_file.truncate(self._index_size)
+        line = json.dumps(entry).encode() + b"\n"
+        self._index_file.write(line)
+        self._index_file.flush()
+        self._index_size += len(line)  # So reopening after close() keeps it
+        self.fonts.append(entry)
+        self._shards.pop(shard, None)  # The cached map no longer covers the whole shard
+
+    def _open_shard(self, shard: int, row: int):
+        if self._shard_file is not None:
+            self._shard_file[1].close()
+        path = self._shard_path(shard)
+        f = open(path, 'ab')
+        # Drop anything past the last indexed record
+        f.truncate(row * self.record_size)
+        self._shard_file = (shard, f)
+
+    def flush(self):
+        """Make everything appended so far durable"""
+        for f in (self._shard_file[1] if self._shard_file else None, self._index_file):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self):
+        self.flush()
+        if self._shard_file is not None:
+            self._shard_file[1].close()
+            self._shard_file = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
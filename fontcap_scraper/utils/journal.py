@@ -0,0 +1,102 @@
+import json
+import os
+from pathlib import Path
+
+
+class ScrapeJournal:
+    """
+    Append-only record of committed fonts, one JSON line per font. Each line is flushed
+    and fsynced as soon as the font's glyphs are on disk, so a crash loses at most the font
+    being written. Fonts deliberately left out (e.g. near-duplicates) are recorded too, with
+    their status, so reruns skip them as well; hashes and urls cover every entry. Nothing is
+    ever rewritten: loading replays the lines once, and refresh() only reads lines appended
+    since the last read
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.hashes: set[str] = set()
+        self.urls: set[str] = set()
+        self.names: set[str] = set()  # Of committed fonts
+        self._offset = 0
+        self._file = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> set[str]:
+        """Replay the journal. Returns the known hashes"""
+        self._discard_torn_tail()
+        self.refresh()
+        return self.hashes
+
+    def refresh(self):
+        """Read entries appended since the last load/refresh"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written
+                self._offset += len(line)
+                self._add(json.loads(line))
+
+    def record(self, hsh: str, name: str | None = None, url: str | None = None, status: str | None = None):
+        """Durably append a committed font, or with a status one that was skipped"""
+        entry = {"hash": hsh, "name": name, "url": url}
+        if status is not None:
+            entry["status"] = status
+        self._append([entry])
+
+    def import_hashes(self, hashes: set):
+        """Seed a new journal from a legacy index.json hash list"""
+        self._append([{"hash": hsh, "name": None, "url": None} for hsh in hashes - self.hashes])
+
+    def _append(self, entries: list[dict]):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'ab')
+        data = b"".join(json.dumps(entry).encode() + b"\n" for entry in entries)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._offset += len(data)
+        for entry in entries:
+            self._add(entry)
+
+    def _add(self, entry: dict):
+        self.hashes.add(entry["hash"])
+        if entry.get("url"):
+            self.urls.add(entry["url"])
+        if entry.get("name") and "status" not in entry:
+            self.names.add(entry["name"])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _discard_torn_tail(self):
+        """A crash mid-append can leave a partial last line. Cut it off so appends stay valid"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return
+            # Walk back to the last complete line
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    f.truncate(pos + newline + 1)
+                    return
+            f.truncate(0)
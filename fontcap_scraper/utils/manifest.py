@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from fontcap_scraper.utils.glyph_store import is_resolution_dir
+
+logger = logging.getLogger(__name__)
+
+"""
+Manifest of a scraped PNG tree: which glyphs each font has, so readers don't have to probe
+every <font>/<ord>.png on startup
+"""
+
+MANIFEST_FILE = "manifest.json"
+# Scraper bookkeeping that changes whenever fonts are committed
+INDEX_FILES = ("journal.jsonl", "index.json")
+
+
+def _scan_font_dir(path: str) -> list[str]:
+    """Chars with a glyph file in a font directory, from a single directory listing"""
+    chars = []
+    with os.scandir(path) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            if ext == ".png" and stem.isdigit():
+                chars.append(chr(int(stem)))
+    return sorted(chars)
+
+
+class DatasetManifest:
+    """
+    Fonts of a PNG tree and the chars each one has, saved to <root>/manifest.json.
+    Loading lists the root directory once. The saved manifest is trusted as-is while the
+    same font directories exist and the scraper's journal/index is unchanged. Otherwise each
+    font directory is stat'ed, and only those whose mtime changed are listed again. (The
+    root's own mtime can't be used, since saving the manifest changes it)
+    """
+
+    def __init__(self, root: Path, fonts: dict[str, dict], signature: dict):
+        self.root = Path(root)
+        self._fonts = fonts  # name -> {"mtime": ns, "chars": [...]}
+        self.signature = signature
+        self.fonts: dict[str, set[str]] = {name: set(entry["chars"]) for name, entry in fonts.items()}
+
+    def __len__(self):
+        return len(self.fonts)
+
+    def font_dir(self, font_name: str) -> Path:
+        return self.root / font_name
+
+    def glyph_path(self, font_name: str, char: str) -> Path:
+        return self.root / font_name / f"{ord(char)}.png"
+
+    def font_mtime(self, font_name: str) -> int:
+        """mtime_ns of the font's directory when it was last scanned"""
+        return self._fonts[font_name]["mtime"]
+
+    @staticmethod
+    def _signature(root: Path) -> dict:
+        roots = [root, root.parent] if is_resolution_dir(root) else [root]
+        signature = {}
+        for base in roots:
+            for name in INDEX_FILES:
+                path = base / name
+                if path.exists():
+                    stat = path.stat()
+                    signature[str(path)] = [stat.st_size, stat.st_mtime_ns]
+        return signature
+
+    @classmethod
+    def load(cls, root: Path, refresh: bool = False, max_workers: int = 16) -> "DatasetManifest":
+        """
+        The manifest of root, rescanning whatever changed since it was saved. refresh=True
+        always checks every font directory's mtime, to pick up edits made by hand
+        """
+        root = Path(root)
+        path = root / MANIFEST_FILE
+        signature = cls._signature(root)
+        with os.scandir(root) as it:
+            font_dirs = sorted((entry for entry in it if entry.is_dir() and not is_resolution_dir(Path(entry.path))),
+                               key=lambda entry: entry.name)
+        saved = {}
+        if path.exists():
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                saved = data["fonts"]
+                if not refresh and data["signature"] == signature and list(saved) == [entry.name for entry in font_dirs]:
+                    return cls(root, saved, signature)
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+                saved = {}
+
+        fonts, stale = {}, []
+        for entry in font_dirs:
+            mtime = entry.stat().st_mtime_ns
+            if entry.name in saved and saved[entry.name]["mtime"] == mtime:
+                fonts[entry.name] = saved[entry.name]
+            else:
+                fonts[entry.name] = {"mtime": mtime, "chars": []}
+                stale.append(entry.name)
+        # Listings are I/O bound, and slow on network filesystems, so overlap them
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for name, chars in zip(stale, pool.map(_scan_font_dir, (str(root / name) for name in stale))):
+                fonts[name]["chars"] = chars
+        logger.info(f"Manifest of {root}: {len(fonts)} fonts, {len(stale)} rescanned")
+
+        manifest = cls(root, fonts, signature)
+        manifest.save()
+        return manifest
+
+    def save(self):
+        path = self.root / MANIFEST_FILE
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({"signature": self.signature, "fonts": self._fonts}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            # Read-only datasets still work, they are just scanned every time
+            logger.warning(f"Could not save manifest to {path}: {e}")
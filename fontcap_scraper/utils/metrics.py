@@ -0,0 +1,195 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+"""
+Scrape instrumentation: counters, per-stage timers, failures by reason and a render latency
+histogram, reported as JSON or Prometheus text
+"""
+
+RENDER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus expects"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        total = 0
+        out = []
+        for bound, count in zip((*self.buckets, math.inf), self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return bound if bound != math.inf else self.max
+        return self.max
+
+
+class ScrapeMetrics:
+    """
+    Thread-safe scrape metrics. Stage times are summed over calls, so stages that run on a
+    pool (fetch, render) can add up to more than the wall time
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters: dict[str, float] = defaultdict(int)
+        self.stage_seconds: dict[str, float] = defaultdict(float)
+        self.stage_calls: dict[str, int] = defaultdict(int)
+        self.failures: dict[str, int] = defaultdict(int)
+        self.render_latency = Histogram(RENDER_BUCKETS)
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def failure(self, reason: str):
+        with self._lock:
+            self.failures[reason] += 1
+
+    def observe_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+
+    def observe_render(self, seconds: float):
+        with self._lock:
+            self.render_latency.observe(seconds)
+        self.observe_stage("render", seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            hist = self.render_latency
+            return {
+                "elapsed_seconds": elapsed,
+                "fonts_per_second": self.counters["fonts_committed"] / elapsed if elapsed else 0.0,
+                "fetched_per_second": self.counters["fonts_fetched"] / elapsed if elapsed else 0.0,
+                "counters": dict(self.counters),
+                "stages": {stage: {"seconds": seconds, "calls": self.stage_calls[stage]}
+                           for stage, seconds in self.stage_seconds.items()},
+                "failures": dict(self.failures),
+                "render_latency": {
+                    "count": hist.count, "sum": hist.sum, "max": hist.max,
+                    "p50": hist.quantile(0.5), "p95": hist.quantile(0.95), "p99": hist.quantile(0.99),
+                    "buckets": [[bound if bound != math.inf else "+Inf", total] for bound, total in hist.cumulative()],
+                },
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = "fontcap_scrape") -> str:
+        snap = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_elapsed_seconds gauge",
+            f"{prefix}_elapsed_seconds {snap['elapsed_seconds']}",
+            f"# TYPE {prefix}_fonts_per_second gauge",
+            f"{prefix}_fonts_per_second {snap['fonts_per_second']}",
+        ]
+        for name, value in sorted(snap["counters"].items()):
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+        lines.append(f"# TYPE {prefix}_stage_seconds_total counter")
+        lines += [f'{prefix}_stage_seconds_total{{stage="{stage}"}} {s["seconds"]}' for stage, s in sorted(snap["stages"].items())]
+        lines.append(f"# TYPE {prefix}_stage_calls_total counter")
+        lines += [f'{prefix}_stage_calls_total{{stage="{stage}"}} {s["calls"]}' for stage, s in sorted(snap["stages"].items())]
+        lines.append(f"# TYPE {prefix}_failures_total counter")
+        lines += [f'{prefix}_failures_total{{reason="{reason}"}} {count}' for reason, count in sorted(snap["failures"].items())]
+        hist = snap["render_latency"]
+        lines.append(f"# TYPE {prefix}_render_seconds histogram")
+        lines += [f'{prefix}_render_seconds_bucket{{le="{bound}"}} {total}' for bound, total in hist["buckets"]]
+        lines += [f"{prefix}_render_seconds_sum {hist['sum']}", f"{prefix}_render_seconds_count {hist['count']}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path):
+        """Write a report, as Prometheus text if path ends in .prom and JSON otherwise"""
+        path = Path(path)
+        text = self.to_prometheus() if path.suffix == ".prom" else self.to_json()
+        # Replace atomically, so whatever polls the file never reads half a report
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        stages = ", ".join(f"{stage} {s['seconds']:.1f}s" for stage, s in sorted(snap["stages"].items()))
+        failures = ", ".join(f"{reason} {count}" for reason, count in sorted(snap["failures"].items())) or "none"
+        return (f"{int(snap['counters'].get('fonts_committed', 0))} fonts committed in {snap['elapsed_seconds']:.1f}s "
+                f"({snap['fonts_per_second']:.2f}/s). Stages: {stages}. Failures: {failures}")
+
+
+class MetricsReporter:
+    """
+    Writes the metrics report to path every interval seconds on a background thread, and once
+    more on exit, when a summary is also logged. Without a path only the summary is logged
+    """
+
+    def __init__(self, metrics: ScrapeMetrics, path: Path | None, interval: float | None = None):
+        self.metrics = metrics
+        self.path = Path(path) if path else None
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.interval and self.path:
+            self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.path:
+            self.metrics.write(self.path)
+        logger.info(self.metrics.summary())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.metrics.write(self.path)
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self.path}: {e}")
@@ -0,0 +1,94 @@
+from pathlib import Path
+import numpy as np
+
+"""
+Perceptual near-duplicate detection. font_hash only catches byte-identical files, so forks,
+re-releases and "Display" variants of a family get through. These are caught by comparing
+fingerprints of the rendered glyphs, looked up through a locality-sensitive hash index
+"""
+
+
+def glyph_fingerprint(glyphs: np.ndarray, grid: int = 8) -> np.ndarray:
+    """
+    Average hash of a (chars, S, S) glyph array: each glyph is area-averaged to grid x grid and
+    thresholded at its own mean. Returns len(charset) * grid * grid bits, packed into uint8
+    """
+    n, size, _ = glyphs.shape
+    edges = (np.arange(grid) * size) // grid
+    counts = np.diff(np.append(edges, size))
+    sums = np.add.reduceat(np.add.reduceat(glyphs.astype(np.float32), edges, axis=1), edges, axis=2)
+    small = sums / (counts[:, None] * counts[None, :])
+    ink = small < small.mean(axis=(1, 2), keepdims=True)
+    return np.packbits(ink.reshape(-1))
+
+
+class NearDuplicateIndex:
+    """
+    Bit-sampling LSH over fingerprints, for Hamming distance. Each of num_tables tables keys
+    fingerprints on a fixed random sample of bits_per_table bits, so similar fingerprints
+    share a bucket in at least one table with high probability. Only bucket-mates are
+    compared exactly, so queries don't scan the whole index. Distances are the fraction
+    of differing bits. Most bits are background, so unrelated fonts are often only ~0.1
+    apart, and weights of one family ~0.04. The defaults find fonts within 0.03 with ~97%
+    probability, while fonts 0.08 apart share a bucket only ~10% of the time
+    """
+
+    def __init__(
+            self,
+            num_bits: int,
+            threshold: float = 0.03,
+            num_tables: int = 24,
+            bits_per_table: int = 64,
+            seed: int = 0):
+        self.num_bits = num_bits
+        self.threshold = threshold
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self._samples = [rng.choice(num_bits, size=bits_per_table, replace=False) for _ in range(num_tables)]
+        self._tables: list[dict[bytes, list[int]]] = [{} for _ in range(num_tables)]
+        self.names: list[str] = []
+        self._fingerprints: list[np.ndarray] = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def _keys(self, fingerprint: np.ndarray) -> list[bytes]:
+        bits = np.unpackbits(fingerprint, count=self.num_bits)
+        return [np.packbits(bits[sample]).tobytes() for sample in self._samples]
+
+    def query(self, fingerprint: np.ndarray) -> list[tuple[str, float]]:
+        """Indexed fonts within threshold of fingerprint, as (name, distance), closest first"""
+        candidates = set()
+        for table, key in zip(self._tables, self._keys(fingerprint)):
+            candidates.update(table.get(key, ()))
+        matches = []
+        for i in candidates:
+            distance = np.unpackbits(self._fingerprints[i] ^ fingerprint, count=self.num_bits).sum() / self.num_bits
+            if distance <= self.threshold:
+                matches.append((self.names[i], float(distance)))
+        return sorted(matches, key=lambda m: m[1])
+
+    def add(self, name: str, fingerprint: np.ndarray):
+        i = len(self.names)
+        self.names.append(name)
+        self._fingerprints.append(fingerprint)
+        for table, key in zip(self._tables, self._keys(fingerprint)):
+            table.setdefault(key, []).append(i)
+
+    def save(self, path: Path):
+        fingerprints = np.stack(self._fingerprints) if self._fingerprints else np.zeros((0, 0), dtype=np.uint8)
+        with open(path, 'wb') as f:
+            np.savez(f, names=np.array(self.names, dtype=str), fingerprints=fingerprints,
+                     num_bits=self.num_bits, threshold=self.threshold,
+                     tables=len(self._tables), bits_per_table=len(self._samples[0]), seed=self.seed)
+
+    @classmethod
+    def load(cls, path: Path, threshold: float | None = None) -> "NearDuplicateIndex":
+        """Load a saved index. The buckets are rebuilt, which is linear in the number of fonts"""
+        data = np.load(path)
+        threshold = float(data["threshold"]) if threshold is None else threshold
+        index = cls(int(data["num_bits"]), threshold, int(data["tables"]),
+                    int(data["bits_per_table"]), int(data["seed"]))
+        for name, fingerprint in zip(data["names"], data["fingerprints"]):
+            index.add(str(name), fingerprint)
+        return index
@@ -2,45 +2,131 @@ import logging
 from pathlib import Path
 from PIL import Image, ImageFont, ImageDraw
 import io
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
-def render_glyphs(
-        font_bytes: bytes, 
-        charset: list[str], 
-        img_size: int, 
-        font_size: int) -> dict[str, Image.Image] | None:
-    """Render the pulled files"""
+def load_font(font_bytes: bytes, font_size: int) -> ImageFont.FreeTypeFont | None:
+    """A font file loaded at font_size for render_with_font, or None if it can't be read"""
     try:
-        font = ImageFont.truetype(io.BytesIO(font_bytes), font_size)
+        # Lone glyphs need no shaping, so skip Raqm even where it's installed
+        return ImageFont.truetype(io.BytesIO(font_bytes), font_size, layout_engine=ImageFont.Layout.BASIC)
     except Exception as e:
         logger.warning(f"Could not load font: {e}")
         return None
 
-    glyphs = {}
-    for char in charset:
+def render_with_font(
+        font: ImageFont.FreeTypeFont,
+        charset: list[str],
+        img_size: int) -> np.ndarray | None:
+    """render_glyphs for a font that is already loaded, e.g. to render a few glyphs at a time"""
+    glyphs = np.full((len(charset), img_size, img_size), 255, dtype=np.uint8)
+    for i, char in enumerate(charset):
         try:
-            img = Image.new("L", (img_size, img_size), color=255)
-            draw = ImageDraw.Draw(img)
-            bbox = draw.textbbox((0, 0), char, font=font)
-            if bbox is None:
-                continue
-            w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
-            draw.text(
-                ((img_size - w) / 2 - bbox[0], (img_size - h) / 2 - bbox[1]),
-                char, font=font, fill=0
-            )
-            glyphs[char] = img
+            mask, _ = font.getmask2(char, mode="L")
         # Sometimes there are random exceptions...
         except Exception as e:
             logger.warning(f"Rendering failed for char {repr(char)}: {e}")
             return None
-    return glyphs if glyphs else None
+        w, h = mask.size
+        if not w or not h:
+            continue
+        # getmask2 hands back a bare core image. Wrap it so NumPy can read the buffer directly
+        coverage = np.asarray(Image.Image()._new(mask))
+
+        # Top-left corner of the centred bitmap (half pixels round up, as draw.text did),
+        # then clip both sides to the image
+        x, y = (img_size - w + 1) // 2, (img_size - h + 1) // 2
+        src_x, src_y = max(0, -x), max(0, -y)
+        dst_x, dst_y = max(0, x), max(0, y)
+        cw, ch = min(w - src_x, img_size - dst_x), min(h - src_y, img_size - dst_y)
+        glyphs[i, dst_y:dst_y + ch, dst_x:dst_x + cw] = 255 - coverage[src_y:src_y + ch, src_x:src_x + cw]
+    return glyphs
+
+def render_glyphs(
+        font_bytes: bytes, 
+        charset: list[str], 
+        img_size: int, 
+        font_size: int) -> np.ndarray | None:
+    """
+    Render the charset into a (len(charset), img_size, img_size) uint8 array, black on white.
+    Each glyph is rasterised once with getmask2, whose offset and size are the glyph's bbox,
+    and its coverage is written centred (on whole pixels) into a preallocated array.
+    Anything that doesn't fit in img_size is clipped
+    """
+    font = load_font(font_bytes, font_size)
+    return render_with_font(font, charset, img_size) if font is not None else None
 
-def save_glyphs(font_name: str, glyphs: dict[str, Image.Image], output_dir: Path):
+def downsample_glyphs(glyphs: np.ndarray, img_size: int) -> np.ndarray:
+    """Area-average (chars, S, S) glyphs down to (chars, img_size, img_size). S must be a multiple of img_size"""
+    n, size, _ = glyphs.shape
+    if size % img_size:
+        raise ValueError(f"Cannot downsample {size}px glyphs to {img_size}px")
+    factor = size // img_size
+    blocks = glyphs.reshape(n, img_size, factor, img_size, factor)
+    return np.rint(blocks.mean(axis=(2, 4), dtype=np.float32)).astype(np.uint8)
+
+def render_pyramid(
+        font_bytes: bytes,
+        charset: list[str],
+        img_size: int,
+        font_size: int,
+        img_sizes: list[int]) -> dict[int, np.ndarray] | None:
+    """Render once at img_size and derive each of img_sizes from it. Keyed by size"""
+    glyphs = render_glyphs(font_bytes, charset, img_size, font_size)
+    if glyphs is None:
+        return None
+    pyramid = {img_size: glyphs}
+    for size in img_sizes:
+        if size not in pyramid:
+            pyramid[size] = downsample_glyphs(glyphs, size)
+    return pyramid
+
+def blank_chars(glyphs: np.ndarray, charset: list[str]) -> list[str]:
+    """Chars the font drew nothing for"""
+    has_ink = (glyphs < 255).any(axis=(1, 2))
+    return [char for char, inked in zip(charset, has_ink) if not inked]
+
+def save_glyphs(font_name: str, glyphs: np.ndarray, charset: list[str], output_dir: Path):
     font_dir = output_dir / font_name
     font_dir.mkdir(parents=True, exist_ok=True)
 
-    for char, img in glyphs.items():
+    missing = set(blank_chars(glyphs, charset))
+    for char, arr in zip(charset, glyphs):
+        if char in missing:
+            continue
         img_path = font_dir / f"{ord(char)}.png" # Note the ord(char)
-        img.save(img_path, format="PNG")
+        Image.fromarray(arr).save(img_path, format="PNG")
+
+def encode_glyphs(glyphs: np.ndarray, charset: list[str], missing: list[str] | None = None) -> dict[str, bytes]:
+    """PNG-encode rendered glyphs, so they can be shipped out of a worker process cheaply. Missing glyphs are dropped"""
+    missing = set(blank_chars(glyphs, charset) if missing is None else missing)
+    encoded = {}
+    for char, arr in zip(charset, glyphs):
+        if char in missing:
+            continue
+        buf = io.BytesIO()
+        Image.fromarray(arr).save(buf, format="PNG")
+        encoded[char] = buf.getvalue()
+    return encoded
+
+def save_encoded_glyphs(font_name: str, encoded: dict[str, bytes], output_dir: Path):
+    font_dir = output_dir / font_name
+    font_dir.mkdir(parents=True, exist_ok=True)
+
+    for char, png in encoded.items():
+        (font_dir / f"{ord(char)}.png").write_bytes(png)
+
+def glyphs_to_array(
+        glyphs: dict[str, Image.Image],
+        charset: list[str],
+        img_size: int) -> tuple[np.ndarray, list[str]]:
+    """Stack glyph images into a (len(charset), img_size, img_size) uint8 array. Missing glyphs are left white"""
+    arr = np.full((len(charset), img_size, img_size), 255, dtype=np.uint8)
+    missing = []
+    for i, char in enumerate(charset):
+        if char in glyphs:
+            arr[i] = np.asarray(glyphs[char], dtype=np.uint8)
+        else:
+            missing.append(char)
+    return arr, missing
@@ -0,0 +1,36 @@
+import torch
+from fontcap_model.callbacks import EarlyStopping
+
+
+class _Trainer:
+    """Just enough of a Trainer for EarlyStopping, with scripted validation losses"""
+
+    def __init__(self, losses: list[float]):
+        self.losses = iter(losses)
+        self.optimizer = torch.optim.SGD([torch.zeros(1, requires_grad=True)], lr=1.0)
+        self.test_loader = [(torch.zeros(2, 1, 4, 4), torch.zeros(2, 1, 4, 4))]
+        self.global_step = 0
+        self.stop_training = False
+
+    @property
+    def learning_rate(self) -> float:
+        return self.optimizer.param_groups[0]["lr"]
+
+    def to_device(self, batch):
+        return batch
+
+    def evaluate(self, loader) -> float:
+        return next(self.losses)
+
+
+def test_lr_patience_counts_like_patience():
+    trainer = _Trainer([1.0, 2.0, 2.0, 2.0, 2.0])
+    callback = EarlyStopping(patience=4, lr_patience=2, lr_factor=0.5)
+    callback.on_train_start(trainer)
+    learning_rates = []
+    for epoch in range(1, 6):
+        callback.on_epoch_end(trainer, epoch)
+        learning_rates.append(trainer.learning_rate)
+    # Lowered after the 2nd validation without improvement, stopped after the 4th
+    assert learning_rates == [1.0, 1.0, 0.5, 0.5, 0.25]
+    assert trainer.stop_training
@@ -0,0 +1,61 @@
+import socket
+from pathlib import Path
+import torch
+from torch.utils.data import TensorDataset
+from fontcap_model.checkpoints import CheckpointManager
+from fontcap_model.dataset import make_loader
+from fontcap_model.distributed import DistributedConfig, launch, get_rank, get_world_size
+from fontcap_model.models import CNNAutoencoder
+from fontcap_model.trainer import Trainer
+from fontcap_model.utils import BatchAugment
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _train_rank(
+        out_dir: str,
+        grad_accum_steps: int = 1,
+        num_epochs: int = 1,
+        augment: bool = False,
+        checkpoint_dir: str | None = None,  # Checkpoints every epoch into it
+        resume_from: str | None = None):  # Checkpoint directory to resume from the end of epoch 1 of
+    torch.manual_seed(0)  # Same initial weights on every rank
+    pairs = torch.rand(2 * 8 * 4, 2, 1, 32, 32)
+    loader = make_loader(TensorDataset(pairs[:, 0], pairs[:, 1]), batch_size=4,
+                         num_replicas=get_world_size(), rank=get_rank())
+    torch.manual_seed(get_rank())  # Different draws on each rank from here on
+    checkpoints = CheckpointManager(Path(checkpoint_dir)) if checkpoint_dir else None
+    trainer = Trainer(CNNAutoencoder(base_channels=4), loader, device="cpu", augment=BatchAugment() if augment else None,
+                      grad_accum_steps=grad_accum_steps, callbacks=[checkpoints] if checkpoints else None, progress=False)
+    if resume_from:
+        checkpoint = next(Path(resume_from).glob("checkpoint_e0001_*.pt"))
+        trainer.load_state_dict(torch.load(checkpoint, weights_only=True))
+    trainer.fit(num_epochs)
+    torch.save(trainer.model.state_dict(), f"{out_dir}/rank{get_rank()}.pt")
+
+
+def _rank_states(tmp_path, **kwargs) -> list[dict]:
+    launch(_train_rank, DistributedConfig(nproc_per_node=2, master_port=_free_port(), threads_per_rank=1),
+           out_dir=str(tmp_path), **kwargs)
+    return [torch.load(tmp_path / f"rank{rank}.pt", weights_only=True) for rank in range(2)]
+
+
+def test_ranks_stay_in_sync_with_partial_last_step(tmp_path):
+    # 8 batches per rank, so with 3 batches per step the epoch ends on a partial step
+    first, second = _rank_states(tmp_path, grad_accum_steps=3)
+    assert first.keys() == second.keys()
+    for key in first:
+        assert torch.equal(first[key], second[key]), key
+
+
+def test_resume_restores_each_ranks_rng(tmp_path):
+    # Augmentation draws from each rank's RNG, so a resume matches only if each rank gets its own back
+    full, _ = _rank_states(tmp_path, num_epochs=2, augment=True, checkpoint_dir=str(tmp_path / "checkpoints"))
+    resumed, _ = _rank_states(tmp_path, num_epochs=2, augment=True,
+                              resume_from=str(tmp_path / "checkpoints"))
+    for key in full:
+        assert torch.equal(full[key], resumed[key]), key
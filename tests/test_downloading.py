@@ -0,0 +1,106 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from fontcap_scraper.sources.base import FontMetadata
+from fontcap_scraper.utils import make_session, download_font_file, fetch_fonts, FontCache
+
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class _FontServer(ThreadingHTTPServer):
+    """Serves fonts[name] at /<name>, with an ETag under /etag/ and a Last-Modified date under /dated/"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _FontHandler)
+        self.fonts: dict[str, bytes] = {}
+        self.requests: list[tuple[str, int]] = []  # (path, status)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _FontHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = self.path.rsplit("/", 1)[-1]
+        font = self.server.fonts.get(name)  # type: ignore
+        if font is None:
+            return self._reply(404)
+        etag = f'"{hash(font)}"'
+        if self.path.startswith("/etag/") and self.headers.get("If-None-Match") == etag:
+            return self._reply(304)
+        if self.path.startswith("/dated/") and self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            return self._reply(304)
+        headers = {"ETag": etag} if self.path.startswith("/etag/") else {}
+        if self.path.startswith("/dated/"):
+            headers["Last-Modified"] = LAST_MODIFIED
+        self._reply(200, font, headers)
+
+    def _reply(self, status: int, body: bytes = b"", headers: dict | None = None):
+        self.server.requests.append((self.path, status))  # type: ignore
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = _FontServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_fonts_downloads_every_font_in_order(server):
+    server.fonts = {f"font{i}.ttf": bytes([i]) * 1000 for i in range(20)}
+    names = [f"font{i}.ttf" for i in range(20)] + ["missing.ttf"]
+    metadata = [FontMetadata(name=name, url=f"{server.url}/{name}", kind="", category="") for name in names]
+    session = make_session(4)
+    fonts = list(fetch_fonts(lambda m: download_font_file(m.url, session), metadata, max_concurrency=4))
+    session.close()
+    assert [m.name for m, _ in fonts] == names
+    assert [font_bytes for _, font_bytes in fonts] == [server.fonts.get(name, b"") for name in names]
+
+
+@pytest.mark.parametrize("route", ["etag", "dated"])
+def test_cached_font_is_revalidated(server, tmp_path, route):
+    server.fonts = {"font.ttf": b"first"}
+    cache = FontCache(tmp_path)
+    url = f"{server.url}/{route}/font.ttf"
+    assert download_font_file(url, cache=cache) == b"first"
+    # Unchanged: the server answers 304 and the bytes come from the cache
+    assert download_font_file(url, cache=cache) == b"first"
+    assert server.requests[-1] == (f"/{route}/font.ttf", 304)
+    # Without revalidation the server isn't asked at all
+    assert download_font_file(url, cache=cache, revalidate=False) == b"first"
+    assert len(server.requests) == 2
+
+
+def test_changed_font_replaces_cached_copy(server, tmp_path):
+    server.fonts = {"font.ttf": b"first"}
+    cache = FontCache(tmp_path)
+    url = f"{server.url}/etag/font.ttf"
+    download_font_file(url, cache=cache)
+    server.fonts = {"font.ttf": b"second"}
+    assert download_font_file(url, cache=cache) == b"second"
+    assert cache.read(cache.lookup(url)["sha256"]) == b"second"  # type: ignore
+
+
+def test_failed_downloads(server, tmp_path):
+    server.fonts = {"font.ttf": b"first"}
+    cache = FontCache(tmp_path)
+    assert download_font_file(f"{server.url}/missing.ttf", cache=cache) == b""
+    url = f"{server.url}/etag/font.ttf"
+    download_font_file(url, cache=cache)
+    # The cached copy is used when the server can't be reached
+    server.shutdown()
+    server.server_close()
+    assert download_font_file(url, cache=cache) == b"first"
@@ -0,0 +1,51 @@
+import io
+import tarfile
+import zipfile
+from fontcap_scraper.sources import LocalFontSource, FontMetadata, unique_names
+from fontcap_scraper.utils import ScrapeJournal
+
+
+def _font_dir(tmp_path):
+    """A loose font, a zip and a tar.gz, with one name repeated across them and a non-font member"""
+    (tmp_path / "fonts").mkdir()
+    (tmp_path / "fonts" / "Loose.ttf").write_bytes(b"loose")
+    with zipfile.ZipFile(tmp_path / "fonts" / "family.zip", "w") as zf:
+        zf.writestr("family/Regular.ttf", b"zip regular")
+        zf.writestr("family/Bold.otf", b"zip bold")
+        zf.writestr("family/OFL.txt", b"licence")
+    with tarfile.open(tmp_path / "fonts" / "more.tar.gz", "w:gz") as tf:
+        for name, data in [("more/Regular.ttf", b"tar regular"), ("more/Italic.TTF", b"tar italic")]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return tmp_path / "fonts"
+
+
+def test_scans_loose_fonts_and_archives(tmp_path):
+    source = LocalFontSource([_font_dir(tmp_path)], scan_workers=2)
+    fonts = source.fetch_font_list()
+    contents = {m.name: source.read_font(m) for m in fonts}
+    source.close()
+    assert contents == {
+        "Loose": b"loose",
+        "Bold": b"zip bold",
+        "Regular": b"zip regular",
+        "Italic": b"tar italic",
+        "Regular_2": b"tar regular",
+    }
+    assert len({m.url for m in fonts}) == len(fonts)
+    # Listing again gives the same names and URLs, so a rerun recognises committed fonts
+    assert LocalFontSource([tmp_path / "fonts"]).fetch_font_list() == fonts
+
+
+def test_names_avoid_committed_fonts(tmp_path):
+    journal = ScrapeJournal(tmp_path / "journal.jsonl")
+    journal.record("hash", "Regular", "https://fonts.example/Regular.ttf")
+    journal.record("other", "Bold", "https://fonts.example/Bold.ttf", status="near_duplicate")
+    journal.close()
+    journal = ScrapeJournal(tmp_path / "journal.jsonl")
+    journal.load()
+    assert journal.names == {"Regular"}  # Skipped fonts left no glyphs behind
+
+    fonts = [FontMetadata(name, f"file:///{i}", "local", "") for i, name in enumerate(["Regular", "Bold", "Regular"])]
+    assert [m.name for m in unique_names(fonts, set(journal.names))] == ["Regular_2", "Bold", "Regular_3"]